@@ -0,0 +1,168 @@
+"""
+汇总统计 - 合并过程中按分组字段累计数值字段，生成汇总表
+"""
+from datetime import date, datetime
+
+from result_table import ResultTable
+
+
+# 支持的统计方式及汇总表中的列名后缀
+AGGREGATE_FUNCS = {
+    "sum": "合计",
+    "count": "计数",
+    "min": "最小",
+    "max": "最大",
+}
+
+# 分组字段可以按日期截取的周期及汇总表中的列名后缀
+PERIODS = {
+    "month": "月",
+    "year": "年",
+}
+
+
+class Aggregator:
+    """
+    单次遍历的分组汇总
+    
+    合并时每写出一行调用一次 add()，只为每个分组保存累计值，
+    不保留明细行，结束后由 to_table() 生成汇总表。
+    
+    配置格式（预设中的 "aggregation"）：
+        {
+            "group_by": ["供应商名称", {"field": "日期", "period": "month"}],
+            "values": [{"field": "结算金额", "funcs": ["sum", "count", "min", "max"]}]
+        }
+    group_by 的字段可以是字符串，也可以用 period 按月（"month"）或年（"year"）
+    分组；values 中 funcs 省略时只求和。无法转换为数字的值不参与统计。
+    """
+    
+    def __init__(self, config):
+        self.group_fields = []
+        for item in config.get("group_by", []):
+            if isinstance(item, str):
+                item = {"field": item}
+            period = item.get("period")
+            if period is not None and period not in PERIODS:
+                raise ValueError(f"未知的分组周期: {period}")
+            self.group_fields.append((item["field"], period))
+        
+        self.value_fields = []
+        for item in config.get("values", []):
+            funcs = item.get("funcs") or ["sum"]
+            for func in funcs:
+                if func not in AGGREGATE_FUNCS:
+                    raise ValueError(f"未知的统计方式: {func}")
+            self.value_fields.append((item["field"], list(funcs)))
+        
+        if not self.group_fields and not self.value_fields:
+            raise ValueError("汇总配置中没有分组字段或统计字段")
+        
+        # {分组键: [行数, [每个统计字段的 (合计, 计数, 最小, 最大)]]}
+        self.groups = {}
+    
+    def _group_value(self, value, period):
+        """分组字段的值，按周期截取日期"""
+        if period is None or value is None:
+            return value
+        if isinstance(value, (datetime, date)):
+            text = value.strftime("%Y-%m-%d")
+        else:
+            text = str(value)
+        # 日期在提取结果中为 "YYYY-MM-DD" 字符串
+        return text[:7] if period == "month" else text[:4]
+    
+    def _to_number(self, value):
+        """转换为数字，无法转换时返回None"""
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return float(str(value).replace(",", ""))
+        except ValueError:
+            return None
+    
+    def add(self, data):
+        """
+        累计一行数据
+        
+        Args:
+            data: 提取结果（字典或 ResultRow）
+        """
+        key = tuple(
+            self._group_value(data.get(field), period)
+            for field, period in self.group_fields
+        )
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = [0, [[0, 0, None, None] for _ in self.value_fields]]
+        group[0] += 1
+        
+        for stats, (field, _) in zip(group[1], self.value_fields):
+            number = self._to_number(data.get(field))
+            if number is None:
+                continue
+            stats[0] += number
+            stats[1] += 1
+            if stats[2] is None or number < stats[2]:
+                stats[2] = number
+            if stats[3] is None or number > stats[3]:
+                stats[3] = number
+    
+    def headers(self):
+        """汇总表表头：分组字段、文件数、各统计列"""
+        headers = []
+        for field, period in self.group_fields:
+            headers.append(f"{field}（{PERIODS[period]}）" if period else field)
+        headers.append("文件数")
+        for field, funcs in self.value_fields:
+            headers.extend(f"{field}{AGGREGATE_FUNCS[func]}" for func in funcs)
+        return headers
+    
+    def _stat_values(self, count, all_stats):
+        """按配置顺序排列一个分组的统计值"""
+        values = [count]
+        for stats, (_, funcs) in zip(all_stats, self.value_fields):
+            total, counted, minimum, maximum = stats
+            by_func = {
+                "sum": total if counted else None,
+                "count": counted,
+                "min": minimum,
+                "max": maximum,
+            }
+            values.extend(by_func[func] for func in funcs)
+        return values
+    
+    def to_table(self):
+        """
+        生成汇总表
+        
+        分组按分组值排序（空值排在最后），有分组字段时末尾附加一行总计。
+        
+        Returns:
+            ResultTable
+        """
+        table = ResultTable(self.headers())
+        
+        def sort_key(key):
+            return [(value is None, str(value) if value is not None else "") for value in key]
+        
+        total_count = 0
+        totals = [[0, 0, None, None] for _ in self.value_fields]
+        for key in sorted(self.groups, key=sort_key):
+            count, all_stats = self.groups[key]
+            table.append(list(key) + self._stat_values(count, all_stats))
+            
+            total_count += count
+            for total, stats in zip(totals, all_stats):
+                total[0] += stats[0]
+                total[1] += stats[1]
+                for idx, pick in ((2, min), (3, max)):
+                    if stats[idx] is not None:
+                        total[idx] = stats[idx] if total[idx] is None else pick(total[idx], stats[idx])
+        
+        if self.group_fields and self.groups:
+            label = ["总计"] + [None] * (len(self.group_fields) - 1)
+            table.append(label + self._stat_values(total_count, totals))
+        return table
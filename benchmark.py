@@ -0,0 +1,463 @@
+"""
+性能基准测试 - 生成模拟账单并测量提取和合并各阶段的耗时
+
+用法示例：
+    python benchmark.py --scales 100 1000 --engines standard xml
+    python benchmark.py --scales 10000 --unique 50 --output 结果.json
+    python benchmark.py --compare 旧结果.json 新结果.json
+
+生成的账单仿照 Audi 报价单的结构：表头信息区、项目明细区、"折后总计"
+合计行，可以调整明细行数、共享字符串比例、格式膨胀行数和关键词位置。
+结果保存为JSON，便于在不同提交之间对比。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from queue import Empty
+
+import openpyxl
+from openpyxl.styles import Font, PatternFill
+
+from compiled_preset import CompiledPreset
+from excel_processor import ENGINES, ExcelProcessor, XlsxResultWriter, XlsxSheetReader
+
+
+# 与生成的账单结构对应的映射配置
+BENCH_MAPPINGS = [
+    {"name": "合同号", "cell": "C2"},
+    {"name": "供应商", "cell": "B5"},
+    {"name": "底盘号", "cell": "B8"},
+    {"name": "提交时间", "cell": "B10"},
+    {"name": "工单流水号", "cell": "D12"},
+]
+BENCH_SEARCH_COLUMN = "D"
+BENCH_SEARCH_KEYWORD = "折后总计"
+
+
+def generate_bill(file_path, rows=20, shared_ratio=0.5, bloat_rows=0,
+                  keyword_position=1.0, seed=0):
+    """
+    生成一个模拟报价单
+    
+    Args:
+        file_path: 输出路径
+        rows: 项目明细行数
+        shared_ratio: 明细文本取自固定词表的比例（越高共享字符串越少）
+        bloat_rows: 合计行之后只有格式、没有值的行数（模拟虚增的 max_row）
+        keyword_position: "折后总计" 在明细中的相对位置，0 为明细开头，1 为末尾
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Sheet1"
+    
+    ws["A1"] = "测试车备用及保养零件请购及收货明细单"
+    ws["A2"] = "合同号"
+    ws["C2"] = f"PO{7300000000 + seed}"
+    ws["A3"] = f"TaskID: {seed:010X}"
+    ws["A4"] = "项目请购流水号："
+    ws["D4"] = "买方："
+    ws["E4"] = "奥迪（中国）企业管理有限公司"
+    ws["A5"] = "供应商名称："
+    ws["B5"] = rng.choice(["北京华阳奥通汽车销售有限公司", "上海永达奥迪", "广州骏佳奥迪"])
+    ws["A8"] = "底盘号参考："
+    ws["B8"] = f"LFV3B2FY2M{seed:07d}"
+    ws["A10"] = "需求提交时间"
+    ws["B10"] = datetime(2025, 1 + seed % 12, 1 + seed % 28, 14, 11, 21)
+    ws["C12"] = "工单流水号"
+    ws["D12"] = f"WST_{seed:06d}"
+    
+    header_row = 14
+    headers = ["项目明细", "工时服务费（税后）", "材料费（税后）", "合计", "折后合计"]
+    for col_idx, header in enumerate(headers, start=1):
+        ws.cell(row=header_row, column=col_idx, value=header)
+    
+    vocabulary = [f"配件{i:03d}" for i in range(50)]
+    keyword_index = min(rows, max(0, int(round(keyword_position * rows))))
+    total = 0.0
+    current_row = header_row + 1
+    for item_idx in range(rows + 1):
+        if item_idx == keyword_index:
+            ws.cell(row=current_row, column=4, value=BENCH_SEARCH_KEYWORD)
+            ws.cell(row=current_row, column=5, value=round(total * 0.79, 2))
+            current_row += 1
+            if item_idx == rows:
+                break
+        if item_idx == rows:
+            break
+        if rng.random() < shared_ratio:
+            name = rng.choice(vocabulary)
+        else:
+            name = f"配件 {seed}-{item_idx}-{rng.randrange(10 ** 6)}"
+        labor = round(rng.uniform(0, 500), 2)
+        material = round(rng.uniform(0, 2000), 2)
+        ws.cell(row=current_row, column=1, value=name)
+        ws.cell(row=current_row, column=2, value=labor)
+        ws.cell(row=current_row, column=3, value=material)
+        ws.cell(row=current_row, column=4, value=labor + material)
+        ws.cell(row=current_row, column=5, value=round((labor + material) * 0.79, 2))
+        total += labor + material
+        current_row += 1
+    
+    # 只有格式的空行，很多导出文件的 max_row 因此远大于实际内容
+    bold = Font(bold=True)
+    fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
+    for row_idx in range(current_row, current_row + bloat_rows):
+        cell = ws.cell(row=row_idx, column=1)
+        cell.font = bold
+        cell.fill = fill
+    
+    wb.save(file_path)
+    wb.close()
+
+
+def generate_dataset(directory, count, unique=None, **bill_options):
+    """
+    生成一批模拟账单
+    
+    为了在大规模下快速生成，只生成 unique 个不同的文件，其余文件为它们的副本
+    （副本内容相同，测试时不要开启去重）。
+    
+    Args:
+        directory: 输出目录
+        count: 文件总数
+        unique: 不同内容的文件数，默认与 count 相同
+        bill_options: 传给 generate_bill 的参数
+    
+    Returns:
+        文件路径列表
+    """
+    os.makedirs(directory, exist_ok=True)
+    unique = min(count, unique or count)
+    templates = []
+    for idx in range(unique):
+        path = os.path.join(directory, f"bill_{idx:06d}.xlsx")
+        generate_bill(path, seed=idx, **bill_options)
+        templates.append(path)
+    
+    files = list(templates)
+    for idx in range(unique, count):
+        path = os.path.join(directory, f"bill_{idx:06d}.xlsx")
+        shutil.copyfile(templates[idx % unique], path)
+        files.append(path)
+    return files
+
+
+def peak_rss_mb(children=False):
+    """
+    当前进程的峰值内存（MB），无法获取时返回None
+    
+    Args:
+        children: 改为返回已结束的子进程（如并行合并的进程池）中单个进程
+            的最大峰值内存；只有提供 resource 模块的系统（Linux/macOS）支持
+    """
+    try:
+        import resource
+        who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+        peak = resource.getrusage(who).ru_maxrss
+        # macOS 单位为字节，Linux 为KB
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    if children:
+        return None
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def _time_stages(processor, file_path, engine):
+    """
+    分阶段测量单个文件：打开、读取映射单元格、搜索关键词
+    
+    各阶段分别计时，流式引擎的映射读取和关键词搜索在此处分两次遍历，
+    实际提取时两者在同一次遍历中完成。
+    """
+    sheet = CompiledPreset.compile(
+        BENCH_MAPPINGS, BENCH_SEARCH_COLUMN, BENCH_SEARCH_KEYWORD
+    ).sheets[0]
+    targets, searches, max_col = sheet.rows, sheet.searches, sheet.max_col
+    
+    if engine == "xml":
+        start = time.perf_counter()
+        reader = XlsxSheetReader(file_path)
+        opened = time.perf_counter()
+        processor._scan_rows(reader.iter_rows(max_col=max_col), targets, [])
+        mapped = time.perf_counter()
+        processor._scan_rows(reader.iter_rows(max_col=max_col), {}, searches)
+        scanned = time.perf_counter()
+        reader.close()
+    else:
+        start = time.perf_counter()
+        wb = processor.load_workbook(file_path, engine)
+        ws = wb.active
+        opened = time.perf_counter()
+        if engine == "standard":
+            for mapping in BENCH_MAPPINGS:
+                ws[mapping["cell"]].value
+            mapped = time.perf_counter()
+            processor.find_settlement_amount(ws, BENCH_SEARCH_COLUMN, BENCH_SEARCH_KEYWORD)
+        else:
+            processor._scan_rows(
+                ws.iter_rows(max_col=max_col, values_only=True), targets, []
+            )
+            mapped = time.perf_counter()
+            processor._scan_rows(
+                ws.iter_rows(max_col=max_col, values_only=True), {}, searches
+            )
+        scanned = time.perf_counter()
+        wb.close()
+    
+    return opened - start, mapped - opened, scanned - mapped
+
+
+def run_case(files, engine, workers, output_dir, stage_sample=50):
+    """
+    在当前进程中运行一个测试用例
+    
+    Returns:
+        测试结果字典
+    """
+    processor = ExcelProcessor()
+    case = {
+        "file_count": len(files),
+        "engine": engine,
+        "workers": workers,
+    }
+    
+    # 分阶段计时（抽样）
+    sample = files[:stage_sample]
+    totals = [0.0, 0.0, 0.0]
+    for file_path in sample:
+        for idx, seconds in enumerate(_time_stages(processor, file_path, engine)):
+            totals[idx] += seconds
+    case["stage_ms_per_file"] = {
+        "open": round(totals[0] / len(sample) * 1000, 3),
+        "mapped_cells": round(totals[1] / len(sample) * 1000, 3),
+        "keyword_scan": round(totals[2] / len(sample) * 1000, 3),
+    }
+    
+    # extract_data_from_file 单文件端到端
+    start = time.perf_counter()
+    for file_path in sample:
+        processor.extract_data_from_file(
+            file_path, BENCH_MAPPINGS, BENCH_SEARCH_COLUMN, BENCH_SEARCH_KEYWORD,
+            engine=engine
+        )
+    case["extract_ms_per_file"] = round(
+        (time.perf_counter() - start) / len(sample) * 1000, 3
+    )
+    
+    # merge_bills 整体
+    output_file = os.path.join(output_dir, f"merged_{engine}_{workers}_{len(files)}.xlsx")
+    start = time.perf_counter()
+    result = processor.merge_bills(
+        files, BENCH_MAPPINGS, output_file,
+        BENCH_SEARCH_COLUMN, BENCH_SEARCH_KEYWORD,
+        parallel=workers > 1, workers=workers, engine=engine
+    )
+    elapsed = time.perf_counter() - start
+    if not result["success"]:
+        raise RuntimeError(f"合并失败: {result['message']}")
+    if result["success_count"] != len(files):
+        raise RuntimeError(
+            f"合并结果不完整: {result['success_count']}/{len(files)} 个文件成功"
+        )
+    
+    # 单独测量写出阶段：把提取结果重新写一遍
+    table = result["data"]
+    start = time.perf_counter()
+    writer = XlsxResultWriter(output_file, table.headers)
+    for values in table.rows():
+        writer.write_row(values)
+    writer.close()
+    write_seconds = time.perf_counter() - start
+    
+    case["merge_seconds"] = round(elapsed, 3)
+    case["output_write_seconds"] = round(write_seconds, 3)
+    case["files_per_second"] = round(len(files) / elapsed, 2) if elapsed > 0 else None
+    case["success_count"] = result.get("success_count", 0)
+    case["error_count"] = result.get("error_count", 0)
+    case["peak_rss_mb"] = peak_rss_mb()
+    # 并行时提取在进程池中进行，主进程的峰值内存不包括提取占用的内存
+    case["worker_peak_rss_mb"] = peak_rss_mb(children=True) if workers > 1 else None
+    return case
+
+
+def _run_case_in_child(queue, args):
+    """
+    在独立子进程中运行用例，使峰值内存互不影响
+    
+    结果通过 queue 传回：("ok", 测试结果字典) 或 ("error", 错误信息)
+    """
+    try:
+        queue.put(("ok", run_case(*args)))
+    except Exception as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def run_case_isolated(context, args):
+    """
+    在新的子进程中运行用例并等待结果
+    
+    使用普通（非守护）进程：Pool 的工作进程是守护进程，不能再创建
+    并行合并所需的进程池。
+    
+    Raises:
+        RuntimeError: 用例失败或子进程异常退出
+    """
+    queue = context.Queue()
+    process = context.Process(target=_run_case_in_child, args=(queue, args))
+    process.start()
+    try:
+        # 先取结果再等待退出，避免子进程卡在写入队列上
+        while True:
+            alive = process.is_alive()
+            try:
+                status, value = queue.get(timeout=1)
+                break
+            except Empty:
+                # 等待前进程已经退出时，它写入的结果在这次等待中必然能取到
+                if not alive:
+                    raise RuntimeError(f"测试进程异常退出（退出码 {process.exitcode}）")
+    finally:
+        process.join()
+    if status != "ok":
+        raise RuntimeError(value)
+    return value
+
+
+def git_commit():
+    """当前提交的哈希，不在git仓库中时返回None"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(old_file, new_file):
+    """对比两次测试结果的 files/sec"""
+    with open(old_file, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_file, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    
+    def key(case):
+        return (case["file_count"], case["engine"], case["workers"])
+    
+    old_cases = {key(case): case for case in old["cases"]}
+    print(f"{'文件数':>8} {'引擎':>10} {'进程':>4} {'旧 files/s':>12} {'新 files/s':>12} {'变化':>8}")
+    for case in new["cases"]:
+        previous = old_cases.get(key(case))
+        if not previous or not previous.get("files_per_second"):
+            continue
+        change = case["files_per_second"] / previous["files_per_second"] - 1
+        print(
+            f"{case['file_count']:>8} {case['engine']:>10} {case['workers']:>4} "
+            f"{previous['files_per_second']:>12} {case['files_per_second']:>12} "
+            f"{change:>+8.1%}"
+        )
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="Excel账单合并性能基准测试")
+    parser.add_argument("--scales", type=int, nargs="+", default=[100],
+                        help="文件数量，如 100 1000 10000（默认: 100）")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES),
+                        help="要测试的读取引擎")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="并行进程数，可指定多个（默认: 1）")
+    parser.add_argument("--rows", type=int, default=20, help="每个账单的明细行数")
+    parser.add_argument("--shared-ratio", type=float, default=0.5,
+                        help="明细文本取自固定词表的比例")
+    parser.add_argument("--bloat-rows", type=int, default=0,
+                        help="合计行之后只有格式的空行数")
+    parser.add_argument("--keyword-position", type=float, default=1.0,
+                        help="关键词在明细中的相对位置（0~1）")
+    parser.add_argument("--unique", type=int, default=None,
+                        help="不同内容的文件数，其余为副本（加快大规模生成）")
+    parser.add_argument("--data-dir", default=None,
+                        help="生成账单的目录（默认使用临时目录，测试后删除）")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="结果JSON文件路径")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="对比两次测试结果，不运行测试")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    
+    data_root = args.data_dir or tempfile.mkdtemp(prefix="mergebill_bench_")
+    bill_options = {
+        "rows": args.rows,
+        "shared_ratio": args.shared_ratio,
+        "bloat_rows": args.bloat_rows,
+        "keyword_position": args.keyword_position,
+    }
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "bill_options": bill_options,
+        "cases": [],
+    }
+    
+    # spawn 保证每个用例都在干净的进程中运行，峰值内存互不影响
+    context = multiprocessing.get_context("spawn")
+    try:
+        for scale in args.scales:
+            directory = os.path.join(data_root, f"bills_{scale}")
+            print(f"生成 {scale} 个模拟账单...", file=sys.stderr)
+            start = time.perf_counter()
+            files = generate_dataset(directory, scale, args.unique, **bill_options)
+            print(f"  生成耗时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            
+            for engine in args.engines:
+                for workers in args.workers:
+                    print(f"测试 engine={engine} workers={workers} files={scale}",
+                          file=sys.stderr)
+                    case = run_case_isolated(context, (files, engine, workers, data_root))
+                    report["cases"].append(case)
+                    message = (
+                        f"  {case['files_per_second']} files/s, "
+                        f"峰值内存 {case['peak_rss_mb']} MB"
+                    )
+                    if case["worker_peak_rss_mb"] is not None:
+                        message += f"，子进程峰值 {case['worker_peak_rss_mb']} MB"
+                    print(message, file=sys.stderr)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_root, ignore_errors=True)
+    
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+编译后的预设 - 合并开始前把映射和搜索项解析为行列坐标，每个文件不再重复解析
+"""
+from collections import namedtuple
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_from_string, range_boundaries
+
+from extraction_cache import preset_fingerprint
+
+
+# 按关键词定位的映射未指定 offset 时，取关键词右侧单元格的值
+DEFAULT_ANCHOR_OFFSET = (0, 1)
+
+
+def normalize_anchor(text):
+    """定位关键词和单元格文字的比较形式：去掉首尾空白和末尾的冒号"""
+    return str(text).strip().rstrip(":：").rstrip()
+
+
+class DetailBlock(namedtuple(
+        "DetailBlock", "name columns start_row end_row start end width")):
+    """
+    一个明细区块（如报价单中的配件/工时明细行）
+    
+    Attributes:
+        name: 区块名称，写入明细表的 "明细" 列
+        columns: ((明细表中的位置, 列序号), ...)
+        start_row: 从第几行开始（有 start 时从该行开始查找起始关键词）
+        end_row: 到第几行结束，None 表示不限
+        start: (列序号, 关键词)，关键词所在行之后为明细行；None 表示从 start_row 开始
+        end: (列序号, 关键词)，关键词所在行之前为明细行；None 表示到 end_row 或表尾
+        width: 明细表的列数（不含文件名和区块名称）
+    """
+    
+    __slots__ = ()
+    
+    @classmethod
+    def compile(cls, config, positions):
+        """
+        编译预设中的一个明细区块配置
+        
+        Args:
+            config: {"name", "range", "start", "end", "columns", "sheet"}，见 CompiledPreset
+            positions: {明细列名: 在明细表中的位置}，遇到新列名时追加
+        
+        Raises:
+            ValueError: 配置无效
+        """
+        name = config.get("name") or "明细"
+        min_col = max_col = None
+        start_row, end_row = 1, None
+        if config.get("range"):
+            try:
+                min_col, min_row, max_col, max_row = range_boundaries(
+                    str(config["range"]).upper()
+                )
+            except ValueError:
+                raise ValueError(f"明细 {name} 的范围无效: {config['range']}")
+            start_row = min_row or 1
+            end_row = max_row
+        
+        def keyword(key):
+            item = config.get(key)
+            if not item:
+                return None
+            try:
+                return (column_index_from_string(str(item["column"]).upper()), item["keyword"])
+            except (KeyError, ValueError):
+                raise ValueError(f"明细 {name} 的 {key} 需要有效的 column 和 keyword")
+        
+        start, end = keyword("start"), keyword("end")
+        if start is None and not config.get("range"):
+            raise ValueError(f"明细 {name} 需要指定 range 或 start")
+        
+        if config.get("columns"):
+            named = []
+            for item in config["columns"]:
+                try:
+                    col_idx = column_index_from_string(str(item["column"]).upper())
+                    named.append((item["name"], col_idx))
+                except (KeyError, ValueError):
+                    raise ValueError(f"明细 {name} 的列配置无效: {item}")
+        elif min_col is not None:
+            # 只给出单元格范围时，以列字母作为列名
+            named = [(get_column_letter(col), col) for col in range(min_col, max_col + 1)]
+        else:
+            raise ValueError(f"明细 {name} 需要指定 columns 或带列的 range")
+        
+        columns = tuple(
+            (positions.setdefault(col_name, len(positions)), col) for col_name, col in named
+        )
+        return cls(name, columns, start_row, end_row, start, end, None)
+    
+    def max_col(self):
+        """需要读取的最大列"""
+        cols = [col for _, col in self.columns]
+        cols += [item[0] for item in (self.start, self.end) if item is not None]
+        return max(cols)
+
+
+class SheetPlan(namedtuple(
+        "SheetPlan",
+        "sheet targets rows searches max_col last_row blocks anchors lookback")):
+    """
+    一个工作表上要读取的映射单元格和要搜索的关键词
+    
+    Attributes:
+        sheet: 预设中指定的工作表（None 为活动工作表，整数为从1开始的序号，
+            字符串为名称），打开文件后再解析为实际的工作表
+        targets: {(行, 列): (映射名称, ...)}
+        rows: {行: ((列, (映射名称, ...)), ...)}，按行号升序，流式读取时
+            每行只查看该行的目标列
+        searches: ((搜索项名称, 列序号, 关键词), ...)
+        max_col: 需要读取的最大列（包括关键词右侧的值所在列）；有按关键词
+            定位的映射时为None（关键词可能在任意列）
+        last_row: 最后一个映射单元格所在行，之后只需继续搜索关键词
+        blocks: 该工作表上的 DetailBlock 元组，与映射和搜索在同一次遍历中读取
+        anchors: 按关键词定位的映射 {关键词: ((行偏移, 列偏移, (映射名称, ...)), ...)}，
+            关键词已经过 normalize_anchor，遍历时每个文字单元格查一次字典
+        lookback: 最大的向上行偏移，遍历时保留最近这么多行
+    """
+    
+    __slots__ = ()
+    
+    @classmethod
+    def build(cls, sheet, targets, searches, blocks=(), anchors=()):
+        """
+        由坐标字典、搜索项、明细区块和按关键词定位的映射生成，
+        计算按行分组的目标和读取范围
+        
+        Args:
+            anchors: [(关键词, 行偏移, 列偏移, 映射名称), ...]
+        """
+        rows = {}
+        for (row, col), names in sorted(targets.items()):
+            rows.setdefault(row, []).append((col, names))
+        rows = {row: tuple(cols) for row, cols in rows.items()}
+        
+        grouped = {}
+        for label, row_offset, col_offset, name in anchors:
+            offsets = grouped.setdefault(normalize_anchor(label), {})
+            key = (row_offset, col_offset)
+            offsets[key] = offsets.get(key, ()) + (name,)
+        anchor_index = {
+            label: tuple((dr, dc, names) for (dr, dc), names in offsets.items())
+            for label, offsets in grouped.items()
+        }
+        lookback = max([-dr for _, dr, _, _ in anchors if dr < 0], default=0)
+        
+        max_col = None
+        if not anchor_index:
+            max_col = max(
+                [col for _, col in targets] + [col + 1 for _, col, _ in searches]
+                + [block.max_col() for block in blocks],
+                default=1
+            )
+        return cls(
+            sheet, targets, rows, tuple(searches), max_col, max(rows, default=0),
+            tuple(blocks), anchor_index, lookback
+        )
+    
+    def anchor_items(self):
+        """按关键词定位的映射，格式同 build 的 anchors 参数"""
+        return [
+            (label, dr, dc, name)
+            for label, entries in self.anchors.items()
+            for dr, dc, names in entries
+            for name in names
+        ]
+    
+    def merge(self, other):
+        """合并指向同一个工作表的两组计划（如活动工作表同时按名称被引用）"""
+        targets = dict(self.targets)
+        for key, names in other.targets.items():
+            targets[key] = targets.get(key, ()) + names
+        return SheetPlan.build(
+            self.sheet, targets, self.searches + other.searches,
+            self.blocks + other.blocks, self.anchor_items() + other.anchor_items()
+        )
+
+
+class CompiledPreset(namedtuple(
+        "CompiledPreset",
+        "name mapping_names search_names headers sheets fingerprint detail_headers "
+        "report_missing_sheets", defaults=(True,))):
+    """
+    编译后的只读预设
+    
+    单元格引用在编译时解析为 (行, 列)，搜索列转换为列序号，并按工作表
+    分组；输出表头和缓存指纹也只计算一次。每次合并编译一次，随后传给
+    全部提取进程。
+    
+    Attributes:
+        name: 预设名称
+        mapping_names: 映射名称（按配置顺序）
+        search_names: 搜索项名称，第一个为 "结算金额"
+        headers: 合并结果表头（文件名、映射、结算金额、额外搜索项）
+        sheets: SheetPlan 元组，每个指定的工作表一项
+        fingerprint: 预设指纹，见 extraction_cache.preset_fingerprint
+        detail_headers: 明细表的列名（全部明细区块的列合并），没有明细区块时为空
+        report_missing_sheets: 文件中没有指定的工作表时是否提示，默认为True
+            （识别预设时锚点所在的工作表不存在是正常情况，不提示）
+    
+    映射可以不写固定的单元格，而是按关键词定位，例如：
+        {"name": "合同号", "anchor": "合同号", "offset": [0, 1]}
+    取文字为 "合同号"（忽略首尾空白和末尾冒号）的第一个单元格向下 0 行、
+    向右 1 列的值；offset 可以为负数，默认为 [0, 1]。插入行列后仍能找到。
+    全部按关键词定位的映射与其他映射、搜索项在同一次遍历中读取。
+    
+    明细区块（预设中的 "details"）从每个文件中读取多行，例如：
+        {"name": "配件", "start": {"column": "A", "keyword": "序号"},
+         "end": {"column": "D", "keyword": "折后总计"},
+         "columns": [{"name": "零件号", "column": "B"}, {"name": "金额", "column": "F"}]}
+    start/end 关键词所在行之间的行为明细行；也可以用 "range" 给出固定范围，
+    如 "A15:F40"（未指定 columns 时以列字母为列名）或 "15:40"。
+    所选列全部为空的行会被跳过。
+    """
+    
+    __slots__ = ()
+    
+    @classmethod
+    def compile(cls, mappings, search_column="D", search_keyword="折后总计",
+                extra_searches=None, search_sheet=None, details=None, name=None):
+        """
+        编译映射和搜索配置
+        
+        无法解析的单元格引用只在编译时提示一次，对应映射的提取结果为None。
+        
+        Raises:
+            ValueError: 搜索项的列或明细区块配置无效
+        """
+        searches = [{
+            "name": "结算金额",
+            "column": search_column,
+            "keyword": search_keyword,
+            "sheet": search_sheet
+        }]
+        searches.extend(extra_searches or [])
+        
+        # {工作表: [坐标字典, 搜索项列表, 明细区块列表, 按关键词定位的映射列表]}，
+        # 保持首次出现的顺序
+        by_sheet = {}
+        
+        def sheet_entry(sheet):
+            if sheet == "":
+                sheet = None
+            return by_sheet.setdefault(sheet, [{}, [], [], []])
+        
+        for mapping in mappings:
+            if mapping.get("anchor"):
+                offset = mapping.get("offset", DEFAULT_ANCHOR_OFFSET)
+                try:
+                    row_offset, col_offset = (int(value) for value in offset)
+                except (TypeError, ValueError):
+                    print(f"映射 {mapping['name']} 的偏移 {offset} 无效，应为 [行偏移, 列偏移]")
+                    continue
+                sheet_entry(mapping.get("sheet"))[3].append(
+                    (mapping["anchor"], row_offset, col_offset, mapping['name'])
+                )
+                continue
+            
+            cell_ref = str(mapping['cell']).upper()
+            try:
+                col_letter, row = coordinate_from_string(cell_ref)
+                key = (row, column_index_from_string(col_letter))
+            except Exception as e:
+                print(f"映射 {mapping['name']} 的单元格 {cell_ref} 无效: {e}")
+                continue
+            targets = sheet_entry(mapping.get("sheet"))[0]
+            targets[key] = targets.get(key, ()) + (mapping['name'],)
+        
+        for search in searches:
+            column = str(search["column"]).upper()
+            try:
+                col_idx = column_index_from_string(column)
+            except ValueError:
+                raise ValueError(f"搜索项 {search['name']} 的列无效: {search['column']}")
+            sheet_entry(search.get("sheet"))[1].append(
+                (search["name"], col_idx, search["keyword"])
+            )
+        
+        positions = {}
+        blocks = []
+        for config in details or []:
+            blocks.append((config.get("sheet"), DetailBlock.compile(config, positions)))
+        for sheet, block in blocks:
+            # 全部区块编译完成后才知道明细表的总列数
+            sheet_entry(sheet)[2].append(block._replace(width=len(positions)))
+        
+        sheets = tuple(
+            SheetPlan.build(sheet, targets, sheet_searches, sheet_blocks, sheet_anchors)
+            for sheet, (targets, sheet_searches, sheet_blocks, sheet_anchors)
+            in by_sheet.items()
+        )
+        mapping_names = tuple(m['name'] for m in mappings)
+        search_names = tuple(s["name"] for s in searches)
+        return cls(
+            name,
+            mapping_names,
+            search_names,
+            ("文件名",) + mapping_names + search_names,
+            sheets,
+            preset_fingerprint(
+                mappings, search_column, search_keyword, extra_searches, search_sheet,
+                details
+            ),
+            tuple(positions)
+        )
+    
+    @classmethod
+    def from_preset(cls, preset, name=None):
+        """由配置文件中的预设字典编译"""
+        return cls.compile(
+            preset.get("mappings", []),
+            preset.get("settlement_search_column", "D"),
+            preset.get("settlement_search_keyword", "折后总计"),
+            preset.get("extra_searches", []),
+            preset.get("settlement_search_sheet"),
+            preset.get("details"),
+            name=name if name is not None else preset.get("name")
+        )
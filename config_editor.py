@@ -1,10 +1,26 @@
 """
 配置编辑器 - 用于管理预设和映射配置的界面
 """
+import copy
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
 
+from openpyxl.utils import get_column_letter
+
+from compiled_preset import DEFAULT_ANCHOR_OFFSET
+
+
+def parse_sheet(text):
+    """
+    工作表输入框中的值：全部为数字时为第几个工作表（整数，从1开始），
+    其他为工作表名称，空为活动工作表（空字符串）
+    """
+    text = text.strip()
+    if text.isdecimal() and int(text) > 0:
+        return int(text)
+    return text
+
 
 class ConfigEditor:
     def __init__(self, parent, config_manager):
@@ -23,7 +39,7 @@ class ConfigEditor:
         
         self.current_preset = None
         self.setup_ui()
-        
+    
     def setup_ui(self):
         """设置用户界面"""
         # 主框架
@@ -110,11 +126,16 @@ class ConfigEditor:
         self.search_keyword_entry.grid(row=3, column=1, sticky=tk.W, pady=2, padx=5)
         ttk.Label(info_frame, text="如: 折后总计", foreground="gray").grid(row=3, column=2, sticky=tk.W, pady=2)
         
+        ttk.Label(info_frame, text="结算金额工作表：").grid(row=4, column=0, sticky=tk.W, pady=2)
+        self.search_sheet_entry = ttk.Entry(info_frame, width=20, font=("微软雅黑", 9))
+        self.search_sheet_entry.grid(row=4, column=1, sticky=tk.W, pady=2, padx=5)
+        ttk.Label(info_frame, text="名称或序号（如 2），留空为活动工作表", foreground="gray").grid(row=4, column=2, sticky=tk.W, pady=2)
+        
         ttk.Button(
             info_frame,
             text="保存配置",
             command=self.save_preset_info
-        ).grid(row=4, column=1, pady=10, sticky=tk.W)
+        ).grid(row=5, column=1, pady=10, sticky=tk.W)
         
         info_frame.columnconfigure(1, weight=1)
         
@@ -171,7 +192,7 @@ class ConfigEditor:
         
         self.mapping_tree = ttk.Treeview(
             tree_frame,
-            columns=("name", "cell", "description"),
+            columns=("name", "cell", "sheet", "description"),
             show="headings",
             yscrollcommand=tree_scroll.set
         )
@@ -180,10 +201,12 @@ class ConfigEditor:
         
         self.mapping_tree.heading("name", text="项目名称")
         self.mapping_tree.heading("cell", text="单元格")
+        self.mapping_tree.heading("sheet", text="工作表")
         self.mapping_tree.heading("description", text="说明")
         
         self.mapping_tree.column("name", width=150)
         self.mapping_tree.column("cell", width=80)
+        self.mapping_tree.column("sheet", width=80)
         self.mapping_tree.column("description", width=200)
         
         # 双击编辑
@@ -242,15 +265,26 @@ class ConfigEditor:
         self.search_keyword_entry.delete(0, tk.END)
         self.search_keyword_entry.insert(0, preset.get("settlement_search_keyword", "折后总计"))
         
+        self.search_sheet_entry.delete(0, tk.END)
+        self.search_sheet_entry.insert(0, preset.get("settlement_search_sheet") or "")
+        
         # 加载映射
         self.mapping_tree.delete(*self.mapping_tree.get_children())
         for mapping in preset.get("mappings", []):
             self.mapping_tree.insert("", tk.END, values=(
                 mapping.get("name", ""),
-                mapping.get("cell", ""),
+                self.mapping_location(mapping),
+                mapping.get("sheet") or "",
                 mapping.get("description", "")
             ))
     
+    def mapping_location(self, mapping):
+        """映射列表中显示的位置：单元格，或定位关键词及偏移"""
+        if mapping.get("anchor"):
+            offset = mapping.get("offset", DEFAULT_ANCHOR_OFFSET)
+            return f"\"{mapping['anchor']}\" {offset[0]},{offset[1]}"
+        return mapping.get("cell", "")
+    
     def save_preset_info(self):
         """保存预设信息（说明和结算金额配置）"""
         if not self.current_preset:
@@ -259,6 +293,7 @@ class ConfigEditor:
         description = self.desc_text.get("1.0", tk.END).strip()
         search_column = self.search_column_entry.get().strip().upper()
         search_keyword = self.search_keyword_entry.get().strip()
+        search_sheet = parse_sheet(self.search_sheet_entry.get())
         
         # 验证搜索列格式
         if search_column and not search_column.isalpha():
@@ -269,12 +304,32 @@ class ConfigEditor:
             messagebox.showwarning("提示", "结算金额关键词不能为空！")
             return
         
-        self.config_manager.update_preset(
+        # 额外关键词搜索只能在 config.json 中编辑，保存时一并检查
+        preset = self.config_manager.get_preset(self.current_preset)
+        extra_searches = preset.get("extra_searches", [])
+        invalid = [
+            str(search.get("name", "")) if isinstance(search, dict) else str(search)
+            for search in extra_searches
+            if not self.config_manager.validate_search(search)
+        ]
+        if invalid:
+            messagebox.showwarning(
+                "提示",
+                "以下额外关键词搜索无效（需要名称、关键词和字母列），请在 config.json 中修改：\n"
+                + "\n".join(invalid)
+            )
+            return
+        
+        if not self.config_manager.update_preset(
             self.current_preset,
             description=description,
             settlement_search_column=search_column if search_column else "D",
-            settlement_search_keyword=search_keyword
-        )
+            settlement_search_keyword=search_keyword,
+            extra_searches=extra_searches,
+            settlement_search_sheet=search_sheet
+        ):
+            messagebox.showerror("错误", "保存配置失败！")
+            return
         messagebox.showinfo("成功", "配置已保存！")
     
     def new_preset(self):
@@ -357,7 +412,7 @@ class ConfigEditor:
         
         if dialog.result:
             preset = self.config_manager.get_preset(self.current_preset)
-            mappings = preset.get("mappings", [])
+            mappings = copy.deepcopy(preset.get("mappings", []))
             mappings.append(dialog.result)
             self.config_manager.update_preset(self.current_preset, mappings=mappings)
             self.load_preset(self.current_preset)
@@ -373,21 +428,14 @@ class ConfigEditor:
             return
         
         item = selection[0]
-        values = self.mapping_tree.item(item, "values")
-        
-        mapping = {
-            "name": values[0],
-            "cell": values[1],
-            "description": values[2]
-        }
+        idx = self.mapping_tree.index(item)
+        preset = self.config_manager.get_preset(self.current_preset)
+        mappings = copy.deepcopy(preset.get("mappings", []))
         
-        dialog = MappingDialog(self.window, "编辑映射", mapping)
+        dialog = MappingDialog(self.window, "编辑映射", mappings[idx])
         self.window.wait_window(dialog.window)
         
         if dialog.result:
-            preset = self.config_manager.get_preset(self.current_preset)
-            mappings = preset.get("mappings", [])
-            idx = self.mapping_tree.index(item)
             mappings[idx] = dialog.result
             self.config_manager.update_preset(self.current_preset, mappings=mappings)
             self.load_preset(self.current_preset)
@@ -407,7 +455,7 @@ class ConfigEditor:
             idx = self.mapping_tree.index(item)
             
             preset = self.config_manager.get_preset(self.current_preset)
-            mappings = preset.get("mappings", [])
+            mappings = copy.deepcopy(preset.get("mappings", []))
             del mappings[idx]
             self.config_manager.update_preset(self.current_preset, mappings=mappings)
             self.load_preset(self.current_preset)
@@ -428,7 +476,7 @@ class ConfigEditor:
             return
         
         preset = self.config_manager.get_preset(self.current_preset)
-        mappings = preset.get("mappings", [])
+        mappings = copy.deepcopy(preset.get("mappings", []))
         mappings[idx], mappings[idx - 1] = mappings[idx - 1], mappings[idx]
         self.config_manager.update_preset(self.current_preset, mappings=mappings)
         self.load_preset(self.current_preset)
@@ -450,7 +498,7 @@ class ConfigEditor:
         idx = self.mapping_tree.index(item)
         
         preset = self.config_manager.get_preset(self.current_preset)
-        mappings = preset.get("mappings", [])
+        mappings = copy.deepcopy(preset.get("mappings", []))
         
         if idx >= len(mappings) - 1:
             return
@@ -473,10 +521,12 @@ class ConfigEditor:
         if file_path:
             from excel_processor import ExcelProcessor
             processor = ExcelProcessor()
-            preview_data = processor.preview_file(file_path, max_rows=15, max_cols=10)
+            source = processor.open_preview(file_path)
             
-            if preview_data:
-                PreviewWindow(self.window, file_path, preview_data)
+            if source:
+                PreviewWindow(self.window, file_path, source)
+            else:
+                messagebox.showerror("错误", "无法读取该文件，请确认是有效的Excel文件")
 
 
 class PresetNameDialog:
@@ -533,7 +583,7 @@ class MappingDialog:
         
         self.window = tk.Toplevel(parent)
         self.window.title(title)
-        self.window.geometry("400x220")
+        self.window.geometry("420x340")
         self.window.transient(parent)
         self.window.grab_set()
         
@@ -558,9 +608,34 @@ class MappingDialog:
         self.cell_entry.pack(side=tk.LEFT)
         ttk.Label(cell_frame, text="例如: A1, B2, C10", foreground="gray").pack(side=tk.LEFT, padx=5)
         
-        ttk.Label(form_frame, text="说明：").grid(row=2, column=0, sticky=tk.W+tk.N, pady=5)
+        ttk.Label(form_frame, text="或按关键词定位：").grid(row=2, column=0, sticky=tk.W, pady=5)
+        anchor_frame = ttk.Frame(form_frame)
+        anchor_frame.grid(row=2, column=1, sticky=tk.W+tk.E, pady=5)
+        self.anchor_entry = ttk.Entry(anchor_frame, width=15)
+        self.anchor_entry.pack(side=tk.LEFT)
+        ttk.Label(anchor_frame, text="如: 合同号", foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(form_frame, text="偏移（行, 列）：").grid(row=3, column=0, sticky=tk.W, pady=5)
+        offset_frame = ttk.Frame(form_frame)
+        offset_frame.grid(row=3, column=1, sticky=tk.W+tk.E, pady=5)
+        self.row_offset_entry = ttk.Entry(offset_frame, width=5)
+        self.row_offset_entry.pack(side=tk.LEFT)
+        self.col_offset_entry = ttk.Entry(offset_frame, width=5)
+        self.col_offset_entry.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(
+            offset_frame, text="关键词向下/向右的格数，默认 0, 1", foreground="gray"
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(form_frame, text="工作表：").grid(row=4, column=0, sticky=tk.W, pady=5)
+        sheet_frame = ttk.Frame(form_frame)
+        sheet_frame.grid(row=4, column=1, sticky=tk.W+tk.E, pady=5)
+        self.sheet_entry = ttk.Entry(sheet_frame, width=15)
+        self.sheet_entry.pack(side=tk.LEFT)
+        ttk.Label(sheet_frame, text="名称或序号，留空为活动工作表", foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(form_frame, text="说明：").grid(row=5, column=0, sticky=tk.W+tk.N, pady=5)
         self.desc_text = tk.Text(form_frame, height=3, width=30)
-        self.desc_text.grid(row=2, column=1, sticky=tk.W+tk.E, pady=5)
+        self.desc_text.grid(row=5, column=1, sticky=tk.W+tk.E, pady=5)
         
         form_frame.columnconfigure(1, weight=1)
         
@@ -575,6 +650,12 @@ class MappingDialog:
         if mapping:
             self.name_entry.insert(0, mapping.get("name", ""))
             self.cell_entry.insert(0, mapping.get("cell", ""))
+            self.anchor_entry.insert(0, mapping.get("anchor", ""))
+            if mapping.get("anchor"):
+                row_offset, col_offset = mapping.get("offset", DEFAULT_ANCHOR_OFFSET)
+                self.row_offset_entry.insert(0, str(row_offset))
+                self.col_offset_entry.insert(0, str(col_offset))
+            self.sheet_entry.insert(0, mapping.get("sheet") or "")
             self.desc_text.insert("1.0", mapping.get("description", ""))
         
         self.name_entry.focus()
@@ -587,38 +668,73 @@ class MappingDialog:
         """确认"""
         name = self.name_entry.get().strip()
         cell = self.cell_entry.get().strip().upper()
+        anchor = self.anchor_entry.get().strip()
+        sheet = parse_sheet(self.sheet_entry.get())
         description = self.desc_text.get("1.0", tk.END).strip()
         
         if not name:
             messagebox.showwarning("提示", "项目名称不能为空！")
             return
         
-        if not cell:
-            messagebox.showwarning("提示", "单元格位置不能为空！")
-            return
-        
-        # 验证单元格格式
-        from config_manager import ConfigManager
-        cm = ConfigManager()
-        if not cm.validate_cell_reference(cell):
-            messagebox.showwarning("提示", "单元格格式不正确！请使用如 A1, B2 的格式。")
-            return
-        
-        self.result = {
-            "name": name,
-            "cell": cell,
-            "description": description
-        }
+        if anchor:
+            # 按关键词定位，不使用单元格位置
+            try:
+                offset = [
+                    int(self.row_offset_entry.get().strip() or DEFAULT_ANCHOR_OFFSET[0]),
+                    int(self.col_offset_entry.get().strip() or DEFAULT_ANCHOR_OFFSET[1])
+                ]
+            except ValueError:
+                messagebox.showwarning("提示", "偏移必须是整数！")
+                return
+            self.result = {
+                "name": name,
+                "anchor": anchor,
+                "offset": offset,
+                "description": description
+            }
+        else:
+            if not cell:
+                messagebox.showwarning("提示", "请填写单元格位置或定位关键词！")
+                return
+            
+            # 验证单元格格式
+            from config_manager import ConfigManager
+            cm = ConfigManager()
+            if not cm.validate_cell_reference(cell):
+                messagebox.showwarning("提示", "单元格格式不正确！请使用如 A1, B2 的格式。")
+                return
+            
+            self.result = {
+                "name": name,
+                "cell": cell,
+                "description": description
+            }
+        if sheet:
+            self.result["sheet"] = sheet
         self.window.destroy()
 
 
 class PreviewWindow:
-    """Excel预览窗口"""
-    def __init__(self, parent, file_path, data):
+    """
+    Excel预览窗口
+    
+    只绘制当前可见区域内的单元格，行数据由 PreviewSource 按需分块读取，
+    预览数万行的工作表也不会一次性创建大量控件。
+    """
+    CELL_WIDTH = 100
+    CELL_HEIGHT = 24
+    HEADER_WIDTH = 50
+    
+    def __init__(self, parent, file_path, source):
+        self.source = source
+        self.top_row = 1
+        self.left_col = 1
+        
         self.window = tk.Toplevel(parent)
         self.window.title(f"预览: {os.path.basename(file_path)}")
         self.window.geometry("800x500")
         self.window.transient(parent)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
         
         # 说明
         ttk.Label(
@@ -627,55 +743,6 @@ class PreviewWindow:
             foreground="blue"
         ).pack(pady=5)
         
-        # 创建表格
-        frame = ttk.Frame(self.window)
-        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        # 滚动条
-        v_scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL)
-        h_scroll = ttk.Scrollbar(frame, orient=tk.HORIZONTAL)
-        
-        # Canvas和Frame用于显示网格
-        canvas = tk.Canvas(frame, yscrollcommand=v_scroll.set, xscrollcommand=h_scroll.set)
-        v_scroll.config(command=canvas.yview)
-        h_scroll.config(command=canvas.xview)
-        
-        v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        h_scroll.pack(side=tk.BOTTOM, fill=tk.X)
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # 创建网格
-        grid_frame = ttk.Frame(canvas)
-        canvas.create_window((0, 0), window=grid_frame, anchor=tk.NW)
-        
-        # 显示数据
-        for row_idx, row_data in enumerate(data):
-            for col_idx, cell_value in enumerate(row_data):
-                from openpyxl.utils import get_column_letter
-                cell_ref = f"{get_column_letter(col_idx + 1)}{row_idx + 1}"
-                
-                cell_label = tk.Label(
-                    grid_frame,
-                    text=str(cell_value) if cell_value else "",
-                    borderwidth=1,
-                    relief=tk.SOLID,
-                    width=12,
-                    height=2,
-                    anchor=tk.W,
-                    padx=5
-                )
-                cell_label.grid(row=row_idx, column=col_idx, sticky=tk.W+tk.E)
-                
-                # 绑定点击事件
-                cell_label.bind(
-                    '<Button-1>',
-                    lambda e, ref=cell_ref, val=cell_value: self.on_cell_click(ref, val)
-                )
-        
-        # 更新滚动区域
-        grid_frame.update_idletasks()
-        canvas.config(scrollregion=canvas.bbox("all"))
-        
         # 底部信息栏
         self.info_label = ttk.Label(
             self.window,
@@ -684,10 +751,165 @@ class PreviewWindow:
             anchor=tk.W
         )
         self.info_label.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # 创建表格
+        frame = ttk.Frame(self.window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # 滚动条直接控制首行/首列，Canvas本身不滚动
+        self.v_scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.on_vscroll)
+        self.h_scroll = ttk.Scrollbar(frame, orient=tk.HORIZONTAL, command=self.on_hscroll)
+        self.canvas = tk.Canvas(frame, background="white", highlightthickness=0)
+        
+        self.v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.h_scroll.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # 绑定事件
+        self.canvas.bind('<Configure>', lambda e: self.redraw())
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.canvas.bind('<MouseWheel>', self.on_mousewheel)
+        self.canvas.bind('<Shift-MouseWheel>', self.on_shift_mousewheel)
+        self.canvas.bind('<Button-4>', lambda e: self.scroll_rows(-3))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll_rows(3))
+    
+    def visible_size(self):
+        """当前窗口可以显示的行数和列数"""
+        width = max(self.canvas.winfo_width() - self.HEADER_WIDTH, 1)
+        height = max(self.canvas.winfo_height() - self.CELL_HEIGHT, 1)
+        return height // self.CELL_HEIGHT + 1, width // self.CELL_WIDTH + 1
+    
+    def total_size(self):
+        """滚动范围内的总行数和总列数"""
+        rows, cols = self.visible_size()
+        total_rows = max(self.source.known_row_count(), 1)
+        total_cols = max(self.source.max_column, cols - 1, 1)
+        return total_rows, total_cols
+    
+    def redraw(self):
+        """重新绘制可见区域"""
+        canvas = self.canvas
+        canvas.delete("all")
+        rows, cols = self.visible_size()
+        data = self.source.get_rows(self.top_row, rows)
+        
+        # 读取可见行后总行数可能已确定，超出末尾时回退
+        total_rows, total_cols = self.total_size()
+        if self.top_row > total_rows and total_rows > 0:
+            self.top_row = max(total_rows - rows + 2, 1)
+            data = self.source.get_rows(self.top_row, rows)
+        
+        # 列标题
+        for i in range(cols):
+            x = self.HEADER_WIDTH + i * self.CELL_WIDTH
+            canvas.create_rectangle(
+                x, 0, x + self.CELL_WIDTH, self.CELL_HEIGHT,
+                fill="#E8E8E8", outline="#B0B0B0"
+            )
+            canvas.create_text(
+                x + self.CELL_WIDTH // 2, self.CELL_HEIGHT // 2,
+                text=get_column_letter(self.left_col + i)
+            )
+        
+        # 行号和单元格
+        for i in range(rows):
+            y = self.CELL_HEIGHT + i * self.CELL_HEIGHT
+            canvas.create_rectangle(
+                0, y, self.HEADER_WIDTH, y + self.CELL_HEIGHT,
+                fill="#E8E8E8", outline="#B0B0B0"
+            )
+            canvas.create_text(
+                self.HEADER_WIDTH // 2, y + self.CELL_HEIGHT // 2,
+                text=str(self.top_row + i)
+            )
+            
+            row_data = data[i] if i < len(data) else []
+            for j in range(cols):
+                x = self.HEADER_WIDTH + j * self.CELL_WIDTH
+                canvas.create_rectangle(
+                    x, y, x + self.CELL_WIDTH, y + self.CELL_HEIGHT,
+                    outline="#D0D0D0"
+                )
+                col_idx = self.left_col + j - 1
+                if col_idx < len(row_data) and row_data[col_idx] != "":
+                    canvas.create_text(
+                        x + 5, y + self.CELL_HEIGHT // 2,
+                        text=str(row_data[col_idx]),
+                        anchor=tk.W,
+                        width=self.CELL_WIDTH - 10
+                    )
+        
+        # 更新滚动条
+        self.v_scroll.set(
+            (self.top_row - 1) / total_rows,
+            min((self.top_row - 1 + rows) / total_rows, 1.0)
+        )
+        self.h_scroll.set(
+            (self.left_col - 1) / total_cols,
+            min((self.left_col - 1 + cols) / total_cols, 1.0)
+        )
+    
+    def scroll_rows(self, delta):
+        """向下（正数）或向上（负数）滚动若干行"""
+        self.top_row = max(self.top_row + delta, 1)
+        self.redraw()
+    
+    def scroll_cols(self, delta):
+        """向右（正数）或向左（负数）滚动若干列"""
+        self.left_col = max(self.left_col + delta, 1)
+        self.redraw()
+    
+    def _scroll(self, args, current, visible, total):
+        """将滚动条命令换算为新的首行/首列"""
+        if args[0] == "moveto":
+            return int(float(args[1]) * total) + 1
+        amount = int(args[1])
+        if args[2] == "pages":
+            amount *= max(visible - 1, 1)
+        return current + amount
+    
+    def on_vscroll(self, *args):
+        """垂直滚动条事件"""
+        rows, _ = self.visible_size()
+        total_rows, _ = self.total_size()
+        self.top_row = max(self._scroll(args, self.top_row, rows, total_rows), 1)
+        self.redraw()
+    
+    def on_hscroll(self, *args):
+        """水平滚动条事件"""
+        _, cols = self.visible_size()
+        _, total_cols = self.total_size()
+        self.left_col = max(self._scroll(args, self.left_col, cols, total_cols), 1)
+        self.redraw()
+    
+    def on_mousewheel(self, event):
+        """鼠标滚轮事件（Windows/macOS）"""
+        self.scroll_rows(-3 if event.delta > 0 else 3)
+    
+    def on_shift_mousewheel(self, event):
+        """Shift+滚轮水平滚动"""
+        self.scroll_cols(-1 if event.delta > 0 else 1)
+    
+    def on_click(self, event):
+        """根据点击位置计算单元格"""
+        if event.x < self.HEADER_WIDTH or event.y < self.CELL_HEIGHT:
+            return
+        row = self.top_row + (event.y - self.CELL_HEIGHT) // self.CELL_HEIGHT
+        col = self.left_col + (event.x - self.HEADER_WIDTH) // self.CELL_WIDTH
+        
+        data = self.source.get_rows(row, 1)
+        value = ""
+        if data and col - 1 < len(data[0]):
+            value = data[0][col - 1]
+        self.on_cell_click(f"{get_column_letter(col)}{row}", value)
     
     def on_cell_click(self, cell_ref, value):
         """单元格点击事件"""
         self.info_label.config(
-            text=f"单元格: {cell_ref}  |  值: {value if value else '(空)'}"
+            text=f"单元格: {cell_ref}  |  值: {value if value != '' else '(空)'}"
         )
-
+    
+    def close(self):
+        """关闭窗口并释放工作簿"""
+        self.source.close()
+        self.window.destroy()
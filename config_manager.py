@@ -1,16 +1,23 @@
 """
 配置管理器 - 负责预设配置的存储和管理
 """
+import copy
 import json
 import os
 from pathlib import Path
 
+from compiled_preset import CompiledPreset
+from extraction_cache import ExtractionCache, preset_fingerprint
+
 
 class ConfigManager:
-    def __init__(self, config_file="config.json"):
+    def __init__(self, config_file="config.json", cache_file="extraction_cache.db"):
         """初始化配置管理器"""
         self.config_file = config_file
+        self.cache_file = cache_file
         self.config = self.load_config()
+        # 上次保存（或加载）时各预设的指纹，保存时据此清理失效的缓存
+        self._saved_fingerprints = self._fingerprints()
     
     def load_config(self):
         """加载配置文件"""
@@ -55,14 +62,28 @@ class ConfigManager:
         }
     
     def save_config(self):
-        """保存配置到文件"""
+        """
+        保存配置到文件
+        
+        与上次保存时相比，不再被任何预设使用的指纹（提取规则被修改或
+        预设被删除）下的缓存随之清理；预设字典被直接修改后再保存也能发现。
+        """
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(self.config, f, ensure_ascii=False, indent=2)
-            return True
         except Exception as e:
             print(f"保存配置文件失败: {e}")
             return False
+        
+        fingerprints = self._fingerprints()
+        for fingerprint in set(self._saved_fingerprints.values()) - set(fingerprints.values()):
+            self.invalidate_cache(fingerprint)
+        self._saved_fingerprints = fingerprints
+        return True
+    
+    def _fingerprints(self):
+        """{预设名称: 指纹}"""
+        return {name: self.get_preset_fingerprint(name) for name in self.get_preset_names()}
     
     def get_preset_names(self):
         """获取所有预设名称列表"""
@@ -73,10 +94,15 @@ class ConfigManager:
         return self.config.get("presets", {}).get(preset_name)
     
     def add_preset(self, preset_name, description="", mappings=None, 
-                   settlement_search_column="D", settlement_search_keyword="折后总计"):
+                   settlement_search_column="D", settlement_search_keyword="折后总计",
+                   extra_searches=None, settlement_search_sheet=""):
         """添加新预设"""
         if mappings is None:
             mappings = []
+        if extra_searches is None:
+            extra_searches = []
+        if not self._check_searches(extra_searches):
+            return False
         
         if "presets" not in self.config:
             self.config["presets"] = {}
@@ -86,15 +112,20 @@ class ConfigManager:
             "description": description,
             "settlement_search_column": settlement_search_column,
             "settlement_search_keyword": settlement_search_keyword,
+            "settlement_search_sheet": settlement_search_sheet,
+            "extra_searches": extra_searches,
             "mappings": mappings
         }
         return self.save_config()
     
     def update_preset(self, preset_name, description=None, mappings=None,
-                     settlement_search_column=None, settlement_search_keyword=None):
+                     settlement_search_column=None, settlement_search_keyword=None,
+                     extra_searches=None, settlement_search_sheet=None):
         """更新预设配置"""
         if preset_name not in self.config.get("presets", {}):
             return False
+        if extra_searches is not None and not self._check_searches(extra_searches):
+            return False
         
         preset = self.config["presets"][preset_name]
         
@@ -110,6 +141,13 @@ class ConfigManager:
         if settlement_search_keyword is not None:
             preset["settlement_search_keyword"] = settlement_search_keyword
         
+        if extra_searches is not None:
+            preset["extra_searches"] = extra_searches
+        
+        if settlement_search_sheet is not None:
+            preset["settlement_search_sheet"] = settlement_search_sheet
+        
+        # 提取规则有变化时，旧规则下的缓存结果由 save_config 清理
         return self.save_config()
     
     def delete_preset(self, preset_name):
@@ -136,6 +174,12 @@ class ConfigManager:
             preset["name"] = new_name
             # 深拷贝mappings
             preset["mappings"] = [m.copy() for m in preset["mappings"]]
+            preset["extra_searches"] = [s.copy() for s in preset.get("extra_searches", [])]
+            for key in ("aggregation", "details"):
+                if key in preset:
+                    preset[key] = copy.deepcopy(preset[key])
+            # 识别条件相同的两个预设无法区分，副本不复制识别条件
+            preset.pop("match", None)
             # 确保有默认的结算配置
             if "settlement_search_column" not in preset:
                 preset["settlement_search_column"] = "D"
@@ -145,6 +189,94 @@ class ConfigManager:
             return self.save_config()
         return False
     
+    def get_preset_fingerprint(self, preset_name):
+        """获取预设提取规则的指纹（用于提取缓存）"""
+        preset = self.get_preset(preset_name)
+        if not preset:
+            return None
+        return preset_fingerprint(
+            preset.get("mappings", []),
+            preset.get("settlement_search_column", "D"),
+            preset.get("settlement_search_keyword", "折后总计"),
+            preset.get("extra_searches", []),
+            preset.get("settlement_search_sheet"),
+            preset.get("details")
+        )
+    
+    def compile_preset(self, preset_name):
+        """
+        编译预设（解析单元格引用和搜索列），每次合并编译一次
+        
+        Returns:
+            CompiledPreset，预设不存在时返回None
+        
+        Raises:
+            ValueError: 搜索项的列无效
+        """
+        preset = self.get_preset(preset_name)
+        if not preset:
+            return None
+        return CompiledPreset.from_preset(preset, name=preset_name)
+    
+    def get_routed_preset_names(self):
+        """配置了识别条件（match）、可以自动识别的预设名称列表"""
+        return [
+            name for name, preset in self.config.get("presets", {}).items()
+            if preset.get("match")
+        ]
+    
+    def create_router(self):
+        """
+        按全部配置了识别条件的预设创建 PresetRouter
+        
+        Raises:
+            ValueError: 没有可识别的预设，或识别条件无效
+        """
+        from preset_router import PresetRouter
+        return PresetRouter.from_presets(self.config.get("presets", {}))
+    
+    def open_cache(self):
+        """打开提取缓存"""
+        return ExtractionCache(self.cache_file)
+    
+    def invalidate_cache(self, fingerprint):
+        """删除指定预设指纹下的提取缓存"""
+        if not fingerprint or not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            cache = self.open_cache()
+            cache.invalidate_preset(fingerprint)
+            cache.close()
+        except Exception as e:
+            print(f"清理提取缓存失败: {e}")
+    
+    def validate_search(self, search):
+        """
+        验证额外关键词搜索项
+        
+        Args:
+            search: 包含 name、column、keyword 的字典
+        
+        Returns:
+            是否有效
+        """
+        import re
+        if not isinstance(search, dict):
+            return False
+        return bool(
+            search.get("name")
+            and search.get("keyword")
+            and re.match(r'^[A-Z]+$', str(search.get("column", "")).upper())
+        )
+    
+    def _check_searches(self, extra_searches):
+        """逐项验证额外关键词搜索，打印第一个无效项"""
+        for search in extra_searches:
+            if not self.validate_search(search):
+                print(f"额外关键词搜索无效: {search}")
+                return False
+        return True
+    
     def validate_cell_reference(self, cell_ref):
         """验证单元格引用格式"""
         import re
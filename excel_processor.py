@@ -3,28 +3,1067 @@ Excel处理器 - 负责读取、提取和合并Excel数据
 """
 import openpyxl
 from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.utils.datetime import (
+    CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+)
+from openpyxl.styles.numbers import (
+    BUILTIN_FORMATS, is_date_format, is_timedelta_format
+)
+import csv
+import hashlib
+import io
+import mmap
 import os
+import posixpath
+import sys
+import time
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from xml.etree import ElementTree
+
+from aggregation import Aggregator
+from compiled_preset import CompiledPreset, normalize_anchor
+from prefetch import PREFETCH_BYTES, prefetch_files
+from result_table import ResultTable
+from run_report import RunReport
+
+
+# 读取引擎：standard 为完整加载，readonly 为只读流式加载，
+# xml 为直接解析工作表XML（失败时回退到 readonly）
+ENGINES = ("standard", "readonly", "xml")
+
+# 重复文件处理方式：skip 只保留首个文件，flag 保留全部行并标注重复来源，
+# merge 合并为一行并列出全部重复文件
+DUPLICATE_MODES = ("skip", "flag", "merge")
+
+# 合并结果的输出格式，未指定时按输出文件扩展名选择
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+OUTPUT_EXTENSIONS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet"}
+
+# 文件头标识：xlsx为zip压缩包，旧版 .xls 为OLE2复合文档（BIFF格式）
+XLSX_SIGNATURE = b"PK\x03\x04"
+XLS_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# openpyxl按扩展名判断是否支持，其他扩展名的xlsx文件需要以文件对象打开
+OPENPYXL_EXTENSIONS = (".xlsx", ".xlsm", ".xltx", ".xltm")
+
+# 提取结果中保存明细行的键，明细行写入单独的 "明细" 工作表
+DETAILS_KEY = "__details__"
+
+# 未识别到预设的文件在识别结果中的标注
+UNMATCHED = "未识别"
+
+# 工作表名称中不允许的字符，以及名称的最大长度
+INVALID_TITLE_CHARS = '[]:*?/\\'
+MAX_TITLE_LENGTH = 31
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """
+    计算文件内容哈希（BLAKE2b，分块读取）
+    
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+    
+    Returns:
+        十六进制哈希字符串
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_digest(content):
+    """已读入内存的文件内容的哈希，与 file_digest 的结果相同"""
+    return hashlib.blake2b(content, digest_size=20).hexdigest()
+
+
+def map_file(file_path):
+    """
+    以只读方式内存映射整个文件
+    
+    返回的 mmap 对象可以作为 content 传给各读取器：压缩包成员直接从映射中
+    按需读取，不把整个文件读入进程内存，多个进程读取同一文件时共用系统的
+    页缓存。使用完毕后由调用方 close()。
+    
+    Returns:
+        mmap 对象，空文件（无法映射）返回None
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MappedFile(io.RawIOBase):
+    """
+    mmap 的只读文件对象包装
+    
+    mmap 本身缺少 seekable() 等 zipfile 需要的方法；读取时直接从映射中
+    取出所需的字节，不复制整个文件。关闭包装不会关闭映射。
+    """
+    
+    def __init__(self, mapped):
+        super().__init__()
+        self._mapped = mapped
+        self._position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def read(self, size=-1):
+        end = len(self._mapped)
+        if size is not None and size >= 0:
+            end = min(self._position + size, end)
+        data = self._mapped[self._position:end]
+        self._position = max(end, self._position)
+        return data
+    
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._mapped)
+        if offset < 0:
+            raise ValueError(f"无效的位置: {offset}")
+        self._position = offset
+        return offset
+    
+    def tell(self):
+        return self._position
+
+
+def content_source(content):
+    """将 content 转换为可供 zipfile 读取的文件对象：mmap 不复制整个文件"""
+    if isinstance(content, mmap.mmap):
+        return MappedFile(content)
+    return io.BytesIO(content)
+
+
+def _report_stage(report, name):
+    """report.stage(name)，未提供 report 时不计时"""
+    if report is None:
+        return nullcontext()
+    return report.stage(name)
+
+
+# 子进程中的编译后预设，由进程池的 initializer 设置
+_worker_preset = None
+
+
+def detect_format(file_path, content=None):
+    """
+    按文件头（而不是扩展名）判断文件格式
+    
+    Args:
+        file_path: 文件路径
+        content: 已读入内存的文件内容，提供时不再读取文件
+    
+    Returns:
+        "xlsx"、"xls"，无法识别时返回None
+    """
+    if content is not None:
+        header = bytes(content[:len(XLS_SIGNATURE)])
+    else:
+        with open(file_path, 'rb') as f:
+            header = f.read(len(XLS_SIGNATURE))
+    if header.startswith(XLSX_SIGNATURE):
+        return "xlsx"
+    if header == XLS_SIGNATURE:
+        return "xls"
+    return None
+
+
+def open_sheet_reader(file_path, file_format=None, content=None):
+    """
+    按文件格式打开对应的工作表读取器
+    
+    两种读取器接口相同：sheet_names、active_index、iter_rows()、close()。
+    
+    Args:
+        file_path: Excel文件路径
+        file_format: detect_format 的结果，None 时自动判断
+        content: 已读入内存的文件内容（如预读的结果）或 map_file 的映射，
+            提供时不再读取文件
+    
+    Returns:
+        XlsSheetReader（.xls）或 XlsxSheetReader（其他）
+    """
+    if file_format is None:
+        file_format = detect_format(file_path, content)
+    if file_format == "xls":
+        return XlsSheetReader(file_path, content)
+    if content is not None:
+        return XlsxSheetReader(content_source(content))
+    return XlsxSheetReader(file_path)
+
+
+def _init_worker(preset):
+    """
+    子进程启动时保存编译后的预设（或 PresetRouter），任务中不再重复传递
+    
+    子进程中的提示信息（如回退到openpyxl）写到标准错误：spawn 方式启动的
+    子进程不继承父进程对 sys.stdout 的重定向，标准输出只留给调用方（如
+    命令行的JSON统计）。
+    """
+    global _worker_preset
+    _worker_preset = preset
+    sys.stdout = sys.stderr
+
+
+def _extract_in_worker(task):
+    """
+    子进程中执行的提取函数（必须位于模块顶层以便pickle）
+    
+    Args:
+        task: (file_path, engine, memory_map, digest) 元组，预设见 _init_worker
+    
+    Returns:
+        (提取的数据字典, 统计字典) 元组，提取失败时数据为None
+    """
+    file_path, engine, memory_map, digest = task
+    stats = {}
+    data = ExcelProcessor().extract_compiled(
+        file_path, _worker_preset, engine, stats, memory_map=memory_map, digest=digest
+    )
+    return data, stats
+
+
+def _route_in_worker(task):
+    """
+    子进程中识别预设并提取（参数同 _extract_in_worker，PresetRouter 见 _init_worker）
+    
+    Returns:
+        ((预设名称, 提取的数据字典), 统计字典) 元组
+    """
+    file_path, engine, memory_map, digest = task
+    stats = {}
+    routed = ExcelProcessor().extract_routed(
+        file_path, _worker_preset, engine, stats, memory_map=memory_map, digest=digest
+    )
+    return routed, stats
+
+
+class XlsxSheetReader:
+    """
+    轻量级xlsx工作表读取器
+    
+    直接解析xlsx压缩包中的工作表XML，只产出行值，不构建openpyxl的
+    单元格对象和样式，用于合并时快速读取映射单元格和搜索列。
+    遇到无法处理的文件结构时抛出异常，由调用方回退到openpyxl。
+    """
+    
+    NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+    NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+    
+    def __init__(self, file_path):
+        self.archive = zipfile.ZipFile(file_path)
+        self._names = set(self.archive.namelist())
+        try:
+            self.workbook_path = self._find_workbook_path()
+            (self.sheet_names, self.sheet_paths,
+             self.active_index, self.epoch) = self._read_workbook()
+            self.shared_strings = self._read_shared_strings()
+            self.date_styles, self.timedelta_styles = self._read_date_styles()
+        except Exception:
+            self.archive.close()
+            raise
+    
+    def close(self):
+        """关闭压缩包"""
+        self.archive.close()
+    
+    def _resolve(self, base_path, target):
+        """将关系文件中的目标路径解析为压缩包内路径"""
+        if target.startswith("/"):
+            return target.lstrip("/")
+        base_dir = posixpath.dirname(base_path)
+        return posixpath.normpath(posixpath.join(base_dir, target))
+    
+    def _read_rels(self, part_path):
+        """读取指定部件的关系文件，返回 {rId: (类型, 路径)}"""
+        rels_path = posixpath.join(
+            posixpath.dirname(part_path), "_rels",
+            posixpath.basename(part_path) + ".rels"
+        )
+        if rels_path not in self._names:
+            return {}
+        root = ElementTree.fromstring(self.archive.read(rels_path))
+        rels = {}
+        for rel in root.iter(f"{self.NS_PKG_REL}Relationship"):
+            rels[rel.get("Id")] = (
+                rel.get("Type", "").rsplit("/", 1)[-1],
+                self._resolve(part_path, rel.get("Target", ""))
+            )
+        return rels
+    
+    def _find_workbook_path(self):
+        """从包关系中找到工作簿部件路径"""
+        for rel_type, path in self._read_rels("").values():
+            if rel_type == "officeDocument":
+                return path
+        return "xl/workbook.xml"
+    
+    def _read_workbook(self):
+        """读取工作表名称和路径、活动工作表序号和日期系统"""
+        root = ElementTree.fromstring(self.archive.read(self.workbook_path))
+        rels = self._read_rels(self.workbook_path)
+        
+        sheet_names = []
+        sheet_paths = []
+        for sheet in root.iter(f"{self.NS_MAIN}sheet"):
+            rel_type, path = rels[sheet.get(f"{self.NS_REL}id")]
+            if rel_type != "worksheet":
+                raise ValueError(f"不支持的工作表类型: {rel_type}")
+            sheet_names.append(sheet.get("name", ""))
+            sheet_paths.append(path)
+        if not sheet_paths:
+            raise ValueError("工作簿中没有工作表")
+        
+        active_index = 0
+        view = root.find(f"{self.NS_MAIN}bookViews/{self.NS_MAIN}workbookView")
+        if view is not None:
+            active_index = int(view.get("activeTab", 0))
+        if not 0 <= active_index < len(sheet_paths):
+            active_index = 0
+        
+        epoch = CALENDAR_WINDOWS_1900
+        props = root.find(f"{self.NS_MAIN}workbookPr")
+        if props is not None and props.get("date1904") in ("1", "true"):
+            epoch = CALENDAR_MAC_1904
+        
+        self._workbook_rels = rels
+        return sheet_names, sheet_paths, active_index, epoch
+    
+    def _find_part(self, rel_type, default):
+        """按关系类型查找工作簿级部件路径"""
+        for found_type, path in self._workbook_rels.values():
+            if found_type == rel_type:
+                return path
+        return default
+    
+    def _read_shared_strings(self):
+        """读取共享字符串表（富文本按顺序拼接，忽略拼音注音）"""
+        path = self._find_part("sharedStrings", "xl/sharedStrings.xml")
+        if path not in self._names:
+            return []
+        
+        strings = []
+        si_tag = f"{self.NS_MAIN}si"
+        with self.archive.open(path) as source:
+            for _, elem in ElementTree.iterparse(source):
+                if elem.tag == si_tag:
+                    strings.append(self._element_text(elem))
+                    elem.clear()
+        return strings
+    
+    def _element_text(self, elem):
+        """拼接 si / is 元素中的文本，跳过 rPh 注音"""
+        t_tag = f"{self.NS_MAIN}t"
+        text = elem.find(t_tag)
+        if text is not None:
+            return text.text or ""
+        parts = []
+        for run in elem.findall(f"{self.NS_MAIN}r"):
+            run_text = run.find(t_tag)
+            if run_text is not None and run_text.text:
+                parts.append(run_text.text)
+        return "".join(parts)
+    
+    def _read_date_styles(self):
+        """找出数字格式为日期/时长的单元格样式序号"""
+        path = self._find_part("styles", "xl/styles.xml")
+        if path not in self._names:
+            return set(), set()
+        
+        root = ElementTree.fromstring(self.archive.read(path))
+        formats = dict(BUILTIN_FORMATS)
+        num_fmts = root.find(f"{self.NS_MAIN}numFmts")
+        if num_fmts is not None:
+            for fmt in num_fmts.findall(f"{self.NS_MAIN}numFmt"):
+                formats[int(fmt.get("numFmtId"))] = fmt.get("formatCode", "")
+        
+        date_styles = set()
+        timedelta_styles = set()
+        cell_xfs = root.find(f"{self.NS_MAIN}cellXfs")
+        if cell_xfs is not None:
+            for style_id, xf in enumerate(cell_xfs.findall(f"{self.NS_MAIN}xf")):
+                fmt = formats.get(int(xf.get("numFmtId", 0)))
+                if fmt and is_date_format(fmt):
+                    date_styles.add(style_id)
+                    if is_timedelta_format(fmt):
+                        timedelta_styles.add(style_id)
+        return date_styles, timedelta_styles
+    
+    def _cell_value(self, cell):
+        """按单元格类型转换为与openpyxl(data_only)一致的Python值"""
+        data_type = cell.get("t", "n")
+        
+        if data_type == "inlineStr":
+            inline = cell.find(f"{self.NS_MAIN}is")
+            return self._element_text(inline) if inline is not None else None
+        
+        value_elem = cell.find(f"{self.NS_MAIN}v")
+        if value_elem is None or value_elem.text is None:
+            return None
+        value = value_elem.text
+        
+        if data_type == "s":
+            return self.shared_strings[int(value)]
+        if data_type == "b":
+            return bool(int(value))
+        if data_type in ("str", "e"):
+            return value
+        if data_type == "d":
+            return datetime.fromisoformat(value.rstrip("Z"))
+        
+        if "." in value or "E" in value or "e" in value:
+            number = float(value)
+        else:
+            number = int(value)
+        style_id = int(cell.get("s", 0))
+        if style_id in self.date_styles:
+            return from_excel(
+                number, self.epoch,
+                timedelta=style_id in self.timedelta_styles
+            )
+        return number
+    
+    def iter_rows(self, max_col=None, sheet_index=None):
+        """
+        逐行产出工作表的值元组（从第1行开始，缺失的行补为空元组）
+        
+        Args:
+            max_col: 只保留前 max_col 列，None 表示保留整行
+            sheet_index: 工作表序号（从0开始），None 表示活动工作表
+        
+        Yields:
+            每行的值元组
+        """
+        row_tag = f"{self.NS_MAIN}row"
+        cell_tag = f"{self.NS_MAIN}c"
+        if sheet_index is None:
+            sheet_index = self.active_index
+        sheet_path = self.sheet_paths[sheet_index]
+        expected_row = 1
+        
+        with self.archive.open(sheet_path) as source:
+            for _, elem in ElementTree.iterparse(source):
+                if elem.tag != row_tag:
+                    continue
+                
+                row_idx = int(elem.get("r", expected_row))
+                while expected_row < row_idx:
+                    yield ()
+                    expected_row += 1
+                
+                values = []
+                col_idx = 0
+                for cell in elem.iter(cell_tag):
+                    ref = cell.get("r")
+                    if ref:
+                        col_idx = column_index_from_string(
+                            ref.rstrip("0123456789")
+                        )
+                    else:
+                        col_idx += 1
+                    if max_col is not None and col_idx > max_col:
+                        break
+                    value = self._cell_value(cell)
+                    if value is None:
+                        continue
+                    if len(values) < col_idx:
+                        values.extend([None] * (col_idx - len(values)))
+                    values[col_idx - 1] = value
+                
+                elem.clear()
+                expected_row = row_idx + 1
+                yield tuple(values)
+
+
+class XlsSheetReader:
+    """
+    旧版 .xls（BIFF）工作表读取器（需要安装 xlrd）
+    
+    接口与 XlsxSheetReader 相同，产出的值与读取xlsx时一致：整数不带小数，
+    日期为datetime，错误单元格为 "#N/A" 等文本，空白单元格为None。
+    """
+    
+    def __init__(self, file_path, content=None):
+        try:
+            import xlrd
+        except ImportError:
+            raise RuntimeError("读取 .xls 文件需要安装 xlrd：pip install xlrd")
+        
+        self.xlrd = xlrd
+        if content is not None:
+            self.book = xlrd.open_workbook(file_contents=content)
+        else:
+            self.book = xlrd.open_workbook(file_path)
+        self.sheet_names = self.book.sheet_names()
+        # 打开工作簿时显示的工作表为活动工作表
+        self.active_index = next(
+            (idx for idx, sheet in enumerate(self.book.sheets()) if sheet.sheet_visible), 0
+        )
+    
+    def close(self):
+        """释放工作簿"""
+        self.book.release_resources()
+    
+    def _cell_value(self, cell_type, value):
+        """按单元格类型转换为与读取xlsx时一致的Python值"""
+        xlrd = self.xlrd
+        if cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+            return None
+        if cell_type == xlrd.XL_CELL_NUMBER:
+            return int(value) if value.is_integer() else value
+        if cell_type == xlrd.XL_CELL_DATE:
+            return xlrd.xldate_as_datetime(value, self.book.datemode)
+        if cell_type == xlrd.XL_CELL_BOOLEAN:
+            return bool(value)
+        if cell_type == xlrd.XL_CELL_ERROR:
+            return xlrd.error_text_from_code.get(value)
+        return value
+    
+    def iter_rows(self, max_col=None, sheet_index=None):
+        """
+        逐行产出工作表的值元组（从第1行开始）
+        
+        Args:
+            max_col: 只保留前 max_col 列，None 表示保留整行
+            sheet_index: 工作表序号（从0开始），None 表示活动工作表
+        
+        Yields:
+            每行的值元组
+        """
+        if sheet_index is None:
+            sheet_index = self.active_index
+        sheet = self.book.sheet_by_index(sheet_index)
+        for row_idx in range(sheet.nrows):
+            end = sheet.row_len(row_idx)
+            if max_col is not None:
+                end = min(end, max_col)
+            yield tuple(
+                self._cell_value(cell_type, value)
+                for cell_type, value in zip(
+                    sheet.row_types(row_idx, 0, end), sheet.row_values(row_idx, 0, end)
+                )
+            )
+
+
+class XlsxResultWriter:
+    """
+    合并结果的xlsx写入器
+    
+    write_only=True 时使用openpyxl的只写模式，数据行写入后即落盘，
+    内存占用不随行数增长；否则在内存中构建完整工作簿后再保存。
+    """
+    
+    def __init__(self, output_file, headers, sheet_title="合并结果", write_only=False):
+        self.output_file = output_file
+        self.write_only = write_only
+        self.wb = Workbook(write_only=write_only)
+        if write_only:
+            self.ws = self.wb.create_sheet(sheet_title)
+        else:
+            self.ws = self.wb.active
+            self.ws.title = sheet_title
+        
+        self._write_header(self.ws, headers)
+    
+    def _write_header(self, ws, headers):
+        """设置列宽，写入表头并设置样式"""
+        # 只写模式下列宽必须在写入任何行之前设置
+        for col_idx in range(1, len(headers) + 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = 15
+        
+        font = openpyxl.styles.Font(bold=True)
+        fill = openpyxl.styles.PatternFill(
+            start_color="CCE5FF",
+            end_color="CCE5FF",
+            fill_type="solid"
+        )
+        
+        if self.write_only:
+            cells = []
+            for header in headers:
+                cell = WriteOnlyCell(ws, value=header)
+                cell.font = font
+                cell.fill = fill
+                cells.append(cell)
+            ws.append(cells)
+        else:
+            ws.append(headers)
+            for cell in ws[1]:
+                cell.font = font
+                cell.fill = fill
+    
+    def write_row(self, values):
+        """追加一行数据"""
+        self.ws.append(values)
+    
+    def open_sheet(self, title, headers):
+        """在合并结果之后添加一个工作表，返回可逐行写入的对象（见 XlsxSheetWriter）"""
+        ws = self.wb.create_sheet(title)
+        self._write_header(ws, headers)
+        return XlsxSheetWriter(ws)
+    
+    def write_sheet(self, title, headers, rows):
+        """在合并结果之后添加一个工作表（如汇总表）"""
+        sheet = self.open_sheet(title, headers)
+        for values in rows:
+            sheet.write_row(values)
+    
+    def close(self):
+        """保存并关闭工作簿"""
+        self.wb.save(self.output_file)
+        self.wb.close()
+
+
+class XlsxSheetWriter:
+    """xlsx写入器中附加工作表的逐行写入接口，工作表随工作簿一起保存"""
+    
+    def __init__(self, ws):
+        self.ws = ws
+    
+    def write_row(self, values):
+        """追加一行数据"""
+        self.ws.append(list(values))
+    
+    def close(self):
+        """随工作簿保存，无需单独关闭"""
+
+
+class CsvResultWriter:
+    """
+    合并结果的CSV写入器
+    
+    使用带BOM的UTF-8编码（Excel可直接打开中文），每行提取后立即写入文件。
+    append 为True时追加到已有文件末尾，只在文件为空时写入表头。
+    """
+    
+    def __init__(self, output_file, headers, append=False):
+        self.output_file = output_file
+        self.file = open(output_file, 'a' if append else 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file)
+        if not append or self.file.tell() == 0:
+            self.writer.writerow(headers)
+        self.sheets = []
+    
+    def write_row(self, values):
+        """追加一行数据（None 写为空）"""
+        self.writer.writerow(values)
+    
+    def open_sheet(self, title, headers):
+        """附加表格写到同目录下的 "<输出文件名>_<标题>.csv"，随本写入器一起关闭"""
+        root, ext = os.path.splitext(self.output_file)
+        sheet = CsvResultWriter(f"{root}_{title}{ext}", headers)
+        self.sheets.append(sheet)
+        return sheet
+    
+    def write_sheet(self, title, headers, rows):
+        """写入一个完整的附加表格"""
+        sheet = self.open_sheet(title, headers)
+        for values in rows:
+            sheet.write_row(values)
+    
+    def close(self):
+        """关闭文件（包括附加表格）"""
+        for sheet in self.sheets:
+            sheet.close()
+        self.file.close()
+
+
+class ParquetResultWriter:
+    """
+    合并结果的Parquet写入器（需要安装 pyarrow）
+    
+    行数据按列缓存，每满 batch_rows 行作为一个行组写入文件。
+    列类型由第一批数据确定：全部为数字的列为 float64，全部为布尔值的列
+    为 bool，其余为字符串。之后的批次中出现无法转换为该类型的值时，
+    该列改为字符串（已写入的行读回后重新写入），不丢失数据。
+    """
+    
+    def __init__(self, output_file, headers, batch_rows=50000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("输出Parquet文件需要安装 pyarrow：pip install pyarrow")
+        
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.output_file = output_file
+        self.headers = list(headers)
+        self.batch_rows = batch_rows
+        self.columns = [[] for _ in self.headers]
+        self.schema = None
+        self.writer = None
+        self.sheets = []
+    
+    def write_row(self, values):
+        """追加一行数据"""
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        if len(self.columns[0]) >= self.batch_rows:
+            self._flush()
+    
+    def open_sheet(self, title, headers):
+        """附加表格写到同目录下的 "<输出文件名>_<标题>.parquet"，随本写入器一起关闭"""
+        root, ext = os.path.splitext(self.output_file)
+        sheet = ParquetResultWriter(f"{root}_{title}{ext}", headers, self.batch_rows)
+        self.sheets.append(sheet)
+        return sheet
+    
+    def write_sheet(self, title, headers, rows):
+        """写入一个完整的附加表格"""
+        sheet = self.open_sheet(title, headers)
+        for values in rows:
+            sheet.write_row(values)
+    
+    def _infer_type(self, values):
+        """按第一批数据推断列类型"""
+        present = [value for value in values if value is not None]
+        if present and all(isinstance(value, bool) for value in present):
+            return self.pa.bool_()
+        if present and all(
+            isinstance(value, (int, float)) and not isinstance(value, bool)
+            for value in present
+        ):
+            return self.pa.float64()
+        return self.pa.string()
+    
+    def _fits(self, value, pa_type):
+        """值能否写入该类型的列"""
+        if value is None or pa_type == self.pa.string():
+            return True
+        if pa_type == self.pa.bool_():
+            return isinstance(value, bool)
+        try:
+            float(value)
+        except (ValueError, TypeError):
+            return False
+        return True
+    
+    def _convert(self, value, pa_type):
+        """将值转换为列类型（值已经过 _fits 检查）"""
+        if value is None:
+            return None
+        if pa_type == self.pa.string():
+            return str(value)
+        if pa_type == self.pa.bool_():
+            return value
+        return float(value)
+    
+    def _to_text(self, value):
+        """列改为字符串时已写入的值的文字（整数值的小数去掉 ".0"）"""
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+    
+    def _widen(self, indices):
+        """
+        将指定的列改为字符串类型
+        
+        已写入的行组读回，转换后按新的表结构重新写入；每列最多改变一次。
+        """
+        string = self.pa.string()
+        self.schema = self.pa.schema([
+            field.with_type(string) if idx in indices else field
+            for idx, field in enumerate(self.schema)
+        ])
+        if self.writer is None:
+            return
+        
+        self.writer.close()
+        written = self.pq.read_table(self.output_file)
+        arrays = []
+        for idx, column in enumerate(written.columns):
+            if idx in indices:
+                column = self.pa.array([
+                    None if value is None else self._to_text(value)
+                    for value in column.to_pylist()
+                ], string)
+            arrays.append(column)
+        self.writer = self.pq.ParquetWriter(self.output_file, self.schema)
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+    
+    def _flush(self):
+        """将缓存的行写为一个行组"""
+        if self.schema is None:
+            # 表头重复时在Parquet列名后加下划线区分
+            names = []
+            for header in self.headers:
+                name = str(header)
+                while name in names:
+                    name += "_"
+                names.append(name)
+            self.schema = self.pa.schema([
+                (name, self._infer_type(column))
+                for name, column in zip(names, self.columns)
+            ])
+        
+        mismatched = {
+            idx for idx, (column, field) in enumerate(zip(self.columns, self.schema))
+            if not all(self._fits(value, field.type) for value in column)
+        }
+        if mismatched:
+            self._widen(mismatched)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.output_file, self.schema)
+        
+        arrays = [
+            self.pa.array([self._convert(value, field.type) for value in column], field.type)
+            for column, field in zip(self.columns, self.schema)
+        ]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.columns = [[] for _ in self.headers]
+    
+    def close(self):
+        """写入剩余的行并关闭文件（包括附加表格）"""
+        for sheet in self.sheets:
+            sheet.close()
+        if self.columns[0] or self.writer is None:
+            self._flush()
+        self.writer.close()
+
+
+def create_result_writer(output_file, headers, output_format=None, write_only=False,
+                         sheet_title="合并结果"):
+    """
+    按输出格式创建结果写入器
+    
+    Args:
+        output_file: 输出文件路径
+        headers: 表头列表
+        output_format: "xlsx"、"csv" 或 "parquet"，None 时按文件扩展名判断
+            （.csv、.parquet/.pq，其余为xlsx）
+        write_only: xlsx 是否使用只写模式
+        sheet_title: xlsx 第一个工作表的名称
+    
+    Returns:
+        具有 write_row / write_sheet / close 方法的写入器
+    """
+    if output_format is None:
+        ext = os.path.splitext(output_file)[1].lower()
+        output_format = OUTPUT_EXTENSIONS.get(ext, "xlsx")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"未知的输出格式: {output_format}")
+    
+    if output_format == "csv":
+        return CsvResultWriter(output_file, headers)
+    if output_format == "parquet":
+        return ParquetResultWriter(output_file, headers)
+    return XlsxResultWriter(output_file, headers, sheet_title, write_only=write_only)
+
+
+class PreviewSource:
+    """
+    按需分块读取工作表行的预览数据源
+    
+    行数据按 CHUNK_ROWS 行一块从工作簿中流式读取，只缓存最近使用的
+    MAX_CHUNKS 块，预览超大工作表时内存占用也保持有限。
+    向后滚动到已淘汰的块时会从头重新流式读取到该位置。
+    """
+    
+    CHUNK_ROWS = 200
+    MAX_CHUNKS = 10
+    
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # 已知的总行数，读到文件末尾之前为None
+        self.row_count = None
+        # 目前读到的行中最大的列数
+        self.max_column = 0
+        self._chunks = OrderedDict()
+        self._rows = None
+        self._next_row = 1
+        
+        file_format = detect_format(file_path)
+        try:
+            self._reader = open_sheet_reader(file_path, file_format)
+            self._wb = None
+        except Exception:
+            if file_format == "xls":
+                raise
+            # 直接解析XML失败时使用openpyxl只读模式
+            self._reader = None
+            self._wb = ExcelProcessor().load_workbook(file_path, "readonly")
+    
+    def close(self):
+        """关闭工作簿"""
+        self._rows = None
+        if self._reader is not None:
+            self._reader.close()
+        if self._wb is not None:
+            self._wb.close()
+    
+    def _restart(self):
+        """从第1行重新开始流式读取"""
+        if self._reader is not None:
+            self._rows = self._reader.iter_rows()
+        else:
+            self._rows = self._wb.active.iter_rows(values_only=True)
+        self._next_row = 1
+    
+    def _format(self, value):
+        """转换为预览显示用的值"""
+        if value is None:
+            return ""
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d")
+        return value
+    
+    def _load_chunk(self, chunk_idx):
+        """读取指定块，返回该块的行列表"""
+        if chunk_idx in self._chunks:
+            self._chunks.move_to_end(chunk_idx)
+            return self._chunks[chunk_idx]
+        
+        start_row = chunk_idx * self.CHUNK_ROWS + 1
+        if self._rows is None or start_row < self._next_row:
+            self._restart()
+        
+        # 跳过块之前的行
+        while self._next_row < start_row:
+            if next(self._rows, None) is None:
+                self.row_count = self._next_row - 1
+                return []
+            self._next_row += 1
+        
+        chunk = []
+        hit_end = False
+        for _ in range(self.CHUNK_ROWS):
+            row = next(self._rows, None)
+            if row is None:
+                self.row_count = self._next_row - 1
+                hit_end = True
+                break
+            formatted = [self._format(value) for value in row]
+            # 去掉行尾的空单元格
+            while formatted and formatted[-1] == "":
+                formatted.pop()
+            self.max_column = max(self.max_column, len(formatted))
+            chunk.append(formatted)
+            self._next_row += 1
+        
+        # 本次读取到达末尾时，总行数不包含该块末尾的空行
+        if hit_end:
+            while start_row <= self.row_count < start_row + len(chunk) \
+                    and not chunk[self.row_count - start_row]:
+                self.row_count -= 1
+        
+        self._chunks[chunk_idx] = chunk
+        if len(self._chunks) > self.MAX_CHUNKS:
+            self._chunks.popitem(last=False)
+        return chunk
+    
+    def get_rows(self, start_row, count):
+        """
+        获取从 start_row（从1开始）起的 count 行
+        
+        Returns:
+            行列表，每行为值列表（末尾空单元格已去掉）；超出末尾的行不返回
+        """
+        rows = []
+        row_idx = start_row
+        end_row = start_row + count
+        while row_idx < end_row:
+            if self.row_count is not None and row_idx > self.row_count:
+                break
+            chunk_idx = (row_idx - 1) // self.CHUNK_ROWS
+            chunk = self._load_chunk(chunk_idx)
+            offset = row_idx - 1 - chunk_idx * self.CHUNK_ROWS
+            # 读到末尾后总行数可能已去掉块末尾的空行
+            limit = end_row if self.row_count is None else min(end_row, self.row_count + 1)
+            if offset >= len(chunk) or row_idx >= limit:
+                break
+            take = chunk[offset:offset + limit - row_idx]
+            rows.extend(take)
+            row_idx += len(take)
+        return rows
+    
+    def known_row_count(self):
+        """
+        当前已知的行数，用于设置滚动范围
+        
+        未读到末尾时返回已读取的行数加一块，使滚动条可以继续向下滚动触发读取。
+        """
+        if self.row_count is not None:
+            return self.row_count
+        return self._next_row - 1 + self.CHUNK_ROWS
 
 
 class ExcelProcessor:
     def __init__(self):
         pass
     
-    def read_cell_value(self, file_path, cell_ref):
+    def load_workbook(self, file_path, engine="standard", content=None):
+        """
+        按指定引擎打开工作簿
+        
+        Args:
+            file_path: Excel文件路径
+            engine: "standard" 完整加载；"readonly" 只读流式加载，
+                    不构建样式和完整单元格对象，适合只读取少量单元格；
+                    "xml" 需要工作簿对象时与 "readonly" 相同
+            content: 已读入内存的文件内容，提供时不再读取文件
+        
+        Returns:
+            openpyxl工作簿对象
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"未知的读取引擎: {engine}")
+        
+        if detect_format(file_path, content) == "xls":
+            raise ValueError("openpyxl 不能读取 .xls 文件，请使用 open_sheet_reader")
+        
+        source = file_path
+        if content is not None:
+            source = content_source(content)
+        elif not str(file_path).lower().endswith(OPENPYXL_EXTENSIONS):
+            # 扩展名不是xlsx（如另存为 .xls 的xlsx文件），以文件内容打开
+            with open(file_path, 'rb') as f:
+                source = io.BytesIO(f.read())
+        
+        read_only = engine != "standard"
+        wb = openpyxl.load_workbook(source, read_only=read_only, data_only=True)
+        if read_only:
+            # 部分软件导出的文件尺寸信息不准确，清除后按实际内容读取
+            wb.active.reset_dimensions()
+        return wb
+    
+    def read_cell_value(self, file_path, cell_ref, engine="standard"):
         """
         读取Excel文件中指定单元格的值
         
         Args:
             file_path: Excel文件路径
             cell_ref: 单元格引用，如 'A1', 'B2'
+            engine: 读取引擎，见 load_workbook
         
         Returns:
             单元格的值
         """
         try:
-            wb = openpyxl.load_workbook(file_path, data_only=True)
+            wb = self.load_workbook(file_path, engine)
             ws = wb.active
             value = ws[cell_ref.upper()].value
             wb.close()
@@ -45,75 +1084,938 @@ class ExcelProcessor:
         Returns:
             结算金额数值，如果未找到则返回None
         """
+        values = self.find_keyword_values(ws, [{
+            "name": "结算金额",
+            "column": search_column,
+            "keyword": search_keyword
+        }])
+        return values.get("结算金额")
+    
+    def find_keyword_values(self, ws, searches, stats=None):
+        """
+        一次遍历工作表，在各自的列中搜索多个关键词并返回其右侧单元格的值
+        
+        Args:
+            ws: openpyxl工作表对象
+            searches: 搜索项列表，每项包含 name、column、keyword，
+                如 {"name": "工时费合计", "column": "D", "keyword": "工时费合计"}
+            stats: 统计字典，提供时累计搜索耗时和扫描行数
+        
+        Returns:
+            {搜索项名称: 数值}，未找到的搜索项值为None
+        """
         try:
-            # 计算右侧列（搜索列的下一列）
-            from openpyxl.utils import column_index_from_string, get_column_letter
-            search_col_idx = column_index_from_string(search_column.upper())
-            value_col = get_column_letter(search_col_idx + 1)
-            
-            # 遍历指定列查找关键词
-            for row in range(1, ws.max_row + 1):
-                cell_value = ws[f'{search_column.upper()}{row}'].value
-                if cell_value and search_keyword in str(cell_value):
-                    # 找到后，读取右侧单元格的值
-                    settlement_value = ws[f'{value_col}{row}'].value
-                    # 尝试转换为数字
-                    if settlement_value is not None:
-                        try:
-                            return float(settlement_value)
-                        except (ValueError, TypeError):
-                            return settlement_value
-                    return None
-            return None
+            parsed = self._parse_searches(searches)
         except Exception as e:
-            print(f"搜索 {search_keyword} 失败: {e}")
+            keywords = "、".join(str(s.get("keyword")) for s in searches)
+            print(f"搜索 {keywords} 失败: {e}")
+            parsed = []
+        values = self._search_parsed(ws, parsed, stats)
+        return {s["name"]: values.get(s["name"]) for s in searches}
+    
+    def _search_parsed(self, ws, searches, stats=None):
+        """
+        在工作表中搜索已解析的搜索项
+        
+        Args:
+            ws: openpyxl工作表对象
+            searches: [(名称, 列序号, 关键词), ...]
+            stats: 统计字典，见 find_keyword_values
+        
+        Returns:
+            {搜索项名称: 值}，未找到的搜索项不在其中
+        """
+        if not searches:
+            return {}
+        try:
+            cells = getattr(ws, "_cells", None)
+            if cells is not None:
+                return self._scan_loaded_cells(ws, cells, searches, stats)
+            # 只读工作表：只遍历搜索列及其右侧列
+            min_col = min(col for _, col, _ in searches)
+            max_col = max(col for _, col, _ in searches) + 1
+            rows = ws.iter_rows(min_col=min_col, max_col=max_col, values_only=True)
+            return self._scan_rows(rows, {}, searches, first_col=min_col, stats=stats)
+        except Exception as e:
+            keywords = "、".join(str(keyword) for _, _, keyword in searches)
+            print(f"搜索 {keywords} 失败: {e}")
+            return {}
+    
+    def _scan_loaded_cells(self, ws, cells, searches, stats=None):
+        """
+        在完整加载的工作表中按行搜索关键词
+        
+        直接按 (行, 列) 查询已存在的单元格，不拼接单元格引用，
+        也不会像 ws['D10'] / iter_rows 那样为空白位置创建单元格对象，
+        因格式而虚增的 max_row 只带来很小的开销。
+        
+        Args:
+            ws: 完整加载的openpyxl工作表
+            cells: 工作表的 {(行, 列): 单元格} 字典
+            searches: _parse_searches 返回的搜索项列表
+            stats: 统计字典，提供时累计搜索耗时和扫描行数
+        
+        Returns:
+            {搜索项名称: 值}
+        """
+        started = time.perf_counter()
+        values = {}
+        pending = list(searches)
+        row_idx = 0
+        for row_idx in range(1, ws.max_row + 1):
+            for search in list(pending):
+                name, col_idx, keyword = search
+                cell = cells.get((row_idx, col_idx))
+                if cell is None:
+                    continue
+                cell_value = cell.value
+                if cell_value and keyword in str(cell_value):
+                    pending.remove(search)
+                    value_cell = cells.get((row_idx, col_idx + 1))
+                    if value_cell is not None:
+                        values[name] = self._to_number(value_cell.value)
+            if not pending:
+                break
+        
+        if stats is not None:
+            self._add_stats(
+                stats, scan_seconds=time.perf_counter() - started, rows_scanned=row_idx
+            )
+        return values
+    
+    def _add_stats(self, stats, **values):
+        """在统计字典中累计耗时、行数等数值"""
+        for key, value in values.items():
+            stats[key] = stats.get(key, 0) + value
+    
+    def _to_number(self, value):
+        """尝试将结算金额转换为数字，无法转换时原样返回"""
+        if value is None:
             return None
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return value
+    
+    def _parse_searches(self, searches):
+        """将搜索项的列字母转换为列序号，返回 [(名称, 列序号, 关键词), ...]"""
+        return [
+            (s["name"], column_index_from_string(s["column"].upper()), s["keyword"])
+            for s in searches
+        ]
+    
+    def _resolve_sheet(self, sheet, sheet_names, active_index):
+        """
+        将映射或搜索项指定的工作表解析为工作表序号（从0开始）
+        
+        Args:
+            sheet: None 或空字符串表示活动工作表；整数表示第几个工作表
+                （从1开始）；字符串表示工作表名称
+            sheet_names: 工作簿中全部工作表名称
+            active_index: 活动工作表序号
+        
+        Returns:
+            工作表序号，工作表不存在时返回None
+        """
+        if sheet is None or sheet == "":
+            return active_index
+        if isinstance(sheet, int):
+            return sheet - 1 if 1 <= sheet <= len(sheet_names) else None
+        sheet = str(sheet)
+        return sheet_names.index(sheet) if sheet in sheet_names else None
+    
+    def _plan_sheets(self, file_path, sheet_names, active_index, preset):
+        """
+        将编译后预设的各工作表计划对应到本文件的工作表，每个工作表只读取一次
+        
+        Returns:
+            {工作表序号: SheetPlan}；指定的工作表不存在的映射和搜索项
+            不在其中，提取结果为None
+        """
+        plan = {}
+        for sheet_plan in preset.sheets:
+            sheet_index = self._resolve_sheet(sheet_plan.sheet, sheet_names, active_index)
+            if sheet_index is None:
+                if preset.report_missing_sheets:
+                    print(f"文件 {os.path.basename(file_path)} 中没有工作表: {sheet_plan.sheet}")
+                continue
+            if sheet_index in plan:
+                plan[sheet_index] = plan[sheet_index].merge(sheet_plan)
+            else:
+                plan[sheet_index] = sheet_plan
+        return plan
+    
+    def _scan_rows(self, rows, targets, searches, first_col=1, stats=None,
+                   blocks=(), details=None, anchors=None, lookback=0):
+        """
+        单次遍历行数据，同时读取映射单元格、搜索全部关键词、定位按关键词
+        定位的映射并收集明细行
+        
+        映射单元格全部读到、所有关键词都已命中、按关键词定位的映射都已取值
+        且明细区块都已结束后立即停止，不再解析后续行。每个关键词只取第一次
+        出现的位置，搜索项的值为其右侧单元格。
+        
+        Args:
+            rows: 从第1行开始的行值元组迭代器（values_only）
+            targets: SheetPlan.rows，{行: ((列, 映射名称元组), ...)}
+            searches: [(名称, 列序号, 关键词), ...]
+            first_col: 行元组第一个元素对应的列序号
+            stats: 统计字典，提供时累计扫描行数；读到最后一个映射单元格
+                所在行之前的耗时计入映射读取，之后的计入关键词搜索
+            blocks: DetailBlock 元组
+            details: 列表，明细行（[区块名称, 各明细列的值...]）追加到其中
+            anchors: SheetPlan.anchors，{关键词: ((行偏移, 列偏移, 映射名称元组), ...)}；
+                每个文字单元格在其中查找一次，与关键词数量无关
+            lookback: 最大的向上行偏移，保留最近这么多行供关键词上方的值使用
+        
+        Returns:
+            {映射名称或搜索项名称: 值}
+        """
+        values = {}
+        pending = list(searches)
+        # 尚未找到的定位关键词，以及关键词下方待读取的单元格 {行: [(列, 映射名称元组)]}
+        anchor_pending = dict(anchors) if anchors else None
+        anchor_targets = {}
+        recent = deque(maxlen=lookback) if lookback else None
+        # 每个区块的 [区块, 状态, 明细行]，状态 0 为未开始，1 为读取中
+        block_states = [[block, 0, []] for block in blocks]
+        open_blocks = list(block_states)
+        last_target_row = max(targets, default=0)
+        started = time.perf_counter()
+        mapped_at = started if not targets else None
+        row_idx = 0
+        
+        for row_idx, row in enumerate(rows, start=1):
+            if row_idx <= last_target_row:
+                row_targets = targets.get(row_idx)
+                if row_targets:
+                    for col_idx, names in row_targets:
+                        idx = col_idx - first_col
+                        if 0 <= idx < len(row):
+                            for name in names:
+                                values[name] = row[idx]
+            
+            if pending:
+                row_len = len(row)
+                for search in list(pending):
+                    name, col_idx, keyword = search
+                    idx = col_idx - first_col
+                    if idx >= row_len:
+                        continue
+                    cell_value = row[idx]
+                    if cell_value and keyword in str(cell_value):
+                        pending.remove(search)
+                        if idx + 1 < row_len:
+                            values[name] = self._to_number(row[idx + 1])
+            
+            if open_blocks:
+                for state in list(open_blocks):
+                    if not self._scan_block_row(state, row_idx, row, first_col):
+                        open_blocks.remove(state)
+            
+            if anchor_targets:
+                for col_idx, names in anchor_targets.pop(row_idx, ()):
+                    idx = col_idx - first_col
+                    if 0 <= idx < len(row):
+                        for name in names:
+                            values[name] = row[idx]
+            if anchor_pending:
+                self._scan_anchor_row(
+                    anchor_pending, anchor_targets, recent, values, row_idx, row, first_col
+                )
+                if recent is not None:
+                    recent.append(row)
+            
+            if row_idx == last_target_row:
+                mapped_at = time.perf_counter()
+            if not pending and not open_blocks and row_idx >= last_target_row \
+                    and not anchor_pending and not anchor_targets:
+                break
+        
+        # 明细行按区块顺序排列
+        for state in block_states:
+            details.extend(state[2])
+        
+        if stats is not None:
+            finished = time.perf_counter()
+            if mapped_at is None:
+                mapped_at = finished
+            self._add_stats(
+                stats,
+                read_seconds=mapped_at - started,
+                scan_seconds=finished - mapped_at,
+                rows_scanned=row_idx
+            )
+        return values
+    
+    def _scan_anchor_row(self, anchor_pending, anchor_targets, recent, values,
+                         row_idx, row, first_col):
+        """
+        在一行中查找定位关键词，找到后按偏移取值
+        
+        同一行和上方的值直接读取（上方的行来自 recent），下方的单元格记入
+        anchor_targets，遍历到该行时读取。找到的关键词从 anchor_pending 中移除。
+        """
+        for idx, value in enumerate(row):
+            if not isinstance(value, str):
+                continue
+            entries = anchor_pending.pop(normalize_anchor(value), None)
+            if entries is None:
+                continue
+            for row_offset, col_offset, names in entries:
+                col_idx = idx + first_col + col_offset
+                target_row = row_idx + row_offset
+                if col_idx < first_col or target_row < 1:
+                    continue
+                if row_offset > 0:
+                    anchor_targets.setdefault(target_row, []).append((col_idx, names))
+                    continue
+                if row_offset == 0:
+                    source = row
+                elif recent is not None and -row_offset <= len(recent):
+                    source = recent[row_offset]
+                else:
+                    continue
+                value_idx = col_idx - first_col
+                if value_idx < len(source):
+                    for name in names:
+                        values[name] = source[value_idx]
+            if not anchor_pending:
+                return
+    
+    def _scan_block_row(self, state, row_idx, row, first_col):
+        """
+        处理明细区块的一行
+        
+        Args:
+            state: [DetailBlock, 状态, 明细行列表]，状态 0 为未开始，1 为读取中
+        
+        Returns:
+            区块是否仍需继续读取
+        """
+        block = state[0]
+        if state[1] == 0:
+            if row_idx < block.start_row:
+                return True
+            if block.start is not None:
+                # 起始关键词所在行本身不是明细行
+                if self._row_has_keyword(row, block.start, first_col):
+                    state[1] = 1
+                return True
+            state[1] = 1
+        
+        if block.end_row is not None and row_idx > block.end_row:
+            return False
+        if block.end is not None and self._row_has_keyword(row, block.end, first_col):
+            return False
+        
+        values = [None] * block.width
+        found = False
+        row_len = len(row)
+        for pos, col_idx in block.columns:
+            idx = col_idx - first_col
+            if 0 <= idx < row_len:
+                value = row[idx]
+                if isinstance(value, datetime):
+                    value = value.strftime("%Y-%m-%d")
+                if value is not None and value != "":
+                    values[pos] = value
+                    found = True
+        if found:
+            state[2].append([block.name] + values)
+        return True
+    
+    def _row_has_keyword(self, row, search, first_col):
+        """行中指定列的单元格是否包含关键词，search 为 (列序号, 关键词)"""
+        col_idx, keyword = search
+        idx = col_idx - first_col
+        if 0 <= idx < len(row):
+            cell_value = row[idx]
+            return bool(cell_value) and keyword in str(cell_value)
+        return False
     
     def extract_data_from_file(self, file_path, mappings, 
-                              search_column="D", search_keyword="折后总计"):
+                              search_column="D", search_keyword="折后总计",
+                              engine="standard", extra_searches=None,
+                              search_sheet=None, stats=None, details=None):
         """
         从单个Excel文件中根据映射配置提取数据
         
+        映射和搜索项可以用 "sheet" 指定工作表（名称，或从1开始的序号），
+        未指定时读取活动工作表。工作簿只打开一次，每个用到的工作表只读取一次。
+        处理多个文件时先用 CompiledPreset.compile 编译配置，再调用
+        extract_compiled，避免每个文件重复解析。
+        
         Args:
             file_path: Excel文件路径
-            mappings: 映射配置列表，每个映射包含 name 和 cell
+            mappings: 映射配置列表，每个映射包含 name 和 cell，可选 sheet
             search_column: 搜索结算金额的列
             search_keyword: 搜索的关键词
+            engine: 读取引擎，"readonly" 时流式读取并在找到所需数据后提前结束，
+                    "xml" 时直接解析工作表XML
+            extra_searches: 额外的关键词搜索项列表（见 find_keyword_values），
+                与结算金额在同一次遍历中搜索
+            search_sheet: 搜索结算金额的工作表，None 表示活动工作表
+            stats: 统计字典，见 extract_compiled
+            details: 明细区块配置列表（见 CompiledPreset），明细行放在结果的
+                DETAILS_KEY 中
         
         Returns:
             提取的数据字典
         """
-        data = {"文件名": os.path.basename(file_path)}
+        preset = CompiledPreset.compile(
+            mappings, search_column, search_keyword, extra_searches, search_sheet, details
+        )
+        return self.extract_compiled(file_path, preset, engine, stats)
+    
+    def extract_compiled(self, file_path, preset, engine="standard", stats=None,
+                         content=None, memory_map=False, digest=False):
+        """
+        按编译后的预设从单个Excel文件中提取数据
+        
+        Args:
+            file_path: Excel文件路径
+            preset: CompiledPreset 实例
+            engine: 读取引擎，见 extract_data_from_file
+            stats: 统计字典，提供时写入文件大小（file_size）、打开耗时
+                （open_seconds）、映射读取耗时（read_seconds）、关键词搜索
+                耗时（scan_seconds）、总耗时（total_seconds）、扫描行数
+                （rows_scanned），失败时写入异常类型（error），xml 引擎
+                回退到openpyxl时写入回退原因（fallback）
+            content: 已读入内存的文件内容（见 prefetch_files），提供时从内存解析，
+                不再读取文件
+            memory_map: 未提供 content 时是否内存映射文件（见 map_file），
+                适合多个进程同时处理很大的工作簿
+            digest: 是否计算文件内容哈希（见 content_digest）并写入 stats 的
+                content_hash，供提取缓存使用；与解析共用同一次读取
+        
+        Returns:
+            提取的数据字典，失败时返回None
+        """
+        if stats is None:
+            stats = {}
+        started = time.perf_counter()
+        content, mapped = self._acquire_content(file_path, content, memory_map, digest)
+        if digest and content is not None:
+            stats["content_hash"] = content_digest(content)
         
         try:
-            wb = openpyxl.load_workbook(file_path, data_only=True)
-            ws = wb.active
+            data = self._extract_content(file_path, preset, engine, stats, content)
+        finally:
+            if mapped is not None:
+                mapped.close()
+        stats["total_seconds"] = time.perf_counter() - started
+        return data
+    
+    def extract_routed(self, file_path, router, engine="standard", stats=None,
+                       content=None, memory_map=False, digest=False):
+        """
+        识别文件的预设并按该预设提取（参数见 extract_compiled）
+        
+        文件只读取一次：识别和提取都从同一份读入（或映射）的内容中解析。
+        识别总是流式读取（见 preset_router.PROBE_ENGINE），engine 只用于提取。
+        
+        Args:
+            router: PresetRouter 实例
+        
+        Returns:
+            (预设名称, 提取的数据字典)；未识别时为 (None, None)，
+            提取失败时数据为None
+        """
+        if stats is None:
+            stats = {}
+        started = time.perf_counter()
+        content, mapped = self._acquire_content(file_path, content, memory_map, True)
+        if digest and content is not None:
+            stats["content_hash"] = content_digest(content)
+        
+        data = None
+        try:
+            preset_name = router.match(file_path, content)
+            if preset_name is not None:
+                data = self._extract_content(
+                    file_path, router.presets[preset_name], engine, stats, content
+                )
+        finally:
+            if mapped is not None:
+                mapped.close()
+        stats["total_seconds"] = time.perf_counter() - started
+        return preset_name, data
+    
+    def _acquire_content(self, file_path, content, memory_map, read):
+        """
+        未提供 content 时按需映射或读入文件
+        
+        Args:
+            read: 不映射（或无法映射）时是否读入整个文件；否则解析时按路径打开
+        
+        Returns:
+            (内容, 映射)，映射不为None时由调用方关闭；无法读取时内容为None，
+            解析时按路径打开并报告错误
+        """
+        mapped = None
+        if content is None and memory_map:
+            try:
+                content = mapped = map_file(file_path)
+            except (OSError, ValueError):
+                mapped = None
+        if read and content is None:
+            try:
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+            except OSError:
+                content = None
+        return content, mapped
+    
+    def _extract_content(self, file_path, preset, engine, stats, content):
+        """extract_compiled 的实现：按文件格式和引擎选择读取方式"""
+        if content is not None:
+            stats["file_size"] = len(content)
+        else:
+            try:
+                stats["file_size"] = os.path.getsize(file_path)
+            except OSError:
+                stats["file_size"] = None
+        
+        try:
+            file_format = detect_format(file_path, content)
+        except OSError:
+            file_format = None
+        
+        # 按文件头选择读取方式：.xls 不论引擎都使用 BIFF 读取器
+        if engine != "standard" or file_format == "xls":
+            return self._extract_streaming(
+                file_path, preset, engine, stats, file_format, content
+            )
+        return self._extract_loaded(file_path, preset, stats, content)
+    
+    def _extract_loaded(self, file_path, preset, stats, content=None):
+        """完整加载模式（standard）下的 extract_compiled 实现"""
+        try:
+            opened = time.perf_counter()
+            wb = self.load_workbook(file_path, "standard", content)
+            self._add_stats(stats, open_seconds=time.perf_counter() - opened)
+            values = {}
+            details = []
+            plan = self._plan_sheets(file_path, wb.sheetnames, wb.index(wb.active), preset)
+            
+            for sheet_index, sheet_plan in plan.items():
+                ws = wb[wb.sheetnames[sheet_index]]
+                read_started = time.perf_counter()
+                for (row, col), names in sheet_plan.targets.items():
+                    value = ws.cell(row=row, column=col).value
+                    for name in names:
+                        values[name] = value
+                self._add_stats(stats, read_seconds=time.perf_counter() - read_started)
+                
+                # 自动搜索并提取结算金额及额外关键词
+                values.update(self._search_parsed(ws, sheet_plan.searches, stats))
+                
+                if sheet_plan.blocks or sheet_plan.anchors:
+                    values.update(self._scan_rows(
+                        ws.iter_rows(max_col=sheet_plan.max_col, values_only=True),
+                        {}, (), blocks=sheet_plan.blocks, details=details,
+                        anchors=sheet_plan.anchors, lookback=sheet_plan.lookback
+                    ))
             
-            for mapping in mappings:
-                cell_ref = mapping['cell'].upper()
+            wb.close()
+            values[DETAILS_KEY] = details
+            return self._collect_data(file_path, preset, values)
+        
+        except Exception as e:
+            print(f"处理文件 {file_path} 失败: {e}")
+            stats["error"] = type(e).__name__
+            return None
+    
+    def _collect_data(self, file_path, preset, values):
+        """按映射和搜索项的顺序整理提取结果"""
+        data = {"文件名": os.path.basename(file_path)}
+        for name in preset.mapping_names:
+            value = values.get(name)
+            # 处理日期格式
+            if isinstance(value, datetime):
+                value = value.strftime("%Y-%m-%d")
+            data[name] = value
+        
+        for name in preset.search_names:
+            data[name] = values.get(name)
+        
+        if preset.detail_headers:
+            data[DETAILS_KEY] = values.get(DETAILS_KEY, [])
+        return data
+    
+    def _scan_sheets(self, file_path, sheet_names, active_index, preset, open_rows,
+                     stats=None):
+        """
+        逐个扫描用到的工作表，每个工作表单次遍历读取映射单元格并搜索关键词
+        
+        Args:
+            sheet_names: 工作簿中全部工作表名称
+            active_index: 活动工作表序号
+            preset: CompiledPreset 实例
+            open_rows: 函数 (工作表序号, 最大列) -> 从第1行开始的行值迭代器
+            stats: 统计字典，见 _scan_rows
+        
+        Returns:
+            {映射名称或搜索项名称: 值}，明细行在 DETAILS_KEY 中
+        """
+        values = {}
+        details = []
+        plan = self._plan_sheets(file_path, sheet_names, active_index, preset)
+        for sheet_index, sheet_plan in plan.items():
+            values.update(self._scan_rows(
+                open_rows(sheet_index, sheet_plan.max_col),
+                sheet_plan.rows, sheet_plan.searches, stats=stats,
+                blocks=sheet_plan.blocks, details=details,
+                anchors=sheet_plan.anchors, lookback=sheet_plan.lookback
+            ))
+        values[DETAILS_KEY] = details
+        return values
+    
+    def _extract_streaming(self, file_path, preset, engine="readonly", stats=None,
+                           file_format=None, content=None):
+        """流式模式（readonly / xml）及 .xls 文件的 extract_compiled 实现"""
+        if stats is None:
+            stats = {}
+        try:
+            values = None
+            if engine == "xml" or file_format == "xls":
                 try:
-                    value = ws[cell_ref].value
-                    # 处理日期格式
-                    if isinstance(value, datetime):
-                        value = value.strftime("%Y-%m-%d")
-                    data[mapping['name']] = value
+                    opened = time.perf_counter()
+                    reader = open_sheet_reader(file_path, file_format, content)
+                    self._add_stats(stats, open_seconds=time.perf_counter() - opened)
+                    try:
+                        values = self._scan_sheets(
+                            file_path, reader.sheet_names, reader.active_index, preset,
+                            lambda sheet_index, max_col: reader.iter_rows(
+                                max_col=max_col, sheet_index=sheet_index
+                            ),
+                            stats
+                        )
+                    finally:
+                        reader.close()
                 except Exception as e:
-                    print(f"读取单元格 {cell_ref} 失败: {e}")
-                    data[mapping['name']] = None
+                    if file_format == "xls":
+                        raise
+                    print(f"快速读取 {file_path} 失败，改用openpyxl读取: {e}")
+                    stats["fallback"] = type(e).__name__
             
-            # 自动搜索并提取结算金额
-            settlement_amount = self.find_settlement_amount(ws, search_column, search_keyword)
-            data["结算金额"] = settlement_amount
-            
-            wb.close()
-            return data
+            if values is None:
+                opened = time.perf_counter()
+                wb = self.load_workbook(file_path, "readonly", content)
+                self._add_stats(stats, open_seconds=time.perf_counter() - opened)
+                
+                def open_rows(sheet_index, max_col):
+                    ws = wb[wb.sheetnames[sheet_index]]
+                    ws.reset_dimensions()
+                    return ws.iter_rows(max_col=max_col, values_only=True)
+                
+                try:
+                    values = self._scan_sheets(
+                        file_path, wb.sheetnames, wb.index(wb.active), preset,
+                        open_rows, stats
+                    )
+                finally:
+                    wb.close()
             
+            return self._collect_data(file_path, preset, values)
+        
         except Exception as e:
             print(f"处理文件 {file_path} 失败: {e}")
+            stats["error"] = type(e).__name__
             return None
     
+    def iter_extracted(self, file_list, mappings, search_column="D",
+                       search_keyword="折后总计", parallel=False, workers=None,
+                       engine="standard", cache=None, cancel_event=None,
+                       extra_searches=None, search_sheet=None, report=None,
+                       details=None, prefetch=0, prefetch_bytes=PREFETCH_BYTES,
+                       memory_map=False):
+        """
+        按 file_list 的顺序逐个产出提取结果
+        
+        并行模式下由进程池解析工作簿，父进程按原始顺序收集结果，
+        同时只保留有限个在途任务，避免一次性提交全部文件。
+        提供缓存时，内容和预设都未变化的文件直接使用缓存结果，不再解析。
+        串行模式下可以开启预读：后台线程提前读取后续文件的内容，
+        读取（如网络共享上的文件）与解析同时进行。
+        
+        Args:
+            file_list: 要提取的文件路径列表
+            mappings: 映射配置列表
+            search_column: 搜索结算金额的列
+            search_keyword: 搜索的关键词
+            parallel: 是否使用多进程提取
+            workers: 进程数，默认为CPU核心数
+            engine: 读取引擎，见 load_workbook
+            cache: ExtractionCache 实例，None 表示不使用缓存
+            cancel_event: threading.Event，设置后不再开始处理新文件，
+                已在处理中的文件仍会产出
+            extra_searches: 额外的关键词搜索项列表
+            search_sheet: 搜索结算金额的工作表，None 表示活动工作表
+            report: RunReport 实例，提供时记录每个文件的提取统计
+            details: 明细区块配置列表（见 CompiledPreset）
+            prefetch: 串行模式下最多提前读取的文件数，0 表示不预读；
+                并行模式下各进程已同时读取文件，忽略此参数
+            prefetch_bytes: 预读内容占用内存的上限（字节）
+            memory_map: 是否内存映射打开文件（见 map_file），预读的文件已在
+                内存中，不再映射
+        
+        Yields:
+            (file_path, data) 元组，提取失败时 data 为 None
+        """
+        preset = CompiledPreset.compile(
+            mappings, search_column, search_keyword, extra_searches, search_sheet, details
+        )
+        yield from self.iter_compiled(
+            file_list, preset, parallel=parallel, workers=workers, engine=engine,
+            cache=cache, cancel_event=cancel_event, report=report,
+            prefetch=prefetch, prefetch_bytes=prefetch_bytes, memory_map=memory_map
+        )
+    
+    def iter_compiled(self, file_list, preset, parallel=False, workers=None,
+                      engine="standard", cache=None, cancel_event=None, report=None,
+                      prefetch=0, prefetch_bytes=PREFETCH_BYTES, memory_map=False):
+        """
+        按编译后的预设逐个产出提取结果（参数见 iter_extracted）
+        
+        并行模式下预设在进程池启动时传给每个子进程一次，任务中只包含文件路径。
+        """
+        def extract(file_path, content, key, stats):
+            return self.extract_compiled(
+                file_path, preset, engine, stats, content, memory_map,
+                digest=key is not None
+            )
+        
+        def remember(file_path, key, data, stats):
+            if stats is None:
+                # 使用缓存结果，未解析文件
+                stats = {"cached": True, "file_size": key[2]}
+            elif key is not None and data and stats.get("content_hash"):
+                cache.put(key, stats["content_hash"], data)
+            if report is not None:
+                report.add_file(file_path, stats)
+        
+        def task(file_path, key):
+            return (file_path, engine, memory_map, key is not None)
+        
+        try:
+            yield from self._iter_pipeline(
+                file_list, preset.fingerprint, cache, extract, remember,
+                _extract_in_worker, task, preset, None,
+                parallel, workers, cancel_event, prefetch, prefetch_bytes
+            )
+        finally:
+            if cache is not None:
+                cache.commit()
+    
+    def iter_routed(self, file_list, router, parallel=False, workers=None,
+                    engine="standard", cache=None, cancel_event=None, report=None,
+                    prefetch=0, prefetch_bytes=PREFETCH_BYTES, memory_map=False):
+        """
+        识别每个文件的预设并按该预设提取，按 file_list 的顺序逐个产出
+        
+        识别和提取在同一个任务中完成（见 extract_routed），文件只读取一次；
+        并行、预读、内存映射和缓存与 iter_compiled 相同。缓存按
+        PresetRouter.cache_fingerprint 保存识别结果和提取结果，只缓存
+        识别成功且提取成功的文件。
+        
+        Args:
+            router: PresetRouter 实例，其余参数见 iter_extracted
+        
+        Yields:
+            (file_path, 预设名称, data) 元组，未识别时预设名称为None，
+            提取失败时 data 为 None
+        """
+        def extract(file_path, content, key, stats):
+            return self.extract_routed(
+                file_path, router, engine, stats, content, memory_map,
+                digest=key is not None
+            )
+        
+        def remember(file_path, key, routed, stats):
+            if stats is None:
+                stats = {"cached": True, "file_size": key[2]}
+            elif key is not None and routed[1] and stats.get("content_hash"):
+                cache.put(
+                    key, stats["content_hash"], {"预设": routed[0], "数据": routed[1]}
+                )
+            if report is not None:
+                report.add_file(file_path, stats)
+        
+        def task(file_path, key):
+            return (file_path, engine, memory_map, key is not None)
+        
+        try:
+            routed = self._iter_pipeline(
+                file_list, router.cache_fingerprint, cache, extract, remember,
+                _route_in_worker, task, router, (None, None),
+                parallel, workers, cancel_event, prefetch, prefetch_bytes,
+                decode=lambda cached: (cached["预设"], cached["数据"])
+            )
+            for file_path, (preset_name, data) in routed:
+                yield file_path, preset_name, data
+        finally:
+            if cache is not None:
+                cache.commit()
+    
+    def _iter_pipeline(self, file_list, fingerprint, cache, extract, remember,
+                       worker, task, worker_arg, failed, parallel, workers,
+                       cancel_event, prefetch, prefetch_bytes, decode=None):
+        """
+        iter_compiled 和 iter_routed 共用的调度：查询缓存后串行（可预读）
+        或在进程池中提取，按 file_list 的顺序产出 (file_path, 结果)
+        
+        Args:
+            fingerprint: 缓存记录使用的指纹
+            cache: ExtractionCache 实例，None 时不使用缓存
+            extract: extract(file_path, content, 缓存键, 统计字典)，串行模式下
+                在当前进程中提取并返回结果
+            remember: remember(file_path, 缓存键, 结果, 统计字典)，产出每个
+                结果前调用（写入缓存、记录统计）；使用缓存结果时统计字典为None
+            worker: 并行模式下在子进程中执行的模块级函数，返回 (结果, 统计字典)
+            task: task(file_path, 缓存键)，生成传给 worker 的任务
+            worker_arg: 进程池启动时传给每个子进程一次的对象（见 _init_worker）
+            failed: 提取出错时的结果
+            decode: 将缓存的数据转换为结果，默认原样使用
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        
+        def lookup(file_path, content=None):
+            """
+            返回 (缓存键, 缓存结果)，不使用缓存或无法读取文件时均为None
+            
+            大小和修改时间与缓存记录一致时才计算内容哈希；未命中的文件
+            在提取时顺带计算（并行模式下在子进程中）。
+            """
+            if cache is None:
+                return None, None
+            
+            def digest():
+                if content is not None:
+                    return content_digest(content)
+                return file_digest(file_path)
+            
+            try:
+                key = cache.make_key(file_path, fingerprint)
+                cached = cache.get(key, digest)
+            except OSError:
+                return None, None
+            if cached is not None and decode is not None:
+                cached = decode(cached)
+            return key, cached
+        
+        def cancelled():
+            return cancel_event is not None and cancel_event.is_set()
+        
+        if not parallel or workers <= 1 or len(file_list) <= 1:
+            if prefetch > 0:
+                contents = prefetch_files(
+                    file_list, depth=prefetch, byte_budget=prefetch_bytes,
+                    cancel_event=cancel_event
+                )
+            else:
+                contents = ((file_path, None) for file_path in file_list)
+            for file_path, content in contents:
+                if cancelled():
+                    return
+                key, value = lookup(file_path, content)
+                stats = None
+                if value is None:
+                    stats = {}
+                    try:
+                        value = extract(file_path, content, key, stats)
+                    except Exception as e:
+                        print(f"处理文件 {file_path} 时出错: {e}")
+                        stats["error"] = type(e).__name__
+                        value = failed
+                remember(file_path, key, value, stats)
+                yield file_path, value
+            return
+        
+        workers = min(workers, len(file_list))
+        max_pending = workers * 4
+        tasks = iter(file_list)
+        pending = deque()
+        
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(worker_arg,)
+        ) as executor:
+            def submit_next():
+                if cancelled():
+                    return False
+                file_path = next(tasks, None)
+                if file_path is None:
+                    return False
+                key, value = lookup(file_path)
+                future = None
+                if value is None:
+                    future = executor.submit(worker, task(file_path, key))
+                pending.append((file_path, key, future, value))
+                return True
+            
+            while len(pending) < max_pending and submit_next():
+                pass
+            
+            while pending:
+                file_path, key, future, value = pending.popleft()
+                stats = None
+                if future is not None:
+                    try:
+                        value, stats = future.result()
+                    except Exception as e:
+                        print(f"处理文件 {file_path} 时出错: {e}")
+                        stats = {"error": type(e).__name__}
+                        value = failed
+                remember(file_path, key, value, stats)
+                submit_next()
+                yield file_path, value
+    
+    def find_duplicates(self, file_list):
+        """
+        查找内容完全相同的文件
+        
+        先按文件大小分组，只对大小相同的文件计算内容哈希，
+        大部分不重复的文件无需读取内容。
+        
+        Args:
+            file_list: 文件路径列表
+        
+        Returns:
+            {重复文件路径: 首个相同内容的文件路径} 字典
+        """
+        by_size = {}
+        for file_path in file_list:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                continue
+            by_size.setdefault(size, []).append(file_path)
+        
+        duplicates = {}
+        for candidates in by_size.values():
+            if len(candidates) < 2:
+                continue
+            first_by_hash = {}
+            for file_path in candidates:
+                try:
+                    digest = file_digest(file_path)
+                except OSError:
+                    continue
+                original = first_by_hash.setdefault(digest, file_path)
+                if original != file_path:
+                    duplicates[file_path] = original
+        return duplicates
+    
     def merge_bills(self, file_list, mappings, output_file, 
-                   search_column="D", search_keyword="折后总计"):
+                   search_column="D", search_keyword="折后总计",
+                   parallel=False, workers=None, engine="standard",
+                   streaming_output=False, keep_data=True, cache=None,
+                   duplicate_mode=None, progress_callback=None, cancel_event=None,
+                   extra_searches=None, search_sheet=None, output_format=None,
+                   aggregation=None, report=None, stats_sheet=False, details=None,
+                   prefetch=0, prefetch_bytes=PREFETCH_BYTES, memory_map=False):
         """
         合并多个账单文件
         
@@ -123,79 +2025,389 @@ class ExcelProcessor:
             output_file: 输出文件路径
             search_column: 搜索结算金额的列
             search_keyword: 搜索的关键词
+            parallel: 是否使用多进程并行提取（输出顺序与 file_list 一致）
+            workers: 并行进程数，默认为CPU核心数
+            engine: 读取引擎，"readonly" 为只读流式模式，"xml" 为直接解析XML
+            streaming_output: 是否以只写模式流式写出结果（内存占用不随文件数增长）
+            keep_data: 是否在结果的 "data"（ResultTable）中保留每行提取数据
+            cache: ExtractionCache 实例，提供时只解析新增或修改过的文件
+            duplicate_mode: 内容相同文件的处理方式，None 表示不检查；
+                "skip" 只输出首个文件，"flag" 每个文件都输出一行并在
+                "重复文件" 列标注首个文件，"merge" 只输出一行并在
+                "重复文件" 列列出其余文件。重复文件都只解析一次
+            progress_callback: 每处理完一个文件调用一次，
+                参数为 (已处理数, 总数, 文件路径)
+            cancel_event: threading.Event，设置后停止处理新文件，
+                已处理的结果仍会保存
+            extra_searches: 额外的关键词搜索项列表，每项的 name 作为输出列，
+                排在 "结算金额" 之后
+            search_sheet: 搜索结算金额的工作表，None 表示活动工作表
+            output_format: 输出格式 "xlsx"、"csv"（UTF-8 BOM）或 "parquet"
+                （需要pyarrow），None 时按输出文件扩展名选择；
+                各格式的列顺序相同，都是逐行写出
+            aggregation: 汇总配置（见 aggregation.Aggregator），提供时在合并
+                过程中同步累计，结束后写入 "汇总" 工作表（CSV/Parquet 为同名
+                附加文件），汇总表同时放在结果的 "summary" 中；"flag" 模式
+                标注的重复文件行不计入汇总
+            report: RunReport 实例，提供时记录每个文件的打开/读取/搜索耗时、
+                扫描行数、文件大小、异常类型，以及查找重复、提取、写出、
+                保存各阶段的耗时
+            stats_sheet: 是否在输出中添加 "运行统计" 工作表（未提供 report
+                时自动创建），报告同时放在结果的 "report" 中
+            details: 明细区块配置列表（见 CompiledPreset），每个文件的明细行
+                在同一次遍历中读取，逐行写入 "明细" 工作表（CSV/Parquet 为同名
+                附加文件），首列为文件名；keep_data 时同时放在结果的 "details" 中
+            prefetch: 串行模式下最多提前读取的文件数，0 表示不预读
+                （适合网络共享等读取较慢的文件夹，见 iter_extracted）
+            prefetch_bytes: 预读内容占用内存的上限（字节）
+            memory_map: 是否内存映射打开文件（见 map_file），适合多进程处理
+                很大的工作簿
         
         Returns:
             处理结果字典
         """
+        if duplicate_mode is not None and duplicate_mode not in DUPLICATE_MODES:
+            raise ValueError(f"未知的重复文件处理方式: {duplicate_mode}")
+        
         result = {
             "success": False,
             "success_count": 0,
             "error_count": 0,
             "message": "",
-            "data": []
+            "cached_count": 0,
+            "duplicate_count": 0,
+            "cancelled": False,
+            "failed_files": [],
+            "data": ResultTable()
         }
+        hits_before = cache.hits if cache is not None else 0
+        if report is None and stats_sheet:
+            report = RunReport()
+        if report is not None:
+            result["report"] = report
+            report.info.update({
+                "output": os.path.abspath(output_file),
+                "file_count": len(file_list),
+                "engine": engine,
+                "workers": (workers or os.cpu_count() or 1) if parallel else 1,
+                "prefetch": 0 if parallel else prefetch,
+                "memory_map": memory_map,
+            })
         
         try:
-            # 创建新的工作簿
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "合并结果"
-            
+            # 配置只编译一次：解析单元格引用、搜索列，生成表头
+            preset = CompiledPreset.compile(
+                mappings, search_column, search_keyword, extra_searches, search_sheet,
+                details
+            )
             # 写入表头（添加"结算金额"列）
-            headers = ["文件名"] + [m['name'] for m in mappings] + ["结算金额"]
-            for col_idx, header in enumerate(headers, start=1):
-                ws.cell(row=1, column=col_idx, value=header)
-                # 设置表头样式
-                cell = ws.cell(row=1, column=col_idx)
-                cell.font = openpyxl.styles.Font(bold=True)
-                cell.fill = openpyxl.styles.PatternFill(
-                    start_color="CCE5FF",
-                    end_color="CCE5FF",
-                    fill_type="solid"
+            headers = list(preset.headers)
+            if duplicate_mode in ("flag", "merge"):
+                headers.append("重复文件")
+            aggregator = Aggregator(aggregation) if aggregation else None
+            writer = create_result_writer(
+                output_file, headers, output_format, write_only=streaming_output
+            )
+            table = result["data"] = ResultTable(headers)
+            detail_sheet = None
+            if preset.detail_headers:
+                detail_headers = ["文件名", "明细"] + list(preset.detail_headers)
+                detail_sheet = writer.open_sheet("明细", detail_headers)
+                detail_table = result["details"] = ResultTable(detail_headers)
+            
+            # 重复文件只解析首个
+            duplicates = {}
+            if duplicate_mode:
+                with _report_stage(report, "查找重复"):
+                    duplicates = self.find_duplicates(file_list)
+            result["duplicate_count"] = len(duplicates)
+            unique_files = [f for f in file_list if f not in duplicates]
+            
+            # 处理每个文件，提取一行即写入一行
+            extracted = self.iter_compiled(
+                unique_files, preset, parallel=parallel, workers=workers,
+                engine=engine, cache=cache, cancel_event=cancel_event, report=report,
+                prefetch=prefetch, prefetch_bytes=prefetch_bytes, memory_map=memory_map
+            )
+            if duplicates:
+                extracted = self._apply_duplicates(
+                    file_list, duplicates, duplicate_mode, extracted
                 )
+            if duplicate_mode == "flag":
+                total = len(file_list)
+            else:
+                total = len(unique_files)
             
-            # 处理每个文件
-            current_row = 2
-            for file_path in file_list:
-                try:
-                    data = self.extract_data_from_file(
-                        file_path, mappings, search_column, search_keyword
-                    )
-                    
-                    if data:
-                        # 写入数据行
-                        for col_idx, header in enumerate(headers, start=1):
-                            value = data.get(header)
-                            ws.cell(row=current_row, column=col_idx, value=value)
-                        
-                        current_row += 1
-                        result["success_count"] += 1
-                        result["data"].append(data)
-                    else:
-                        result["error_count"] += 1
-                        
-                except Exception as e:
-                    print(f"处理文件 {file_path} 时出错: {e}")
+            processed = 0
+            extract_seconds = 0.0
+            waiting = time.perf_counter()
+            for file_path, data in extracted:
+                extract_seconds += time.perf_counter() - waiting
+                if data:
+                    values = [data.get(header) for header in headers]
+                    with _report_stage(report, "写出"):
+                        writer.write_row(values)
+                        if detail_sheet is not None:
+                            for detail in data.get(DETAILS_KEY) or ():
+                                detail_values = [data["文件名"]] + detail
+                                detail_sheet.write_row(detail_values)
+                                if keep_data:
+                                    detail_table.append(detail_values)
+                    result["success_count"] += 1
+                    if keep_data:
+                        table.append(values)
+                    # flag 模式下标注的重复文件与首个文件是同一份账单，不重复计入汇总
+                    if aggregator is not None and not (
+                            duplicate_mode == "flag" and data.get("重复文件")):
+                        aggregator.add(data)
+                else:
                     result["error_count"] += 1
+                    result["failed_files"].append(file_path)
+                
+                processed += 1
+                if progress_callback is not None:
+                    progress_callback(processed, total, file_path)
+                waiting = time.perf_counter()
             
-            # 自动调整列宽
-            for col_idx in range(1, len(headers) + 1):
-                ws.column_dimensions[get_column_letter(col_idx)].width = 15
+            # 提取耗时是等待下一个结果的时间，分散在各次循环之间，只能直接累计
+            if report is not None:
+                report.add_stage("提取", extract_seconds)
             
-            # 保存结果
-            wb.save(output_file)
-            wb.close()
+            if aggregator is not None:
+                summary = result["summary"] = aggregator.to_table()
+                writer.write_sheet("汇总", summary.headers, summary.rows())
+            
+            if stats_sheet:
+                stats_headers, stats_rows = report.sheet_rows()
+                writer.write_sheet("运行统计", stats_headers, stats_rows)
+            
+            # 保存结果（取消时保存已处理的部分）
+            with _report_stage(report, "保存"):
+                writer.close()
+            if cache is not None:
+                result["cached_count"] = cache.hits - hits_before
             
             result["success"] = True
-            result["message"] = "合并完成"
+            if cancel_event is not None and cancel_event.is_set() and processed < total:
+                result["cancelled"] = True
+                result["message"] = f"已取消，已保存处理完成的 {processed} 个文件"
+            else:
+                result["message"] = "合并完成"
+        
+        except Exception as e:
+            result["success"] = False
+            result["message"] = str(e)
+        
+        if report is not None:
+            report.finish()
+        return result
+    
+    def merge_by_preset(self, file_list, router, output_file, parallel=False,
+                        workers=None, engine="standard", streaming_output=False,
+                        keep_data=True, cache=None, progress_callback=None,
+                        cancel_event=None, output_format=None, report=None,
+                        prefetch=0, prefetch_bytes=PREFETCH_BYTES, memory_map=False):
+        """
+        自动识别每个文件的预设并合并，每个预设的结果写入单独的工作表
+        
+        按模板特征（见 preset_router.PresetRouter）为每个文件选择预设，
+        识别和提取在同一个任务中完成，文件只读取一次（见 iter_routed），
+        并行、预读和内存映射同样用于识别。第一个工作表 "识别结果" 列出
+        每个文件识别到的预设，之后按首次识别到的顺序每个预设一个工作表
+        （CSV/Parquet 为同名附加文件），有明细区块的预设另有 "<预设>_明细"
+        工作表。未识别的文件计入失败。其余参数见 merge_bills。
+        
+        Args:
+            router: PresetRouter 实例，提供识别方法和编译后的预设
+        
+        Returns:
+            处理结果字典，"data" 为 {预设名称: ResultTable}，"routes" 为
+            识别结果表，"preset_counts" 为 {预设名称: 文件数}，
+            "unmatched_files" 为未识别的文件
+        """
+        result = {
+            "success": False,
+            "success_count": 0,
+            "error_count": 0,
+            "message": "",
+            "cached_count": 0,
+            "cancelled": False,
+            "failed_files": [],
+            "unmatched_files": [],
+            "preset_counts": {},
+            "data": {}
+        }
+        hits_before = cache.hits if cache is not None else 0
+        if report is not None:
+            result["report"] = report
+            report.info.update({
+                "output": os.path.abspath(output_file),
+                "file_count": len(file_list),
+                "engine": engine,
+                "workers": (workers or os.cpu_count() or 1) if parallel else 1,
+                "prefetch": 0 if parallel else prefetch,
+                "memory_map": memory_map,
+            })
+        
+        try:
+            writer = create_result_writer(
+                output_file, ["文件名", "预设"], output_format,
+                write_only=streaming_output, sheet_title="识别结果"
+            )
+            routes = result["routes"] = ResultTable(["文件名", "预设"])
+            
+            total = len(file_list)
+            processed = 0
+            titles = {"识别结果"}
+            # {预设名称: (结果工作表, 明细工作表或None)}，识别到第一个文件时创建
+            sheets = {}
+            extract_seconds = 0.0
+            
+            extracted = self.iter_routed(
+                file_list, router, parallel=parallel, workers=workers, engine=engine,
+                cache=cache, cancel_event=cancel_event, report=report,
+                prefetch=prefetch, prefetch_bytes=prefetch_bytes, memory_map=memory_map
+            )
+            waiting = time.perf_counter()
+            for file_path, preset_name, data in extracted:
+                extract_seconds += time.perf_counter() - waiting
+                with _report_stage(report, "写出"):
+                    row = [os.path.basename(file_path), preset_name or UNMATCHED]
+                    writer.write_row(row)
+                    routes.append(row)
+                    
+                    if preset_name is None:
+                        result["unmatched_files"].append(file_path)
+                        result["failed_files"].append(file_path)
+                        result["error_count"] += 1
+                    else:
+                        counts = result["preset_counts"]
+                        counts[preset_name] = counts.get(preset_name, 0) + 1
+                        preset = router.presets[preset_name]
+                        if preset_name not in sheets:
+                            title = self._sheet_title(preset_name, titles)
+                            headers = list(preset.headers)
+                            sheet = writer.open_sheet(title, headers)
+                            result["data"][preset_name] = ResultTable(headers)
+                            detail_sheet = None
+                            if preset.detail_headers:
+                                detail_headers = ["文件名", "明细"] + list(preset.detail_headers)
+                                detail_sheet = writer.open_sheet(
+                                    self._sheet_title(f"{title}_明细", titles), detail_headers
+                                )
+                            sheets[preset_name] = (sheet, detail_sheet)
+                        sheet, detail_sheet = sheets[preset_name]
+                    
+                        if data:
+                            values = [data.get(header) for header in preset.headers]
+                            sheet.write_row(values)
+                            if detail_sheet is not None:
+                                for detail in data.get(DETAILS_KEY) or ():
+                                    detail_sheet.write_row([data["文件名"]] + detail)
+                            result["success_count"] += 1
+                            if keep_data:
+                                result["data"][preset_name].append(values)
+                        else:
+                            result["error_count"] += 1
+                            result["failed_files"].append(file_path)
+                
+                processed += 1
+                if progress_callback is not None:
+                    progress_callback(processed, total, file_path)
+                waiting = time.perf_counter()
             
+            if report is not None:
+                report.add_stage("识别和提取", extract_seconds)
+            
+            with _report_stage(report, "保存"):
+                writer.close()
+            if cache is not None:
+                result["cached_count"] = cache.hits - hits_before
+            
+            result["success"] = True
+            if cancel_event is not None and cancel_event.is_set() and processed < total:
+                result["cancelled"] = True
+                result["message"] = f"已取消，已保存处理完成的 {processed} 个文件"
+            else:
+                result["message"] = "合并完成"
+        
         except Exception as e:
             result["success"] = False
             result["message"] = str(e)
         
+        if report is not None:
+            report.finish()
         return result
     
-    def preview_file(self, file_path, max_rows=10, max_cols=10):
+    def _sheet_title(self, name, used):
+        """
+        将预设名称转换为有效且不重复的工作表名称
+        
+        Args:
+            name: 预设名称
+            used: 已使用的工作表名称集合，新名称会加入其中
+        """
+        title = "".join("_" if char in INVALID_TITLE_CHARS else char for char in name)
+        title = title[:MAX_TITLE_LENGTH] or "预设"
+        suffix = 1
+        candidate = title
+        while candidate.lower() in used:
+            suffix += 1
+            tail = f"_{suffix}"
+            candidate = title[:MAX_TITLE_LENGTH - len(tail)] + tail
+        used.add(candidate.lower())
+        return candidate
+    
+    def _apply_duplicates(self, file_list, duplicates, duplicate_mode, extracted):
+        """
+        将去重后的提取结果还原为按 duplicate_mode 输出的行
+        
+        Args:
+            file_list: 原始文件列表
+            duplicates: find_duplicates 的返回值
+            duplicate_mode: "skip" / "flag" / "merge"
+            extracted: 对去重后文件列表的 iter_extracted 迭代器
+        
+        Yields:
+            (file_path, data) 元组
+        """
+        if duplicate_mode == "skip":
+            yield from extracted
+            return
+        
+        if duplicate_mode == "merge":
+            copies = {}
+            for file_path, original in duplicates.items():
+                copies.setdefault(original, []).append(os.path.basename(file_path))
+            for file_path, data in extracted:
+                if data:
+                    data["重复文件"] = "; ".join(copies.get(file_path, []))
+                yield file_path, data
+            return
+        
+        # flag：按原始顺序输出每个文件，重复文件复用首个文件的提取结果
+        originals = set(duplicates.values())
+        original_data = {}
+        for file_path in file_list:
+            original = duplicates.get(file_path)
+            if original is None:
+                item = next(extracted, None)
+                if item is None:
+                    # 提取被取消
+                    return
+                file_path, data = item
+                if file_path in originals:
+                    original_data[file_path] = data
+                yield file_path, data
+            else:
+                data = original_data.get(original)
+                if data:
+                    data = dict(data)
+                    data["文件名"] = os.path.basename(file_path)
+                    data["重复文件"] = os.path.basename(original)
+                yield file_path, data
+    
+    def preview_file(self, file_path, max_rows=10, max_cols=10, engine="standard"):
         """
         预览Excel文件内容
         
@@ -203,12 +2415,16 @@ class ExcelProcessor:
             file_path: Excel文件路径
             max_rows: 最大行数
             max_cols: 最大列数
+            engine: 读取引擎，非 "standard" 时只解析预览范围内的行
         
         Returns:
             二维数组表示的预览数据
         """
+        if engine != "standard":
+            return self._preview_streaming(file_path, max_rows, max_cols)
+        
         try:
-            wb = openpyxl.load_workbook(file_path, data_only=True)
+            wb = self.load_workbook(file_path, engine)
             ws = wb.active
             
             preview_data = []
@@ -224,7 +2440,60 @@ class ExcelProcessor:
             
             wb.close()
             return preview_data
+        
+        except Exception as e:
+            print(f"预览文件 {file_path} 失败: {e}")
+            return None
+    
+    def open_preview(self, file_path):
+        """
+        打开按需分块读取的预览数据源（用于可滚动的大表预览）
+        
+        Args:
+            file_path: Excel文件路径
+        
+        Returns:
+            PreviewSource 对象，打开失败时返回None
+        """
+        try:
+            source = PreviewSource(file_path)
+            # 预读第一块，尽早发现无法读取的文件
+            source.get_rows(1, 1)
+            return source
+        except Exception as e:
+            print(f"预览文件 {file_path} 失败: {e}")
+            return None
+    
+    def _preview_streaming(self, file_path, max_rows, max_cols):
+        """只读流式模式下的 preview_file 实现"""
+        try:
+            wb = self.load_workbook(file_path, "readonly")
+            try:
+                rows = list(wb.active.iter_rows(
+                    max_row=max_rows, max_col=max_cols, values_only=True
+                ))
+            finally:
+                wb.close()
             
+            # 去掉末尾的空行和空列，与完整加载时的表格范围保持一致
+            while rows and all(value is None for value in rows[-1]):
+                rows.pop()
+            width = max(
+                (idx + 1 for row in rows for idx, value in enumerate(row)
+                 if value is not None),
+                default=0
+            )
+            
+            preview_data = []
+            for row in rows:
+                row_data = []
+                for value in list(row[:width]) + [None] * (width - len(row)):
+                    if isinstance(value, datetime):
+                        value = value.strftime("%Y-%m-%d")
+                    row_data.append(value if value is not None else "")
+                preview_data.append(row_data)
+            return preview_data
+        
         except Exception as e:
             print(f"预览文件 {file_path} 失败: {e}")
             return None
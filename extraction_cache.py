@@ -0,0 +1,242 @@
+"""
+提取缓存 - 在磁盘上保存每个文件的提取结果，重复合并时只解析新增或修改的文件
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+
+# 缓存格式版本，提取结果的结构变化时递增，使旧缓存全部失效
+CACHE_VERSION = 1
+
+# 缓存数据的编码版本，编码方式变化时递增，打开缓存时清空旧记录
+# （与 CACHE_VERSION 分开：预设指纹也用于监视文件夹的状态文件，不随之变化）
+DATA_FORMAT = 2
+
+# 带类型标记的值中保存类型名的键
+TYPE_KEY = "__cache_type__"
+
+
+def preset_fingerprint(mappings, search_column="D", search_keyword="折后总计",
+                       extra_searches=None, search_sheet=None, details=None):
+    """
+    计算预设中影响提取结果部分的指纹
+    
+    只包含映射（单元格或定位关键词）、搜索列、关键词、工作表和明细区块，
+    修改说明或重命名预设不会改变指纹。
+    
+    Args:
+        mappings: 映射配置列表
+        search_column: 搜索结算金额的列
+        search_keyword: 搜索的关键词
+        extra_searches: 额外的关键词搜索项列表
+        search_sheet: 搜索结算金额的工作表
+        details: 明细区块配置列表
+    
+    Returns:
+        十六进制指纹字符串
+    """
+    payload = {
+        "version": CACHE_VERSION,
+        "mappings": [_mapping_payload(m) for m in mappings],
+        "search_column": str(search_column).upper(),
+        "search_keyword": search_keyword,
+        "search_sheet": search_sheet or None,
+        "extra_searches": [
+            {
+                "name": item.get("name"),
+                "column": str(item.get("column", "")).upper(),
+                "keyword": item.get("keyword"),
+                "sheet": item.get("sheet") or None,
+            }
+            for item in extra_searches or []
+        ],
+    }
+    if details:
+        # 没有明细区块时不加入，已有的缓存保持有效
+        payload["details"] = details
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _mapping_payload(mapping):
+    """映射中影响提取结果的部分；按关键词定位的映射才加入 anchor 和 offset"""
+    payload = {
+        "name": mapping.get("name"),
+        "cell": str(mapping.get("cell", "")).upper(),
+        "sheet": mapping.get("sheet") or None,
+    }
+    if mapping.get("anchor"):
+        payload["anchor"] = mapping["anchor"]
+        payload["offset"] = mapping.get("offset")
+    return payload
+
+
+def _encode_value(value):
+    """JSON不支持的值：日期时间类型带类型标记保存，其他转换为字符串"""
+    if isinstance(value, datetime):
+        return {TYPE_KEY: "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {TYPE_KEY: "date", "value": value.isoformat()}
+    if isinstance(value, dt_time):
+        return {TYPE_KEY: "time", "value": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {TYPE_KEY: "timedelta", "value": [value.days, value.seconds, value.microseconds]}
+    return str(value)
+
+
+def _decode_value(obj):
+    """还原 _encode_value 标记的值，使缓存结果与重新解析的结果相同"""
+    kind = obj.get(TYPE_KEY)
+    if kind is None:
+        return obj
+    value = obj["value"]
+    if kind == "datetime":
+        return datetime.fromisoformat(value)
+    if kind == "date":
+        return date.fromisoformat(value)
+    if kind == "time":
+        return dt_time.fromisoformat(value)
+    if kind == "timedelta":
+        return timedelta(*value)
+    return obj
+
+
+class ExtractionCache:
+    """
+    基于SQLite的提取结果缓存
+    
+    每条记录以 (绝对路径, 预设指纹) 为主键，命中时还需文件大小、
+    修改时间和内容哈希全部一致；大小或修改时间不一致时不计算内容哈希。
+    缓存总大小超过 max_bytes 时按最近使用时间淘汰旧记录。
+    """
+    
+    def __init__(self, cache_file="extraction_cache.db", max_bytes=64 * 1024 * 1024):
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # 合并可能在后台线程中执行，同一时间只有一个线程访问连接
+        self.conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT NOT NULL,
+                preset TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                data TEXT NOT NULL,
+                data_size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (path, preset)
+            )
+            """
+        )
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != DATA_FORMAT:
+            # 旧编码的记录（如日期保存为字符串）与重新解析的结果不同
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute(f"PRAGMA user_version = {DATA_FORMAT}")
+        self.conn.commit()
+    
+    def make_key(self, file_path, fingerprint):
+        """
+        生成缓存键
+        
+        Args:
+            file_path: 文件路径
+            fingerprint: preset_fingerprint 计算的预设指纹
+        
+        Returns:
+            (绝对路径, 预设指纹, 大小, 修改时间ns) 元组
+        """
+        stat = os.stat(file_path)
+        return (
+            os.path.abspath(file_path), fingerprint, stat.st_size, stat.st_mtime_ns
+        )
+    
+    def get(self, key, digest):
+        """
+        查询缓存，未命中返回None
+        
+        Args:
+            key: make_key 生成的缓存键
+            digest: 计算文件内容哈希的函数（无参数），只在记录的大小和
+                修改时间与文件一致时调用，新增或已修改的文件不读取内容
+        """
+        path, preset, size, mtime_ns = key
+        row = self.conn.execute(
+            "SELECT data, size, mtime_ns, content_hash FROM entries "
+            "WHERE path = ? AND preset = ?",
+            (path, preset)
+        ).fetchone()
+        
+        if row is None or tuple(row[1:3]) != (size, mtime_ns) or row[3] != digest():
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE entries SET last_used = ? WHERE path = ? AND preset = ?",
+            (time.time(), path, preset)
+        )
+        return json.loads(row[0], object_hook=_decode_value)
+    
+    def put(self, key, content_hash, data):
+        """写入缓存（同一文件同一预设只保留最新一条）"""
+        path, preset, size, mtime_ns = key
+        text = json.dumps(data, ensure_ascii=False, default=_encode_value)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, preset, size, mtime_ns, content_hash,
+             text, len(text.encode("utf-8")), time.time())
+        )
+    
+    def invalidate_preset(self, fingerprint):
+        """删除某个预设指纹下的全部缓存"""
+        self.conn.execute("DELETE FROM entries WHERE preset = ?", (fingerprint,))
+        self.conn.commit()
+    
+    def clear(self):
+        """清空缓存"""
+        self.conn.execute("DELETE FROM entries")
+        self.conn.commit()
+    
+    def total_bytes(self):
+        """缓存数据的总大小（字节）"""
+        row = self.conn.execute("SELECT COALESCE(SUM(data_size), 0) FROM entries").fetchone()
+        return row[0]
+    
+    def evict(self):
+        """按最近使用时间淘汰记录，直到总大小不超过 max_bytes"""
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        
+        removed = 0
+        rows = self.conn.execute(
+            "SELECT path, preset, data_size FROM entries ORDER BY last_used"
+        ).fetchall()
+        for path, preset, data_size in rows:
+            if excess <= 0:
+                break
+            self.conn.execute(
+                "DELETE FROM entries WHERE path = ? AND preset = ?", (path, preset)
+            )
+            excess -= data_size
+            removed += 1
+        self.conn.commit()
+        return removed
+    
+    def commit(self):
+        """提交未保存的写入"""
+        self.conn.commit()
+    
+    def close(self):
+        """淘汰超出大小限制的记录并关闭数据库"""
+        self.evict()
+        self.conn.commit()
+        self.conn.close()
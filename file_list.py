@@ -0,0 +1,262 @@
+"""
+文件列表 - 主界面的待合并文件列表（有序集合、文件夹扫描和虚拟化列表控件）
+
+Excel扩展名和文件夹扫描也供命令行和监视文件夹使用
+"""
+import os
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+
+
+class FileList:
+    """
+    保持添加顺序、成员判断为O(1)的文件路径集合
+    
+    支持按下标访问，供列表控件按可见行取文件名。
+    """
+    
+    def __init__(self):
+        self._paths = []
+        self._members = set()
+    
+    def add_many(self, paths):
+        """
+        追加多个文件，已存在的跳过
+        
+        Returns:
+            实际新增的文件数
+        """
+        added = 0
+        for path in paths:
+            if path not in self._members:
+                self._members.add(path)
+                self._paths.append(path)
+                added += 1
+        return added
+    
+    def remove_indices(self, indices):
+        """按下标移除多个文件（一次重建，不逐个删除）"""
+        removed = set(indices)
+        kept = [path for idx, path in enumerate(self._paths) if idx not in removed]
+        self._paths = kept
+        self._members = set(kept)
+    
+    def clear(self):
+        """清空"""
+        self._paths = []
+        self._members = set()
+    
+    def __contains__(self, path):
+        return path in self._members
+    
+    def __getitem__(self, index):
+        return self._paths[index]
+    
+    def __iter__(self):
+        return iter(self._paths)
+    
+    def __len__(self):
+        return len(self._paths)
+
+
+def iter_excel_files(folder, recursive=True, cancel_event=None):
+    """
+    用 os.scandir 扫描文件夹中的Excel文件
+    
+    同一目录中的条目按名称排序，先产出当前目录的文件，再按名称顺序进入
+    子目录，结果顺序稳定。跳过Excel打开文件时生成的 "~$" 锁文件。
+    
+    Args:
+        folder: 文件夹路径
+        recursive: 是否扫描子文件夹
+        cancel_event: threading.Event，设置后停止扫描
+    
+    Yields:
+        os.DirEntry，需要大小和修改时间时用 entry.stat()，不必再次访问磁盘
+    """
+    stack = [folder]
+    while stack:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        subdirs.append(entry.path)
+                elif (entry.name.lower().endswith(EXCEL_EXTENSIONS)
+                        and not entry.name.startswith("~$") and entry.is_file()):
+                    yield entry
+            except OSError:
+                continue
+        # 逆序入栈，按名称顺序处理子目录
+        stack.extend(reversed(subdirs))
+
+
+def scan_excel_files(folder, batch_size=500, cancel_event=None):
+    """
+    递归扫描文件夹中的Excel文件，分批产出（顺序同 iter_excel_files）
+    
+    Args:
+        folder: 文件夹路径
+        batch_size: 每批的文件数
+        cancel_event: threading.Event，设置后停止扫描
+    
+    Yields:
+        文件路径列表
+    """
+    batch = []
+    for entry in iter_excel_files(folder, cancel_event=cancel_event):
+        batch.append(entry.path)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch and not (cancel_event is not None and cancel_event.is_set()):
+        yield batch
+
+
+class FileListView:
+    """
+    虚拟化的文件列表控件
+    
+    只绘制可见的行，列表有上万个文件时也不会创建大量条目。
+    选择方式与 Listbox 的 EXTENDED 模式一致：单击选中、
+    Ctrl+单击增减、Shift+单击选择范围、Ctrl+A 全选。
+    """
+    
+    def __init__(self, parent, file_list, font=("微软雅黑", 9)):
+        self.file_list = file_list
+        self.selected = set()
+        self.anchor = None
+        self.top = 0
+        
+        self.font = tkfont.Font(font=font)
+        self.row_height = self.font.metrics("linespace") + 4
+        
+        self.frame = ttk.Frame(parent)
+        self.scrollbar = ttk.Scrollbar(self.frame, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(
+            self.frame, background="white", highlightthickness=1,
+            highlightbackground="#B0B0B0", takefocus=True
+        )
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        self.canvas.bind('<Configure>', lambda e: self.redraw())
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.canvas.bind('<Control-Button-1>', lambda e: self.on_click(e, toggle=True))
+        self.canvas.bind('<Shift-Button-1>', lambda e: self.on_click(e, extend=True))
+        self.canvas.bind('<Control-a>', lambda e: self.select_all())
+        self.canvas.bind('<MouseWheel>', lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.canvas.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll(3))
+    
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+    
+    def visible_rows(self):
+        """当前可以显示的行数"""
+        return max(self.canvas.winfo_height() // self.row_height, 1)
+    
+    def _clamp_top(self):
+        """首行不超过最后一屏"""
+        self.top = max(min(self.top, len(self.file_list) - self.visible_rows()), 0)
+    
+    def redraw(self):
+        """重新绘制可见的行"""
+        canvas = self.canvas
+        canvas.delete("all")
+        self._clamp_top()
+        rows = self.visible_rows()
+        width = canvas.winfo_width()
+        total = len(self.file_list)
+        
+        for i in range(self.top, min(self.top + rows + 1, total)):
+            y = (i - self.top) * self.row_height
+            if i in self.selected:
+                canvas.create_rectangle(
+                    0, y, width, y + self.row_height, fill="#0078D7", outline=""
+                )
+            canvas.create_text(
+                4, y + self.row_height // 2,
+                text=os.path.basename(self.file_list[i]),
+                anchor=tk.W,
+                font=self.font,
+                fill="white" if i in self.selected else "black"
+            )
+        
+        if total:
+            self.scrollbar.set(self.top / total, min((self.top + rows) / total, 1.0))
+        else:
+            self.scrollbar.set(0, 1)
+    
+    def refresh(self):
+        """列表内容变化后调用：去掉失效的选中项并重绘"""
+        total = len(self.file_list)
+        self.selected = {i for i in self.selected if i < total}
+        if self.anchor is not None and self.anchor >= total:
+            self.anchor = None
+        self.redraw()
+    
+    def yview(self, *args):
+        """滚动条命令"""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.file_list))
+        else:
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= max(self.visible_rows() - 1, 1)
+            self.top += amount
+        self.redraw()
+    
+    def scroll(self, rows):
+        """滚动若干行"""
+        self.top += rows
+        self.redraw()
+    
+    def on_click(self, event, toggle=False, extend=False):
+        """点击选择"""
+        self.canvas.focus_set()
+        index = self.top + event.y // self.row_height
+        if index >= len(self.file_list):
+            if not toggle and not extend:
+                self.selected.clear()
+                self.redraw()
+            return
+        
+        if extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selected = set(range(low, high + 1))
+        elif toggle:
+            self.selected ^= {index}
+            self.anchor = index
+        else:
+            self.selected = {index}
+            self.anchor = index
+        self.redraw()
+    
+    def select_all(self):
+        """全选"""
+        self.selected = set(range(len(self.file_list)))
+        self.redraw()
+        return "break"
+    
+    def curselection(self):
+        """选中行的下标（升序元组，与 Listbox.curselection 相同）"""
+        return tuple(sorted(self.selected))
+    
+    def clear_selection(self):
+        """取消全部选择"""
+        self.selected.clear()
+        self.anchor = None
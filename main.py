@@ -5,10 +5,20 @@ Excel账单合并工具 - 主程序
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
+import multiprocessing
+import queue
+import threading
+import time
 from pathlib import Path
 from config_manager import ConfigManager
 from excel_processor import ExcelProcessor
 from config_editor import ConfigEditor
+from file_list import EXCEL_EXTENSIONS, FileList, FileListView, scan_excel_files
+from prefetch import PREFETCH_DEPTH
+
+
+# 预设列表中的自动识别选项：按预设的识别条件为每个文件选择预设
+AUTO_PRESET = "（自动识别预设）"
 
 
 class MergeBillApp:
@@ -22,14 +32,16 @@ class MergeBillApp:
         self.config_manager = ConfigManager()
         self.excel_processor = ExcelProcessor()
         
-        # 存储拖入的文件
-        self.file_list = []
+        # 存储拖入的文件（有序集合，按添加顺序保存）
+        self.file_list = FileList()
+        # 后台扫描文件夹时的结果队列
+        self.scan_queue = None
         
         self.setup_ui()
         
         # 尝试支持拖拽（如果可用）
         self.setup_drag_drop()
-        
+    
     def setup_drag_drop(self):
         """尝试设置拖拽功能（可选）"""
         try:
@@ -39,7 +51,7 @@ class MergeBillApp:
         except:
             # 如果tkinterdnd2不可用，仅使用按钮方式
             pass
-        
+    
     def setup_ui(self):
         """设置用户界面"""
         # 顶部工具栏
@@ -70,21 +82,9 @@ class MergeBillApp:
         file_frame = ttk.LabelFrame(self.root, text="文件列表", padding=10)
         file_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # 文件列表框和滚动条
-        list_container = ttk.Frame(file_frame)
-        list_container.pack(fill=tk.BOTH, expand=True)
-        
-        scrollbar = ttk.Scrollbar(list_container)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        self.file_listbox = tk.Listbox(
-            list_container,
-            yscrollcommand=scrollbar.set,
-            selectmode=tk.EXTENDED,
-            font=("微软雅黑", 9)
-        )
-        self.file_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.config(command=self.file_listbox.yview)
+        # 文件列表（只绘制可见行，支持上万个文件）
+        self.file_listbox = FileListView(file_frame, self.file_list, font=("微软雅黑", 9))
+        self.file_listbox.pack(fill=tk.BOTH, expand=True)
         
         # 用于拖拽的引用
         self.drop_frame = file_frame
@@ -145,10 +145,12 @@ class MergeBillApp:
             start_button.configure(style='Start.TButton')
         except:
             pass
-        
+    
     def update_preset_list(self):
         """更新预设列表"""
         presets = self.config_manager.get_preset_names()
+        if self.config_manager.get_routed_preset_names():
+            presets.append(AUTO_PRESET)
         self.preset_combo['values'] = presets
         if presets:
             self.preset_combo.current(0)
@@ -178,47 +180,79 @@ class MergeBillApp:
             file_path = match[0] if match[0] else match[1]
             if file_path and os.path.isfile(file_path):
                 # 只接受Excel文件
-                if file_path.lower().endswith(('.xlsx', '.xls')):
+                if file_path.lower().endswith(EXCEL_EXTENSIONS):
                     files.append(file_path)
         
         return files
     
     def add_files(self, files):
-        """添加文件到列表"""
-        added_count = 0
-        for file_path in files:
-            if file_path not in self.file_list:
-                self.file_list.append(file_path)
-                self.file_listbox.insert(tk.END, os.path.basename(file_path))
-                added_count += 1
+        """添加文件到列表，返回新增的文件数"""
+        added_count = self.file_list.add_many(files)
         
         if added_count > 0:
+            self.file_listbox.refresh()
             self.update_file_count()
-            
+        return added_count
+    
     def browse_files(self):
         """浏览选择文件"""
         files = filedialog.askopenfilenames(
             title="选择Excel文件（可多选）",
-            filetypes=[("Excel文件", "*.xlsx *.xls"), ("所有文件", "*.*")]
+            filetypes=[
+                ("Excel文件", " ".join("*" + ext for ext in EXCEL_EXTENSIONS)),
+                ("所有文件", "*.*")
+            ]
         )
         if files:
             self.add_files(list(files))
     
     def browse_folder(self):
-        """浏览选择文件夹，自动添加所有Excel文件"""
+        """浏览选择文件夹，在后台扫描并分批添加所有Excel文件"""
+        if self.scan_queue is not None:
+            messagebox.showwarning("提示", "正在扫描文件夹，请稍候")
+            return
+        
         folder = filedialog.askdirectory(title="选择包含Excel文件的文件夹")
         if folder:
-            excel_files = []
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    if file.lower().endswith(('.xlsx', '.xls')):
-                        excel_files.append(os.path.join(root, file))
-            
-            if excel_files:
-                self.add_files(excel_files)
-                messagebox.showinfo("提示", f"从文件夹中找到 {len(excel_files)} 个Excel文件")
-            else:
-                messagebox.showwarning("提示", "文件夹中没有找到Excel文件")
+            self.scan_queue = queue.Queue()
+            self.scan_found = 0
+            threading.Thread(
+                target=self.scan_folder, args=(folder, self.scan_queue), daemon=True
+            ).start()
+            self.root.after(50, self.poll_scan)
+    
+    def scan_folder(self, folder, scan_queue):
+        """后台线程：扫描文件夹，每批文件通过队列交给界面线程"""
+        try:
+            for batch in scan_excel_files(folder):
+                scan_queue.put(("batch", batch))
+        finally:
+            scan_queue.put(("done", None))
+    
+    def poll_scan(self):
+        """界面线程：把扫描到的文件分批加入列表"""
+        try:
+            while True:
+                kind, batch = self.scan_queue.get_nowait()
+                if kind == "batch":
+                    self.scan_found += len(batch)
+                    self.add_files(batch)
+                    continue
+                
+                # 扫描结束
+                self.scan_queue = None
+                self.update_file_count()
+                if self.scan_found:
+                    messagebox.showinfo("提示", f"从文件夹中找到 {self.scan_found} 个Excel文件")
+                else:
+                    messagebox.showwarning("提示", "文件夹中没有找到Excel文件")
+                return
+        except queue.Empty:
+            pass
+        self.file_count_label.config(
+            text=f"已添加 {len(self.file_list)} 个文件（正在扫描，已找到 {self.scan_found} 个）"
+        )
+        self.root.after(50, self.poll_scan)
     
     def remove_selected_files(self):
         """移除选中的文件"""
@@ -227,17 +261,16 @@ class MergeBillApp:
             messagebox.showwarning("提示", "请先选择要移除的文件")
             return
         
-        # 从后往前删除，避免索引变化
-        for index in reversed(selected_indices):
-            self.file_listbox.delete(index)
-            del self.file_list[index]
-        
+        self.file_list.remove_indices(selected_indices)
+        self.file_listbox.clear_selection()
+        self.file_listbox.refresh()
         self.update_file_count()
     
     def clear_files(self):
         """清空文件列表"""
         self.file_list.clear()
-        self.file_listbox.delete(0, tk.END)
+        self.file_listbox.clear_selection()
+        self.file_listbox.refresh()
         self.update_file_count()
     
     def update_file_count(self):
@@ -247,6 +280,10 @@ class MergeBillApp:
     
     def start_merge(self):
         """开始合并操作"""
+        if self.scan_queue is not None:
+            messagebox.showwarning("提示", "正在扫描文件夹，请稍候")
+            return
+        
         # 检查是否有文件
         if not self.file_list:
             messagebox.showwarning("提示", "请先添加要合并的Excel文件！")
@@ -258,81 +295,189 @@ class MergeBillApp:
             messagebox.showwarning("提示", "请先选择一个预设配置！")
             return
         
-        # 获取预设配置
-        preset = self.config_manager.get_preset(preset_name)
-        if not preset or not preset.get('mappings'):
-            messagebox.showwarning("提示", "所选预设没有配置映射项目！")
-            return
+        # 获取预设配置；自动识别时按识别条件为每个文件选择预设
+        preset = router = None
+        if preset_name == AUTO_PRESET:
+            try:
+                router = self.config_manager.create_router()
+            except ValueError as e:
+                messagebox.showwarning("提示", f"无法自动识别预设：{e}")
+                return
+        else:
+            preset = self.config_manager.get_preset(preset_name)
+            if not preset or not preset.get('mappings'):
+                messagebox.showwarning("提示", "所选预设没有配置映射项目！")
+                return
         
         # 选择输出文件
         output_file = filedialog.asksaveasfilename(
             title="保存合并结果",
             defaultextension=".xlsx",
-            filetypes=[("Excel文件", "*.xlsx")]
+            filetypes=[
+                ("Excel文件", "*.xlsx"),
+                ("CSV文件（UTF-8）", "*.csv"),
+                ("Parquet文件（需要pyarrow）", "*.parquet")
+            ]
         )
         
         if not output_file:
             return
         
+        # 显示处理进度
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("处理中...")
+        progress_window.geometry("380x170")
+        progress_window.transient(self.root)
+        progress_window.grab_set()
+        
+        # 居中显示
+        progress_window.update_idletasks()
+        x = (progress_window.winfo_screenwidth() // 2) - (progress_window.winfo_width() // 2)
+        y = (progress_window.winfo_screenheight() // 2) - (progress_window.winfo_height() // 2)
+        progress_window.geometry(f"+{x}+{y}")
+        
+        total = len(self.file_list)
+        self.progress_label = ttk.Label(
+            progress_window, 
+            text=f"正在处理 {total} 个文件，请稍候...",
+            font=("微软雅黑", 10)
+        )
+        self.progress_label.pack(pady=(20, 5))
+        
+        self.progress_bar = ttk.Progressbar(
+            progress_window, 
+            mode='determinate',
+            maximum=total,
+            length=300
+        )
+        self.progress_bar.pack(fill=tk.X, padx=20, pady=5)
+        
+        self.progress_detail_label = ttk.Label(progress_window, text="", foreground="gray")
+        self.progress_detail_label.pack(pady=5)
+        
+        self.cancel_event = threading.Event()
+        self.cancel_button = ttk.Button(
+            progress_window,
+            text="取消",
+            command=self.cancel_merge
+        )
+        self.cancel_button.pack(pady=5)
+        progress_window.protocol("WM_DELETE_WINDOW", self.cancel_merge)
+        
+        self.progress_window = progress_window
+        self.merge_queue = queue.Queue()
+        self.merge_start_time = time.time()
+        
+        # 在后台线程中执行合并，界面线程只负责刷新进度
+        worker = threading.Thread(
+            target=self.run_merge,
+            args=(list(self.file_list), preset, output_file, router),
+            daemon=True
+        )
+        worker.start()
+        self.root.after(100, self.poll_merge)
+    
+    def run_merge(self, file_list, preset, output_file, router=None):
+        """后台线程：执行合并，进度和结果通过队列交给界面线程"""
+        def on_progress(done, total, file_path):
+            self.merge_queue.put(("progress", done, total, file_path))
+        
         try:
-            # 显示处理进度
-            progress_window = tk.Toplevel(self.root)
-            progress_window.title("处理中...")
-            progress_window.geometry("350x120")
-            progress_window.transient(self.root)
-            progress_window.grab_set()
-            
-            # 居中显示
-            progress_window.update_idletasks()
-            x = (progress_window.winfo_screenwidth() // 2) - (progress_window.winfo_width() // 2)
-            y = (progress_window.winfo_screenheight() // 2) - (progress_window.winfo_height() // 2)
-            progress_window.geometry(f"+{x}+{y}")
-            
-            ttk.Label(
-                progress_window, 
-                text=f"正在处理 {len(self.file_list)} 个文件，请稍候...",
-                font=("微软雅黑", 10)
-            ).pack(pady=20)
-            
-            progress_bar = ttk.Progressbar(
-                progress_window, 
-                mode='indeterminate',
-                length=300
-            )
-            progress_bar.pack(fill=tk.X, padx=20, pady=10)
-            progress_bar.start()
-            
-            self.root.update()
-            
-            # 执行合并
-            result = self.excel_processor.merge_bills(
-                self.file_list,
-                preset['mappings'],
-                output_file,
-                preset.get('settlement_search_column', 'D'),
-                preset.get('settlement_search_keyword', '折后总计')
+            # 未变化的文件直接使用提取缓存
+            cache = self.config_manager.open_cache()
+            try:
+                if router is not None:
+                    result = self.excel_processor.merge_by_preset(
+                        file_list,
+                        router,
+                        output_file,
+                        cache=cache,
+                        progress_callback=on_progress,
+                        cancel_event=self.cancel_event,
+                        prefetch=PREFETCH_DEPTH
+                    )
+                else:
+                    result = self.excel_processor.merge_bills(
+                        file_list,
+                        preset['mappings'],
+                        output_file,
+                        preset.get('settlement_search_column', 'D'),
+                        preset.get('settlement_search_keyword', '折后总计'),
+                        cache=cache,
+                        progress_callback=on_progress,
+                        cancel_event=self.cancel_event,
+                        extra_searches=preset.get('extra_searches', []),
+                        search_sheet=preset.get('settlement_search_sheet'),
+                        aggregation=preset.get('aggregation'),
+                        details=preset.get('details'),
+                        prefetch=PREFETCH_DEPTH
+                    )
+            finally:
+                cache.close()
+        except Exception as e:
+            result = {"success": False, "message": str(e)}
+        
+        self.merge_queue.put(("done", result, output_file))
+    
+    def poll_merge(self):
+        """界面线程：定时读取后台合并的进度"""
+        try:
+            while True:
+                message = self.merge_queue.get_nowait()
+                if message[0] == "progress":
+                    self.update_merge_progress(*message[1:])
+                else:
+                    self.finish_merge(*message[1:])
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self.poll_merge)
+    
+    def update_merge_progress(self, done, total, file_path):
+        """刷新进度条、处理速度和预计剩余时间"""
+        elapsed = max(time.time() - self.merge_start_time, 1e-6)
+        rate = done / elapsed
+        remaining = (total - done) / rate if rate > 0 else 0
+        minutes, seconds = divmod(int(remaining), 60)
+        
+        self.progress_bar.config(maximum=total, value=done)
+        self.progress_label.config(text=f"已处理 {done}/{total} 个文件")
+        if self.cancel_event.is_set():
+            detail = "正在取消，等待处理中的文件完成..."
+        else:
+            detail = f"速度 {rate:.1f} 个/秒    预计剩余 {minutes:02d}:{seconds:02d}"
+        self.progress_detail_label.config(text=detail)
+    
+    def cancel_merge(self):
+        """取消合并：不再处理新文件，已完成的部分仍会保存"""
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_detail_label.config(text="正在取消，等待处理中的文件完成...")
+    
+    def finish_merge(self, result, output_file):
+        """合并结束后关闭进度窗口并显示结果"""
+        self.progress_window.destroy()
+        
+        # 显示结果
+        if result['success']:
+            title = "已取消" if result.get('cancelled') else "成功"
+            heading = result['message'] if result.get('cancelled') else "合并完成！"
+            unmatched = ""
+            if result.get('unmatched_files'):
+                unmatched = f"（其中 {len(result['unmatched_files'])} 个文件未识别到预设）\n"
+            messagebox.showinfo(
+                title,
+                f"{heading}\n\n"
+                f"✓ 成功处理: {result['success_count']} 个文件\n"
+                f"✗ 失败: {result['error_count']} 个文件\n"
+                f"{unmatched}\n"
+                f"结果已保存到:\n{output_file}"
             )
-            
-            progress_window.destroy()
-            
-            # 显示结果
-            if result['success']:
-                messagebox.showinfo(
-                    "成功",
-                    f"合并完成！\n\n"
-                    f"✓ 成功处理: {result['success_count']} 个文件\n"
-                    f"✗ 失败: {result['error_count']} 个文件\n\n"
-                    f"结果已保存到:\n{output_file}"
-                )
-                # 清空列表
+            # 全部完成时清空列表，取消时保留以便重新合并
+            if not result.get('cancelled'):
                 self.clear_files()
-            else:
-                messagebox.showerror("错误", f"合并失败：{result['message']}")
-                
-        except Exception as e:
-            if 'progress_window' in locals():
-                progress_window.destroy()
-            messagebox.showerror("错误", f"处理过程中出现错误：{str(e)}")
+        else:
+            messagebox.showerror("错误", f"合并失败：{result['message']}")
     
     def open_config_editor(self):
         """打开配置编辑器"""
@@ -343,6 +488,9 @@ class MergeBillApp:
 
 
 def main():
+    # 打包成exe后，多进程提取需要此调用才能正确启动子进程
+    multiprocessing.freeze_support()
+    
     # 尝试使用TkinterDnD，如果不可用则使用标准Tk
     try:
         from tkinterdnd2 import TkinterDnD
@@ -0,0 +1,351 @@
+"""
+命令行入口 - 不依赖图形界面，批量执行账单合并
+
+用法示例：
+    python -m merge_cli presets
+    python -m merge_cli merge -p 默认预设 -o 结果.xlsx 账单目录/ "其他/*.xlsx"
+    python -m merge_cli watch 收件箱/ -p 默认预设 -o 滚动结果.csv
+
+合并完成后在标准输出打印JSON格式的统计信息；有文件处理失败时
+退出码为1，合并失败或参数错误时为2。
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+
+from config_manager import ConfigManager
+from excel_processor import DUPLICATE_MODES, ENGINES, OUTPUT_FORMATS, ExcelProcessor
+from file_list import EXCEL_EXTENSIONS, iter_excel_files
+from prefetch import PREFETCH_BYTES, PREFETCH_DEPTH
+from run_report import RunReport
+from watch_folder import FolderWatcher
+
+
+def collect_files(inputs):
+    """
+    将文件、通配符和文件夹参数展开为Excel文件列表
+    
+    文件夹会递归扫描；同一文件只保留第一次出现的位置。
+    
+    Args:
+        inputs: 命令行传入的路径列表
+    
+    Returns:
+        (文件路径列表, 未匹配到任何文件的参数列表)
+    """
+    files = {}
+    unmatched = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found = [entry.path for entry in iter_excel_files(item)]
+        elif os.path.isfile(item):
+            found = [item]
+        else:
+            found = [
+                path for path in sorted(glob.glob(item, recursive=True))
+                if os.path.isfile(path) and path.lower().endswith(EXCEL_EXTENSIONS)
+            ]
+        
+        if not found:
+            unmatched.append(item)
+        for path in found:
+            files.setdefault(os.path.abspath(path), None)
+    return list(files), unmatched
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog="merge_cli",
+        description="Excel账单合并工具 - 命令行批量合并"
+    )
+    parser.add_argument(
+        "--config", default="config.json",
+        help="配置文件路径（默认: config.json）"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    subparsers.add_parser("presets", help="列出配置文件中的全部预设")
+    
+    merge = subparsers.add_parser("merge", help="按预设合并账单")
+    merge.add_argument("inputs", nargs="+", help="Excel文件、通配符或文件夹")
+    target = merge.add_mutually_exclusive_group(required=True)
+    target.add_argument("-p", "--preset", help="预设名称")
+    target.add_argument(
+        "--auto-preset", action="store_true",
+        help="按预设的识别条件为每个文件自动选择预设，每个预设输出一个工作表"
+    )
+    merge.add_argument(
+        "-o", "--output", required=True,
+        help="输出文件路径，按扩展名选择格式（.xlsx / .csv / .parquet）"
+    )
+    merge.add_argument(
+        "--format", choices=OUTPUT_FORMATS, default=None,
+        help="输出格式，默认按输出文件扩展名判断"
+    )
+    merge.add_argument(
+        "-w", "--workers", type=int, default=None,
+        help="并行进程数，默认为CPU核心数，1 表示不使用多进程"
+    )
+    merge.add_argument(
+        "--engine", choices=ENGINES, default="xml",
+        help="读取引擎（默认: xml，失败时自动回退到openpyxl）"
+    )
+    merge.add_argument(
+        "--prefetch", type=int, default=PREFETCH_DEPTH,
+        help=f"单进程（-w 1）时后台预读的文件数，0 表示不预读（默认: {PREFETCH_DEPTH}）"
+    )
+    merge.add_argument(
+        "--prefetch-mb", type=int, default=PREFETCH_BYTES // (1024 * 1024),
+        help=f"预读内容占用内存的上限（MB，默认: {PREFETCH_BYTES // (1024 * 1024)}）"
+    )
+    merge.add_argument(
+        "--mmap", action="store_true",
+        help="内存映射打开文件，多进程处理很大的工作簿时减少内存占用"
+    )
+    merge.add_argument(
+        "--cache", default="extraction_cache.db",
+        help="提取缓存文件路径（默认: extraction_cache.db）"
+    )
+    merge.add_argument("--no-cache", action="store_true", help="不使用提取缓存")
+    merge.add_argument(
+        "--duplicates", choices=DUPLICATE_MODES, default=None,
+        help="内容相同文件的处理方式（默认不检查）"
+    )
+    merge.add_argument(
+        "--streaming", action="store_true",
+        help="流式写出结果，内存占用不随文件数增长"
+    )
+    merge.add_argument(
+        "--report", default=None,
+        help="保存运行报告（每个文件和各阶段的耗时），.csv 为每个文件一行，其余为JSON"
+    )
+    merge.add_argument(
+        "--stats-sheet", action="store_true",
+        help="在输出中添加\"运行统计\"工作表"
+    )
+    
+    watch = subparsers.add_parser("watch", help="监视文件夹，新账单写入完成后追加到CSV输出")
+    watch.add_argument("folder", help="监视的文件夹")
+    watch.add_argument("-p", "--preset", required=True, help="预设名称")
+    watch.add_argument("-o", "--output", required=True, help="滚动输出文件（.csv）")
+    watch.add_argument(
+        "--state", default=None,
+        help="已处理文件的状态文件（默认: <输出文件>.state.json）"
+    )
+    watch.add_argument(
+        "--interval", type=float, default=2.0,
+        help="扫描间隔秒数（默认: 2）"
+    )
+    watch.add_argument(
+        "--settle", type=float, default=2.0,
+        help="文件大小和修改时间保持不变多少秒后才处理（默认: 2）"
+    )
+    watch.add_argument(
+        "--engine", choices=ENGINES, default="xml",
+        help="读取引擎（默认: xml，失败时自动回退到openpyxl）"
+    )
+    watch.add_argument("-r", "--recursive", action="store_true", help="同时监视子文件夹")
+    return parser
+
+
+def run_presets(config_manager):
+    """输出预设列表"""
+    presets = []
+    for name in config_manager.get_preset_names():
+        preset = config_manager.get_preset(name)
+        presets.append({
+            "name": name,
+            "description": preset.get("description", ""),
+            "mappings": len(preset.get("mappings", [])),
+        })
+    print(json.dumps({"presets": presets}, ensure_ascii=False, indent=2))
+    return 0
+
+
+def run_merge(args, config_manager):
+    """执行合并并输出统计信息，返回退出码"""
+    router = None
+    if args.auto_preset:
+        if args.duplicates or args.stats_sheet:
+            print("自动识别预设时不支持 --duplicates 和 --stats-sheet", file=sys.stderr)
+            return 2
+        try:
+            router = config_manager.create_router()
+        except ValueError as e:
+            print(f"无法自动识别预设: {e}", file=sys.stderr)
+            return 2
+    else:
+        preset = config_manager.get_preset(args.preset)
+        if not preset:
+            print(f"预设不存在: {args.preset}", file=sys.stderr)
+            return 2
+        if not preset.get("mappings"):
+            print(f"预设没有配置映射项目: {args.preset}", file=sys.stderr)
+            return 2
+    
+    file_list, unmatched = collect_files(args.inputs)
+    for item in unmatched:
+        print(f"未找到Excel文件: {item}", file=sys.stderr)
+    if not file_list:
+        print("没有要合并的文件", file=sys.stderr)
+        return 2
+    
+    workers = args.workers if args.workers is not None else (os.cpu_count() or 1)
+    cache = None
+    if not args.no_cache:
+        config_manager.cache_file = args.cache
+        cache = config_manager.open_cache()
+    
+    report = RunReport() if args.report or args.stats_sheet else None
+    started = time.time()
+    # 处理过程中的提示信息写到标准错误，标准输出只保留JSON统计
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            if router is not None:
+                result = ExcelProcessor().merge_by_preset(
+                    file_list,
+                    router,
+                    args.output,
+                    parallel=workers > 1,
+                    workers=workers,
+                    engine=args.engine,
+                    streaming_output=args.streaming,
+                    keep_data=False,
+                    cache=cache,
+                    output_format=args.format,
+                    report=report,
+                    prefetch=args.prefetch,
+                    prefetch_bytes=args.prefetch_mb * 1024 * 1024,
+                    memory_map=args.mmap
+                )
+            else:
+                result = ExcelProcessor().merge_bills(
+                    file_list,
+                    preset["mappings"],
+                    args.output,
+                    preset.get("settlement_search_column", "D"),
+                    preset.get("settlement_search_keyword", "折后总计"),
+                    parallel=workers > 1,
+                    workers=workers,
+                    engine=args.engine,
+                    streaming_output=args.streaming,
+                    keep_data=False,
+                    cache=cache,
+                    duplicate_mode=args.duplicates,
+                    output_format=args.format,
+                    extra_searches=preset.get("extra_searches", []),
+                    search_sheet=preset.get("settlement_search_sheet"),
+                    aggregation=preset.get("aggregation"),
+                    details=preset.get("details"),
+                    report=report,
+                    stats_sheet=args.stats_sheet,
+                    prefetch=args.prefetch,
+                    prefetch_bytes=args.prefetch_mb * 1024 * 1024,
+                    memory_map=args.mmap
+                )
+        finally:
+            if cache is not None:
+                cache.close()
+    elapsed = time.time() - started
+    
+    stats = {
+        "success": result["success"],
+        "message": result["message"],
+        "preset": args.preset if router is None else "自动识别",
+        "output": os.path.abspath(args.output),
+        "file_count": len(file_list),
+        "success_count": result.get("success_count", 0),
+        "error_count": result.get("error_count", 0),
+        "cached_count": result.get("cached_count", 0),
+        "duplicate_count": result.get("duplicate_count", 0),
+        "failed_files": result.get("failed_files", []),
+        "unmatched_inputs": unmatched,
+        "workers": workers,
+        "engine": args.engine,
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_second": round(len(file_list) / elapsed, 2) if elapsed > 0 else None,
+    }
+    if router is not None:
+        stats["preset_counts"] = result.get("preset_counts", {})
+        stats["unmatched_files"] = result.get("unmatched_files", [])
+    if report is not None:
+        stats["timing"] = report.totals()
+        if args.report:
+            report.save(args.report)
+            stats["report"] = os.path.abspath(args.report)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    
+    if not result["success"]:
+        return 2
+    if result.get("error_count"):
+        return 1
+    return 0
+
+
+def run_watch(args, config_manager):
+    """
+    持续监视文件夹，直到 Ctrl+C
+    
+    每轮有文件被处理时在标准输出打印一行JSON。
+    """
+    if not os.path.isdir(args.folder):
+        print(f"文件夹不存在: {args.folder}", file=sys.stderr)
+        return 2
+    
+    try:
+        preset = config_manager.compile_preset(args.preset)
+        if preset is None:
+            print(f"预设不存在: {args.preset}", file=sys.stderr)
+            return 2
+        watcher = FolderWatcher(
+            args.folder, preset, args.output,
+            state_file=args.state,
+            engine=args.engine,
+            settle_seconds=args.settle,
+            recursive=args.recursive
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    
+    # 处理过程中的提示信息写到标准错误，标准输出每轮一行JSON
+    stdout = sys.stdout
+    
+    def report(result):
+        line = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "added": result["added"],
+            "failed": result["failed"],
+            "changed": result["changed"],
+            "total": len(watcher.files),
+        }
+        print(json.dumps(line, ensure_ascii=False), file=stdout, flush=True)
+    
+    print(f"正在监视 {os.path.abspath(args.folder)}，按 Ctrl+C 停止", file=sys.stderr)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            watcher.run(args.interval, callback=report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    """命令行主函数，返回退出码"""
+    args = build_parser().parse_args(argv)
+    config_manager = ConfigManager(args.config)
+    
+    if args.command == "presets":
+        return run_presets(config_manager)
+    if args.command == "watch":
+        return run_watch(args, config_manager)
+    return run_merge(args, config_manager)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
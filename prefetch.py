@@ -0,0 +1,78 @@
+"""
+文件预读 - 后台线程提前读取文件内容，读取（如网络共享上的文件）与解析同时进行
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 默认预读的文件数、缓冲区字节上限和读取线程数
+PREFETCH_DEPTH = 8
+PREFETCH_BYTES = 256 * 1024 * 1024
+PREFETCH_THREADS = 4
+
+
+def read_file(file_path):
+    """读取整个文件，失败时返回None（由解析阶段按路径重新打开并报告错误）"""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def prefetch_files(file_list, depth=PREFETCH_DEPTH, byte_budget=PREFETCH_BYTES,
+                   threads=PREFETCH_THREADS, cancel_event=None):
+    """
+    按 file_list 的顺序产出文件内容，后台线程提前读取后续文件
+    
+    最多提前 depth 个文件；已读入、尚未被取走的内容超过 byte_budget 字节时
+    暂停提交新的读取（至少保留一个文件，单个大文件不会卡住）。
+    正在读取的文件不计入字节数，实际占用最多再多出 threads 个文件。
+    
+    Args:
+        file_list: 文件路径列表
+        depth: 最多提前读取的文件数
+        byte_budget: 已读入内容的字节数上限
+        threads: 读取线程数
+        cancel_event: threading.Event，设置后不再提交新的读取
+    
+    Yields:
+        (文件路径, 文件内容)，读取失败时内容为None
+    """
+    depth = max(depth, 1)
+    tasks = iter(file_list)
+    pending = deque()
+    
+    def buffered_bytes():
+        return sum(
+            len(future.result() or b"") for _, future in pending if future.done()
+        )
+    
+    executor = ThreadPoolExecutor(max_workers=max(min(threads, depth), 1))
+    try:
+        def submit_next():
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if pending and (len(pending) >= depth or buffered_bytes() >= byte_budget):
+                return False
+            file_path = next(tasks, None)
+            if file_path is None:
+                return False
+            pending.append((file_path, executor.submit(read_file, file_path)))
+            return True
+        
+        while submit_next():
+            pass
+        
+        while pending:
+            file_path, future = pending.popleft()
+            content = future.result()
+            # 先补充预读，再交给解析阶段
+            while submit_next():
+                pass
+            yield file_path, content
+    finally:
+        # 提前结束（取消或出错）时丢弃尚未开始的读取
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
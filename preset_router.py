@@ -0,0 +1,192 @@
+"""
+预设识别 - 按账单模板的特征（锚点单元格中的文字）为每个文件自动选择预设
+"""
+import hashlib
+import json
+from collections import namedtuple
+
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils.cell import coordinate_from_string
+
+from compiled_preset import CompiledPreset, SheetPlan
+from excel_processor import ExcelProcessor
+
+
+# 读取模板特征使用的引擎：不论提取使用哪个引擎，都只流式读取到最后一个
+# 锚点所在的行（.xls 使用 BIFF 读取器，xml 读取失败时回退到只读模式）
+PROBE_ENGINE = "xml"
+
+class TemplateMatch(namedtuple("TemplateMatch", "preset sheet anchors texts")):
+    """
+    一个预设的模板特征
+    
+    Attributes:
+        preset: 预设名称
+        sheet: 锚点单元格所在的工作表（同映射的 sheet，None 为活动工作表）
+        anchors: 锚点坐标 ((行, 列), ...)，按坐标排序
+        texts: 各锚点单元格应有的文字（去掉首尾空白），与 anchors 对应
+    """
+    
+    __slots__ = ()
+    
+    @classmethod
+    def compile(cls, preset_name, config):
+        """
+        编译预设中的识别条件（"match"），例如：
+            {"cells": {"A1": "某某汽车服务有限公司", "D3": "合同号"}, "sheet": "报价单"}
+        全部锚点单元格的文字都相同时视为该预设的模板；指定的工作表不存在时不匹配。
+        
+        Raises:
+            ValueError: 配置无效
+        """
+        cells = config.get("cells") or {}
+        if not cells:
+            raise ValueError(f"预设 {preset_name} 的识别条件需要至少一个锚点单元格")
+        
+        anchors = {}
+        for cell_ref, text in cells.items():
+            try:
+                col_letter, row = coordinate_from_string(str(cell_ref).upper())
+                key = (row, column_index_from_string(col_letter))
+            except ValueError:
+                raise ValueError(f"预设 {preset_name} 的锚点单元格无效: {cell_ref}")
+            anchors[key] = normalize_label(text)
+            if not anchors[key]:
+                raise ValueError(f"预设 {preset_name} 的锚点单元格 {cell_ref} 需要指定文字")
+        
+        sheet = config.get("sheet")
+        if sheet == "":
+            sheet = None
+        keys = tuple(sorted(anchors))
+        return cls(preset_name, sheet, keys, tuple(anchors[key] for key in keys))
+
+
+def normalize_label(value):
+    """锚点单元格的值转换为用于比较的文字（整数值的小数去掉 ".0"）"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class PresetRouter:
+    """
+    按模板特征把文件分配给预设
+    
+    全部预设的锚点单元格合并为一次读取：每个文件只流式读到最后一个锚点
+    所在的行。识别条件按 (工作表, 锚点坐标) 分组，每组建立 {锚点文字: 预设}
+    索引，每个文件每组只做一次字典查找，与预设数量无关。
+    锚点较多（条件更具体）的组优先匹配。
+    
+    合并时识别和提取在同一个任务中完成（见 ExcelProcessor.extract_routed），
+    实例会传给每个提取进程。
+    """
+    
+    def __init__(self, matches, presets, processor=None):
+        """
+        Args:
+            matches: TemplateMatch 列表
+            presets: {预设名称: CompiledPreset}
+            processor: ExcelProcessor 实例，默认新建
+        
+        Raises:
+            ValueError: 两个预设的识别条件完全相同
+        """
+        self.presets = presets
+        self.processor = processor or ExcelProcessor()
+        
+        # {(工作表, 锚点坐标): {锚点文字: 预设名称}}
+        groups = {}
+        for match in matches:
+            index = groups.setdefault((match.sheet, match.anchors), {})
+            other = index.setdefault(match.texts, match.preset)
+            if other != match.preset:
+                raise ValueError(f"预设 {other} 和 {match.preset} 的识别条件相同，无法区分")
+        self.groups = sorted(groups.items(), key=lambda item: -len(item[0][1]))
+        
+        # 全部锚点合并为一个只有映射、没有搜索项的预设，读到最后一个锚点即停止
+        by_sheet = {}
+        for sheet, anchors in groups:
+            targets = by_sheet.setdefault(sheet, {})
+            for key in anchors:
+                targets[key] = (self._anchor_name(sheet, key),)
+        names = tuple(names[0] for targets in by_sheet.values() for names in targets.values())
+        self.probe = CompiledPreset(
+            "识别预设", names, (), ("文件名",) + names,
+            tuple(SheetPlan.build(sheet, targets, ()) for sheet, targets in by_sheet.items()),
+            None, (), report_missing_sheets=False
+        )
+        
+        # 提取缓存使用的指纹：识别条件或任一预设的提取规则变化时失效
+        payload = {
+            "matches": sorted(
+                [match.preset, match.sheet, match.anchors, match.texts] for match in matches
+            ),
+            "presets": {name: preset.fingerprint for name, preset in presets.items()},
+        }
+        text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        self.cache_fingerprint = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    
+    @classmethod
+    def from_presets(cls, presets, processor=None):
+        """
+        由配置文件中的预设 {名称: 预设字典} 生成，只包含配置了 "match" 的预设
+        
+        Raises:
+            ValueError: 没有可识别的预设，或识别条件、预设配置无效
+        """
+        matches = []
+        compiled = {}
+        for name, preset in presets.items():
+            if not preset.get("match"):
+                continue
+            matches.append(TemplateMatch.compile(name, preset["match"]))
+            compiled[name] = CompiledPreset.from_preset(preset, name=name)
+        if not matches:
+            raise ValueError("没有配置识别条件（match）的预设")
+        return cls(matches, compiled, processor)
+    
+    def _anchor_name(self, sheet, key):
+        """读取锚点时使用的映射名称"""
+        return f"{sheet}!{key[0]},{key[1]}"
+    
+    def fingerprint(self, file_path, content=None):
+        """
+        读取文件的模板特征（使用 PROBE_ENGINE）
+        
+        Args:
+            content: 已读入内存的文件内容或映射，提供时不再读取文件
+        
+        Returns:
+            {(工作表, (行, 列)): 文字}，空白单元格和不存在的工作表中的锚点
+            为空文字；读取失败时返回None
+        """
+        data = self.processor.extract_compiled(
+            file_path, self.probe, PROBE_ENGINE, content=content
+        )
+        if data is None:
+            return None
+        return {
+            (sheet, key): normalize_label(data.get(self._anchor_name(sheet, key)))
+            for (sheet, anchors), _ in self.groups
+            for key in anchors
+        }
+    
+    def match(self, file_path, content=None):
+        """
+        识别文件对应的预设（content 见 fingerprint）
+        
+        Returns:
+            预设名称，没有匹配的预设或读取失败时返回None
+        """
+        labels = self.fingerprint(file_path, content)
+        if labels is None:
+            return None
+        for (sheet, anchors), index in self.groups:
+            texts = tuple(labels[(sheet, key)] for key in anchors)
+            preset_name = index.get(texts)
+            if preset_name is not None:
+                return preset_name
+        return None
+
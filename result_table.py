@@ -0,0 +1,99 @@
+"""
+合并结果表 - 按列保存合并结果，每个表头一列
+"""
+from collections.abc import Mapping
+
+
+class ResultRow(Mapping):
+    """
+    结果表中一行的只读视图
+    
+    不复制数据，按表头读取所在列的值；支持 row["结算金额"]、row.get()、
+    keys()/items() 等字典读取方式，可以替代原来的每行字典。
+    """
+    
+    __slots__ = ("_table", "_index")
+    
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+    
+    def __getitem__(self, header):
+        col = self._table.header_index[header]
+        return self._table.columns[col][self._index]
+    
+    def __iter__(self):
+        return iter(self._table.header_index)
+    
+    def __len__(self):
+        return len(self._table.header_index)
+    
+    def __repr__(self):
+        return f"ResultRow({dict(self)!r})"
+    
+    def values_list(self):
+        """按表头顺序返回本行的值列表"""
+        return [column[self._index] for column in self._table.columns]
+
+
+class ResultTable:
+    """
+    列式结果表
+    
+    每个表头对应一个值列表，行只是列表中的下标，不再为每个文件保存
+    一份带完整表头字符串的字典。遍历或下标访问得到 ResultRow 视图，
+    汇总统计可以用 column() 直接取整列。
+    """
+    
+    def __init__(self, headers=()):
+        self.headers = list(headers)
+        # 表头重复时以第一次出现的列为准（与字典行的行为一致）
+        self.header_index = {}
+        for col, header in enumerate(self.headers):
+            self.header_index.setdefault(header, col)
+        self.columns = [[] for _ in self.headers]
+        self._count = 0
+    
+    def append(self, values):
+        """
+        追加一行
+        
+        Args:
+            values: 按表头顺序排列的值序列
+        """
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        self._count += 1
+    
+    def append_dict(self, data):
+        """按表头从字典中取值追加一行，缺少的表头填None"""
+        self.append([data.get(header) for header in self.headers])
+    
+    def column(self, header):
+        """获取某一列的全部值（返回内部列表，请勿修改）"""
+        return self.columns[self.header_index[header]]
+    
+    def rows(self):
+        """按表头顺序逐行产出值元组，供写出器直接使用"""
+        return zip(*self.columns) if self.columns else iter(())
+    
+    def to_dicts(self):
+        """转换为每行一个字典的列表"""
+        return [dict(row) for row in self]
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("结果表行号超出范围")
+        return ResultRow(self, index)
+    
+    def __iter__(self):
+        for index in range(self._count):
+            yield ResultRow(self, index)
+    
+    def __bool__(self):
+        return self._count > 0
@@ -0,0 +1,177 @@
+"""
+运行统计 - 记录合并过程中每个文件和每个阶段的耗时，生成运行报告
+"""
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+class RunReport:
+    """
+    一次合并的运行统计
+    
+    每个文件一条记录（由提取时填写的统计字典生成），另外按阶段累计
+    写出结果等耗时。可以保存为JSON（含汇总）或CSV（每个文件一行），
+    也可以作为"运行统计"工作表写入合并结果。
+    """
+    
+    # 每个文件记录的字段及在CSV/工作表中的列名
+    FILE_FIELDS = (
+        ("file", "文件"),
+        ("file_size", "文件大小(字节)"),
+        ("cached", "使用缓存"),
+        ("open_seconds", "打开耗时(秒)"),
+        ("read_seconds", "映射读取耗时(秒)"),
+        ("scan_seconds", "关键词搜索耗时(秒)"),
+        ("total_seconds", "总耗时(秒)"),
+        ("rows_scanned", "扫描行数"),
+        ("fallback", "回退原因"),
+        ("error", "错误类型"),
+    )
+    
+    def __init__(self):
+        self.files = []
+        self.stages = {}
+        self.info = {}
+        self._started = time.perf_counter()
+        self.elapsed_seconds = None
+    
+    def add_file(self, file_path, stats):
+        """
+        记录一个文件的统计
+        
+        Args:
+            file_path: 文件路径
+            stats: extract_data_from_file 填写的统计字典
+        """
+        record = {"file": file_path}
+        for field, _ in self.FILE_FIELDS[1:]:
+            record[field] = stats.get(field)
+        record["cached"] = bool(record["cached"])
+        self.files.append(record)
+    
+    @contextmanager
+    def stage(self, name):
+        """累计一个阶段的耗时：with report.stage("写出"): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+    
+    def add_stage(self, name, seconds):
+        """直接累计阶段耗时"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def finish(self):
+        """记录总耗时"""
+        self.elapsed_seconds = time.perf_counter() - self._started
+    
+    def totals(self):
+        """汇总全部文件和阶段的统计"""
+        def total(field):
+            return round(sum(r[field] or 0 for r in self.files), 3)
+        
+        elapsed = self.elapsed_seconds
+        if elapsed is None:
+            elapsed = time.perf_counter() - self._started
+        slowest = sorted(
+            (r for r in self.files if r["total_seconds"] is not None),
+            key=lambda r: r["total_seconds"], reverse=True
+        )[:10]
+        return {
+            "file_count": len(self.files),
+            "error_count": sum(1 for r in self.files if r["error"]),
+            "cached_count": sum(1 for r in self.files if r["cached"]),
+            "fallback_count": sum(1 for r in self.files if r["fallback"]),
+            "total_bytes": sum(r["file_size"] or 0 for r in self.files),
+            "rows_scanned": sum(r["rows_scanned"] or 0 for r in self.files),
+            "open_seconds": total("open_seconds"),
+            "read_seconds": total("read_seconds"),
+            "scan_seconds": total("scan_seconds"),
+            "extract_seconds": total("total_seconds"),
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "elapsed_seconds": round(elapsed, 3),
+            "slowest_files": [
+                {"file": r["file"], "total_seconds": round(r["total_seconds"], 3)}
+                for r in slowest
+            ],
+        }
+    
+    def to_dict(self):
+        """完整报告（信息、汇总和每个文件的记录）"""
+        return {
+            "info": self.info,
+            "totals": self.totals(),
+            "files": self.files,
+        }
+    
+    def save(self, report_file):
+        """按扩展名保存为 .csv（每个文件一行）或JSON"""
+        if os.path.splitext(report_file)[1].lower() == ".csv":
+            self.write_csv(report_file)
+        else:
+            self.write_json(report_file)
+    
+    def write_json(self, report_file):
+        """保存JSON报告"""
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+    
+    def write_csv(self, report_file):
+        """保存CSV报告（UTF-8 BOM，每个文件一行）"""
+        headers, rows = self.file_rows()
+        with open(report_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+    
+    def file_rows(self):
+        """每个文件一行的表头和行数据（耗时保留4位小数）"""
+        headers = [label for _, label in self.FILE_FIELDS]
+        rows = []
+        for record in self.files:
+            row = []
+            for field, _ in self.FILE_FIELDS:
+                value = record[field]
+                if field.endswith("_seconds") and value is not None:
+                    value = round(value, 4)
+                if field == "file":
+                    value = os.path.basename(value)
+                row.append(value)
+            rows.append(row)
+        return headers, rows
+    
+    def sheet_rows(self):
+        """
+        "运行统计"工作表的内容：先列出各阶段和汇总，空一行后是每个文件的记录
+        
+        Returns:
+            (表头, 行列表)
+        """
+        totals = self.totals()
+        headers, file_rows = self.file_rows()
+        width = len(headers)
+        
+        def pad(values):
+            return list(values) + [None] * (width - len(values))
+        
+        rows = [
+            pad(["文件数", totals["file_count"]]),
+            pad(["失败数", totals["error_count"]]),
+            pad(["使用缓存", totals["cached_count"]]),
+            pad(["总大小(字节)", totals["total_bytes"]]),
+            pad(["扫描行数", totals["rows_scanned"]]),
+            pad(["打开耗时(秒)", totals["open_seconds"]]),
+            pad(["映射读取耗时(秒)", totals["read_seconds"]]),
+            pad(["关键词搜索耗时(秒)", totals["scan_seconds"]]),
+        ]
+        for name, seconds in totals["stages"].items():
+            rows.append(pad([f"{name}耗时(秒)", seconds]))
+        rows.append(pad(["总耗时(秒)", totals["elapsed_seconds"]]))
+        rows.append(pad([]))
+        rows.append(headers)
+        rows.extend(file_rows)
+        return ["项目", "值"] + [None] * (width - 2), rows
@@ -0,0 +1,40 @@
+"""
+测试公共设置：把项目根目录加入模块搜索路径，并提供生成模拟账单的工具
+"""
+import os
+import sys
+
+import openpyxl
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_bill(file_path, values, keyword="折后总计", amount=None, keyword_row=10):
+    """
+    生成一个简单的账单文件
+    
+    Args:
+        values: {单元格: 值}
+        keyword: D 列中的结算关键词，右侧单元格为结算金额
+        amount: 结算金额
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for cell_ref, value in values.items():
+        ws[cell_ref] = value
+    ws.cell(keyword_row, 4, keyword)
+    ws.cell(keyword_row, 5, amount)
+    wb.save(file_path)
+    return file_path
+
+
+@pytest.fixture
+def bill_factory(tmp_path):
+    """在临时目录中生成账单，返回 make(文件名, {单元格: 值}, amount=...)"""
+    def make(name, values, **kwargs):
+        return make_bill(str(tmp_path / name), values, **kwargs)
+    return make
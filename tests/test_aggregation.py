@@ -0,0 +1,40 @@
+"""
+合并时汇总统计的测试
+"""
+import shutil
+
+from excel_processor import ExcelProcessor
+
+
+MAPPINGS = [{"name": "经销商", "cell": "B2"}]
+AGGREGATION = {
+    "group_by": ["经销商"],
+    "values": [{"field": "结算金额", "funcs": ["sum", "count"]}],
+}
+
+
+def summary_rows(result):
+    summary = result["summary"]
+    return [dict(zip(summary.headers, row)) for row in summary.rows()]
+
+
+def test_flagged_duplicates_are_not_aggregated(tmp_path, bill_factory):
+    first = bill_factory("甲.xlsx", {"B2": "甲"}, amount=1000)
+    bill_factory("乙.xlsx", {"B2": "乙"}, amount=500)
+    # 同一份账单的三个副本
+    for i in range(3):
+        shutil.copyfile(first, str(tmp_path / f"甲_副本{i}.xlsx"))
+    files = sorted(str(path) for path in tmp_path.glob("*.xlsx"))
+    
+    result = ExcelProcessor().merge_bills(
+        files, MAPPINGS, str(tmp_path / "out.csv"),
+        duplicate_mode="flag", aggregation=AGGREGATION
+    )
+    
+    assert result["success"], result["message"]
+    # 重复文件仍逐行输出
+    assert result["success_count"] == 5
+    rows = {row["经销商"]: row for row in summary_rows(result)}
+    assert rows["甲"]["结算金额合计"] == 1000
+    assert rows["甲"]["结算金额计数"] == 1
+    assert rows["乙"]["结算金额合计"] == 500
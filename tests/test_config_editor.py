@@ -0,0 +1,19 @@
+"""
+配置编辑界面中输入值转换的测试
+"""
+import pytest
+
+pytest.importorskip("tkinter")
+
+from config_editor import parse_sheet
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", ""),
+    (" 2 ", 2),
+    ("报价单", "报价单"),
+    ("Sheet2", "Sheet2"),
+    ("0", "0"),
+])
+def test_parse_sheet(text, expected):
+    assert parse_sheet(text) == expected
@@ -0,0 +1,86 @@
+"""
+预设配置管理和提取缓存失效的测试
+"""
+from config_manager import ConfigManager
+from extraction_cache import ExtractionCache
+
+
+def cached_fingerprints(cache_file):
+    cache = ExtractionCache(cache_file)
+    try:
+        return [row[0] for row in cache.conn.execute("SELECT preset FROM entries")]
+    finally:
+        cache.close()
+
+
+def fill_cache(config_manager, preset_name, files):
+    fingerprint = config_manager.get_preset_fingerprint(preset_name)
+    cache = config_manager.open_cache()
+    for file_path in files:
+        cache.put(cache.make_key(file_path, fingerprint), "hash", {"文件名": file_path})
+    cache.close()
+    return fingerprint
+
+
+def test_in_place_mapping_edit_invalidates_cache(tmp_path, bill_factory):
+    files = [bill_factory(f"bill{i}.xlsx", {"B2": i}) for i in range(3)]
+    config_manager = ConfigManager(
+        str(tmp_path / "config.json"), str(tmp_path / "cache.db")
+    )
+    old_fingerprint = fill_cache(config_manager, "默认预设", files)
+    assert cached_fingerprints(config_manager.cache_file) == [old_fingerprint] * 3
+    
+    # 与配置编辑器相同：先修改预设中的映射列表，再把同一个列表传给 update_preset
+    mappings = config_manager.get_preset("默认预设")["mappings"]
+    mappings[0]["cell"] = "D4"
+    assert config_manager.update_preset("默认预设", mappings=mappings)
+    
+    assert config_manager.get_preset_fingerprint("默认预设") != old_fingerprint
+    assert cached_fingerprints(config_manager.cache_file) == []
+
+
+def test_description_edit_keeps_cache(tmp_path, bill_factory):
+    files = [bill_factory("bill.xlsx", {"B2": 1})]
+    config_manager = ConfigManager(
+        str(tmp_path / "config.json"), str(tmp_path / "cache.db")
+    )
+    fingerprint = fill_cache(config_manager, "默认预设", files)
+    
+    assert config_manager.update_preset("默认预设", description="新的说明")
+    assert cached_fingerprints(config_manager.cache_file) == [fingerprint]
+
+
+def test_delete_keeps_cache_shared_with_duplicate(tmp_path, bill_factory):
+    files = [bill_factory("bill.xlsx", {"B2": 1})]
+    config_manager = ConfigManager(
+        str(tmp_path / "config.json"), str(tmp_path / "cache.db")
+    )
+    fingerprint = fill_cache(config_manager, "默认预设", files)
+    
+    # 副本的提取规则相同，删除原预设后缓存仍然有效
+    assert config_manager.duplicate_preset("默认预设", "副本")
+    assert config_manager.delete_preset("默认预设")
+    assert cached_fingerprints(config_manager.cache_file) == [fingerprint]
+    
+    assert config_manager.delete_preset("副本")
+    assert cached_fingerprints(config_manager.cache_file) == []
+
+
+def test_invalid_extra_searches_are_rejected(tmp_path):
+    config_manager = ConfigManager(
+        str(tmp_path / "config.json"), str(tmp_path / "cache.db")
+    )
+    valid = {"name": "运费", "column": "D", "keyword": "运费合计"}
+    
+    assert config_manager.add_preset("运费预设", extra_searches=[valid])
+    for invalid in (
+        {"name": "运费", "column": "D4", "keyword": "运费合计"},
+        {"name": "运费", "column": "甲", "keyword": "运费合计"},
+        {"name": "", "column": "D", "keyword": "运费合计"},
+        {"name": "运费", "column": "D"},
+    ):
+        assert not config_manager.add_preset("无效预设", extra_searches=[invalid])
+        assert not config_manager.update_preset("运费预设", extra_searches=[valid, invalid])
+    
+    assert "无效预设" not in config_manager.get_preset_names()
+    assert config_manager.get_preset("运费预设")["extra_searches"] == [valid]
@@ -0,0 +1,32 @@
+"""
+文件夹扫描的测试（主界面、命令行和监视文件夹共用）
+"""
+import os
+
+from file_list import scan_excel_files
+from merge_cli import collect_files
+
+
+def touch(folder, *names):
+    for name in names:
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+
+
+def relative(folder, paths):
+    return [os.path.relpath(path, str(folder)).replace(os.sep, "/") for path in paths]
+
+
+def test_scan_order_and_filters(tmp_path):
+    touch(tmp_path, "b.xlsx", "a.XLS", "~$b.xlsx", "说明.txt",
+          "子目录/c.xlsx", "子目录/下级/d.xls")
+    expected = ["a.XLS", "b.xlsx", "子目录/c.xlsx", "子目录/下级/d.xls"]
+    
+    batches = list(scan_excel_files(str(tmp_path), batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert relative(tmp_path, sum(batches, [])) == expected
+    
+    files, unmatched = collect_files([str(tmp_path), str(tmp_path / "无此目录")])
+    assert relative(tmp_path, files) == expected
+    assert unmatched == [str(tmp_path / "无此目录")]
@@ -0,0 +1,62 @@
+"""
+命令行入口的测试
+"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+# 以 spawn 方式启动子进程（Windows 和 macOS 的默认方式）运行命令行
+SPAWN_MAIN = (
+    "import multiprocessing, sys\n"
+    "multiprocessing.set_start_method('spawn')\n"
+    "import merge_cli\n"
+    "sys.exit(merge_cli.main(sys.argv[1:]))\n"
+)
+
+
+def write_config(path):
+    config = {
+        "presets": {
+            "测试": {
+                "name": "测试",
+                "settlement_search_column": "D",
+                "settlement_search_keyword": "折后总计",
+                "mappings": [{"name": "经销商", "cell": "B2"}],
+            }
+        }
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+
+
+def test_parallel_merge_prints_only_json_on_stdout(tmp_path, bill_factory):
+    for i in range(4):
+        bill_factory(f"bill{i}.xlsx", {"B2": f"经销商{i}"}, amount=100 + i)
+    # 无法读取的文件使子进程打印回退和出错提示
+    (tmp_path / "bad.xlsx").write_text("not a workbook")
+    config_file = tmp_path / "config.json"
+    write_config(config_file)
+    
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONIOENCODING="utf-8")
+    completed = subprocess.run(
+        [
+            sys.executable, "-c", SPAWN_MAIN,
+            "--config", str(config_file),
+            "merge", "-p", "测试", "-o", str(tmp_path / "out.csv"),
+            "-w", "2", "--no-cache", str(tmp_path),
+        ],
+        cwd=str(tmp_path), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        timeout=300
+    )
+    
+    stdout = completed.stdout.decode("utf-8")
+    stats = json.loads(stdout)
+    assert completed.returncode == 1
+    assert stats["workers"] == 2
+    assert stats["success_count"] == 4
+    assert stats["failed_files"] == [str(tmp_path / "bad.xlsx")]
+    assert "失败" in completed.stderr.decode("utf-8")
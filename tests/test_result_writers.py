@@ -0,0 +1,33 @@
+"""
+结果写入器的测试
+"""
+import pytest
+
+from excel_processor import ParquetResultWriter
+
+
+def test_parquet_widens_column_instead_of_dropping_values(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output_file = str(tmp_path / "out.parquet")
+    writer = ParquetResultWriter(output_file, ["文件名", "结算金额"], batch_rows=2)
+    # 第一批全部为数字，第二批出现文字
+    for row in (["a", 100], ["b", 1.5], ["c", "待确认"], ["d", 7]):
+        writer.write_row(row)
+    writer.close()
+    
+    table = pq.read_table(output_file)
+    assert str(table.schema.field("结算金额").type) == "string"
+    assert table.column("结算金额").to_pylist() == ["100", "1.5", "待确认", "7"]
+
+
+def test_parquet_keeps_numeric_column(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output_file = str(tmp_path / "out.parquet")
+    writer = ParquetResultWriter(output_file, ["结算金额"], batch_rows=2)
+    for value in (1, 2.5, None, 4):
+        writer.write_row([value])
+    writer.close()
+    
+    table = pq.read_table(output_file)
+    assert str(table.schema.field("结算金额").type) == "double"
+    assert table.column("结算金额").to_pylist() == [1.0, 2.5, None, 4.0]
@@ -0,0 +1,37 @@
+"""
+运行统计阶段耗时的测试
+"""
+import shutil
+
+from excel_processor import ExcelProcessor
+from run_report import RunReport
+
+
+MAPPINGS = [{"name": "经销商", "cell": "B2"}]
+
+
+def test_merge_records_each_stage(tmp_path, bill_factory):
+    first = bill_factory("甲.xlsx", {"B2": "甲"})
+    bill_factory("乙.xlsx", {"B2": "乙"})
+    shutil.copyfile(first, str(tmp_path / "甲_副本.xlsx"))
+    files = sorted(str(path) for path in tmp_path.glob("*.xlsx"))
+    report = RunReport()
+    
+    result = ExcelProcessor().merge_bills(
+        files, MAPPINGS, str(tmp_path / "out.csv"),
+        duplicate_mode="skip", report=report
+    )
+    
+    assert result["success"], result["message"]
+    assert result["success_count"] == 2
+    assert set(report.stages) == {"查找重复", "提取", "写出", "保存"}
+    assert all(seconds >= 0 for seconds in report.stages.values())
+
+
+def test_merge_without_report(tmp_path, bill_factory):
+    files = [bill_factory("甲.xlsx", {"B2": "甲"})]
+    
+    result = ExcelProcessor().merge_bills(files, MAPPINGS, str(tmp_path / "out.csv"))
+    
+    assert result["success"], result["message"]
+    assert "report" not in result
@@ -0,0 +1,229 @@
+"""
+监视文件夹 - 持续扫描收件文件夹，新账单写入完成后立即提取并追加到滚动输出文件
+"""
+import csv
+import json
+import os
+import time
+
+from excel_processor import DETAILS_KEY, CsvResultWriter, ExcelProcessor
+from file_list import iter_excel_files
+
+
+class FolderWatcher:
+    """
+    按预设监视一个文件夹
+    
+    每次 poll() 扫描一遍文件夹：新出现或修改过的文件要在连续两次扫描中
+    大小和修改时间都不变、且保持至少 settle_seconds 秒，才视为写入完成
+    （避免读到复制到一半的文件）。写入完成的文件只提取一次，结果追加到
+    CSV输出文件末尾，不重新处理已合并的文件。预设有明细区块时，明细行
+    追加到同目录下的 "<输出文件名>_明细.csv"。
+    
+    已处理的文件记录在状态文件中（默认为 "<输出文件>.state.json"），
+    重启后继续。先追加输出再保存状态，异常退出时最后一批文件可能
+    重复追加，但不会丢失。
+    
+    已追加到输出的文件之后被修改（如经销商重新保存了同名账单）时不再
+    追加，避免同一账单的结算金额重复计入：提示一次警告，在状态文件中
+    标为 "changed"，并列在 poll() 返回值的 "changed" 中。需要使用修改后
+    的内容时，应换一个文件名放入文件夹（并自行删除输出中的旧行）。
+    处理失败的文件修改后仍会重新处理。
+    """
+    
+    def __init__(self, folder, preset, output_file, state_file=None,
+                 engine="xml", settle_seconds=2.0, recursive=False, processor=None):
+        """
+        Args:
+            folder: 监视的文件夹
+            preset: CompiledPreset 实例（见 ConfigManager.compile_preset）
+            output_file: 滚动输出文件（.csv）
+            state_file: 状态文件路径，默认为 "<输出文件>.state.json"
+            engine: 读取引擎，见 ExcelProcessor.load_workbook
+            settle_seconds: 文件大小和修改时间保持不变多久后才处理
+            recursive: 是否扫描子文件夹
+            processor: ExcelProcessor 实例，默认新建
+        """
+        if os.path.splitext(output_file)[1].lower() != ".csv":
+            raise ValueError("监视模式只支持追加到CSV输出文件")
+        if not preset.mapping_names:
+            raise ValueError("预设没有配置映射项目")
+        
+        self.folder = folder
+        self.preset = preset
+        self.output_file = output_file
+        self.state_file = state_file or output_file + ".state.json"
+        self.engine = engine
+        self.settle_seconds = settle_seconds
+        self.recursive = recursive
+        self.processor = processor or ExcelProcessor()
+        self.headers = list(preset.headers)
+        self.detail_file = None
+        if preset.detail_headers:
+            root, ext = os.path.splitext(output_file)
+            self.detail_file = f"{root}_明细{ext}"
+            self.detail_headers = ["文件名", "明细"] + list(preset.detail_headers)
+        self.fingerprint = preset.fingerprint
+        # {文件路径: [大小, 修改时间, 状态]}，状态为 "ok"、"error" 或 "changed"
+        # （已追加后被修改，不再处理）
+        self.files = {}
+        # 本轮之前发现的已追加后被修改的文件，由 poll() 取出
+        self.changed = []
+        # 等待写入完成的文件 {文件路径: (大小, 修改时间, 首次看到该状态的时间)}
+        self.pending = {}
+        self._load_state()
+        self._check_output()
+    
+    def _load_state(self):
+        """读取状态文件；预设规则变化后不能继续追加到同一输出文件"""
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("fingerprint") != self.fingerprint:
+            raise ValueError(
+                f"预设的提取规则已修改，与输出文件 {self.output_file} 不一致，请使用新的输出文件"
+            )
+        self.files = state.get("files", {})
+    
+    def _check_output(self):
+        """已有输出文件的表头必须与预设一致"""
+        if not os.path.exists(self.output_file) or os.path.getsize(self.output_file) == 0:
+            return
+        with open(self.output_file, 'r', encoding='utf-8-sig', newline='') as f:
+            headers = next(csv.reader(f), [])
+        if headers != self.headers:
+            raise ValueError(f"输出文件 {self.output_file} 的表头与预设不一致，请使用新的输出文件")
+    
+    def _save_state(self):
+        """写入状态文件（先写临时文件再替换，避免中途退出时损坏）"""
+        state = {
+            "folder": os.path.abspath(self.folder),
+            "output": os.path.abspath(self.output_file),
+            "fingerprint": self.fingerprint,
+            "files": self.files,
+        }
+        temp_file = self.state_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.state_file)
+    
+    def _scan(self):
+        """
+        列出文件夹中的Excel文件
+        
+        Returns:
+            {文件路径: (大小, 修改时间)}
+        """
+        found = {}
+        for entry in iter_excel_files(self.folder, recursive=self.recursive):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            found[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+        return found
+    
+    def ready_files(self, now=None):
+        """
+        扫描一遍文件夹，返回已写入完成、需要处理的文件
+        
+        Returns:
+            [(文件路径, 大小, 修改时间)]，按文件路径排序
+        """
+        if now is None:
+            now = time.monotonic()
+        found = self._scan()
+        
+        ready = []
+        for file_path, (size, mtime) in sorted(found.items()):
+            known = self.files.get(file_path)
+            if known is not None and known[0] == size and known[1] == mtime:
+                continue
+            if known is not None and known[2] in ("ok", "changed"):
+                # 已追加到输出的文件被修改：不再追加，只在第一次修改时提示
+                if known[2] == "ok":
+                    print(f"警告: 文件 {file_path} 在合并后被修改，修改后的内容不会追加到输出")
+                    self.changed.append(file_path)
+                self.files[file_path] = [size, mtime, "changed"]
+                self.pending.pop(file_path, None)
+                continue
+            
+            waiting = self.pending.get(file_path)
+            if waiting is None or waiting[:2] != (size, mtime):
+                # 新文件或仍在写入，重新开始计时
+                self.pending[file_path] = (size, mtime, now)
+            elif now - waiting[2] >= self.settle_seconds:
+                ready.append((file_path, size, mtime))
+        
+        # 已删除的文件不再等待
+        for file_path in list(self.pending):
+            if file_path not in found:
+                del self.pending[file_path]
+        return ready
+    
+    def poll(self, now=None):
+        """
+        处理一轮：提取写入完成的文件并追加到输出
+        
+        Returns:
+            {"added": [文件路径], "failed": [文件路径],
+             "changed": [已追加后被修改、本次跳过的文件路径]}
+        """
+        ready = self.ready_files(now)
+        result = {"added": [], "failed": [], "changed": self.changed}
+        self.changed = []
+        if not ready:
+            if result["changed"]:
+                self._save_state()
+            return result
+        
+        writer = CsvResultWriter(self.output_file, self.headers, append=True)
+        detail_writer = None
+        if self.detail_file is not None:
+            detail_writer = CsvResultWriter(self.detail_file, self.detail_headers, append=True)
+        try:
+            for file_path, size, mtime in ready:
+                try:
+                    data = self.processor.extract_compiled(file_path, self.preset, self.engine)
+                except Exception as e:
+                    print(f"处理文件 {file_path} 时出错: {e}")
+                    data = None
+                
+                del self.pending[file_path]
+                if data:
+                    writer.write_row([data.get(header) for header in self.headers])
+                    if detail_writer is not None:
+                        for detail in data.get(DETAILS_KEY) or ():
+                            detail_writer.write_row([data["文件名"]] + detail)
+                    self.files[file_path] = [size, mtime, "ok"]
+                    result["added"].append(file_path)
+                else:
+                    # 失败的文件在内容变化前不再重试
+                    self.files[file_path] = [size, mtime, "error"]
+                    result["failed"].append(file_path)
+        finally:
+            writer.close()
+            if detail_writer is not None:
+                detail_writer.close()
+            self._save_state()
+        return result
+    
+    def run(self, interval=2.0, stop_event=None, callback=None):
+        """
+        持续监视，直到 stop_event 被设置（或 KeyboardInterrupt）
+        
+        Args:
+            interval: 两次扫描之间的间隔秒数
+            stop_event: threading.Event，设置后停止
+            callback: 每轮有文件被处理（或跳过修改过的文件）时调用，参数为
+                poll() 的返回值
+        """
+        while stop_event is None or not stop_event.is_set():
+            result = self.poll()
+            if callback is not None and any(result.values()):
+                callback(result)
+            if stop_event is not None:
+                stop_event.wait(interval)
+            else:
+                time.sleep(interval)